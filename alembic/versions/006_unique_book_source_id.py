@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Уникальный индекс books (source, source_id) для пакетного upsert книг
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers
+revision = '006_unique_book_source_id'
+down_revision = '005_change_telegram_id_to_bigint'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    """Удаляем дубликаты книг и делаем индекс (source, source_id) уникальным"""
+    # Подписки и уведомления дубликатов переводим на самую раннюю запись книги
+    op.execute("""
+        WITH keep AS (
+            SELECT id, MIN(id) OVER (PARTITION BY source, source_id) AS keep_id
+            FROM books
+        )
+        UPDATE alerts SET book_id = keep.keep_id
+        FROM keep
+        WHERE alerts.book_id = keep.id AND keep.id <> keep.keep_id
+    """)
+    op.execute("""
+        WITH keep AS (
+            SELECT id, MIN(id) OVER (PARTITION BY source, source_id) AS keep_id
+            FROM books
+        )
+        UPDATE notifications SET book_id = keep.keep_id
+        FROM keep
+        WHERE notifications.book_id = keep.id AND keep.id <> keep.keep_id
+    """)
+    op.execute("""
+        DELETE FROM books b
+        USING books older
+        WHERE b.source = older.source
+          AND b.source_id = older.source_id
+          AND b.id > older.id
+    """)
+
+    # Индекс мог быть создан как обычный (create_all) или уже быть ограничением UNIQUE
+    op.execute("""
+        DO $$
+        BEGIN
+            IF NOT EXISTS (
+                SELECT 1 FROM pg_constraint WHERE conname = 'books_source_source_id_key'
+            ) THEN
+                DROP INDEX IF EXISTS books_source_source_id_key;
+                CREATE UNIQUE INDEX books_source_source_id_key ON books (source, source_id);
+            END IF;
+        END
+        $$;
+    """)
+
+
+def downgrade():
+    """Возвращаем обычный индекс"""
+    op.execute("""
+        DO $$
+        BEGIN
+            IF NOT EXISTS (
+                SELECT 1 FROM pg_constraint WHERE conname = 'books_source_source_id_key'
+            ) THEN
+                DROP INDEX IF EXISTS books_source_source_id_key;
+                CREATE INDEX books_source_source_id_key ON books (source, source_id);
+            END IF;
+        END
+        $$;
+    """)
@@ -0,0 +1,44 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Полнотекстовый и триграммный поиск книг
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers
+revision = '007_book_search_indexes'
+down_revision = '006_unique_book_source_id'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    """Добавляем поисковый вектор и GIN индексы"""
+    op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+
+    # Выражение совпадает с models.book.SEARCH_VECTOR_EXPRESSION
+    op.execute("""
+        ALTER TABLE books
+        ADD COLUMN IF NOT EXISTS search_vector tsvector
+        GENERATED ALWAYS AS (
+            setweight(to_tsvector('russian', coalesce(title, '')), 'A') ||
+            setweight(to_tsvector('simple', coalesce(title, '')), 'A') ||
+            setweight(to_tsvector('russian', coalesce(author, '')), 'B') ||
+            setweight(to_tsvector('simple', coalesce(author, '')), 'B') ||
+            setweight(to_tsvector('russian', coalesce(publisher, '')), 'C')
+        ) STORED
+    """)
+
+    op.execute("CREATE INDEX IF NOT EXISTS idx_book_search_vector ON books USING gin (search_vector)")
+    op.execute("CREATE INDEX IF NOT EXISTS idx_book_title_trgm ON books USING gin (title gin_trgm_ops)")
+    op.execute("CREATE INDEX IF NOT EXISTS idx_book_author_trgm ON books USING gin (author gin_trgm_ops)")
+
+
+def downgrade():
+    """Удаляем поисковый вектор и GIN индексы"""
+    op.execute("DROP INDEX IF EXISTS idx_book_author_trgm")
+    op.execute("DROP INDEX IF EXISTS idx_book_title_trgm")
+    op.execute("DROP INDEX IF EXISTS idx_book_search_vector")
+    op.drop_column('books', 'search_vector')
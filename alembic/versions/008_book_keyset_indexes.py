@@ -0,0 +1,28 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Индексы для курсорной пагинации книг
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers
+revision = '008_book_keyset_indexes'
+down_revision = '007_book_search_indexes'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    """Добавляем индексы (ключ сортировки, id)"""
+    op.execute("CREATE INDEX IF NOT EXISTS idx_book_price_id ON books (current_price, id)")
+    op.execute("CREATE INDEX IF NOT EXISTS idx_book_parsed_at_id ON books (parsed_at DESC NULLS LAST, id DESC)")
+    op.execute("CREATE INDEX IF NOT EXISTS idx_book_discount_id ON books (discount_percent DESC NULLS LAST, id DESC)")
+
+
+def downgrade():
+    """Удаляем индексы курсорной пагинации"""
+    op.execute("DROP INDEX IF EXISTS idx_book_discount_id")
+    op.execute("DROP INDEX IF EXISTS idx_book_parsed_at_id")
+    op.execute("DROP INDEX IF EXISTS idx_book_price_id")
@@ -0,0 +1,54 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+История цен книг (секционированная по месяцам таблица book_prices)
+"""
+
+from datetime import datetime
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers
+revision = '009_book_price_history'
+down_revision = '008_book_keyset_indexes'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    """Создаём таблицу истории цен и заполняем её текущими ценами"""
+    op.execute("""
+        CREATE TABLE IF NOT EXISTS book_prices (
+            book_id INTEGER NOT NULL REFERENCES books(id) ON DELETE CASCADE,
+            ts TIMESTAMP WITHOUT TIME ZONE NOT NULL,
+            price NUMERIC(10, 2) NOT NULL,
+            original_price NUMERIC(10, 2),
+            discount SMALLINT,
+            PRIMARY KEY (book_id, ts)
+        ) PARTITION BY RANGE (ts)
+    """)
+    op.execute("CREATE INDEX IF NOT EXISTS idx_book_prices_ts_brin ON book_prices USING brin (ts)")
+
+    # Секция текущего месяца, следующие создаёт services/price_history.py
+    now = datetime.now()
+    start = datetime(now.year, now.month, 1)
+    end = datetime(start.year + start.month // 12, start.month % 12 + 1, 1)
+    op.execute(
+        f"CREATE TABLE IF NOT EXISTS book_prices_{start:%Y_%m} PARTITION OF book_prices "
+        f"FOR VALUES FROM ('{start:%Y-%m-%d}') TO ('{end:%Y-%m-%d}')"
+    )
+
+    # Начальная точка истории - текущая цена каждой книги
+    op.execute(f"""
+        INSERT INTO book_prices (book_id, ts, price, original_price, discount)
+        SELECT id, TIMESTAMP '{now:%Y-%m-%d %H:%M:%S}', current_price, original_price, discount_percent
+        FROM books
+        WHERE current_price IS NOT NULL
+        ON CONFLICT DO NOTHING
+    """)
+
+
+def downgrade():
+    """Удаляем историю цен вместе с секциями"""
+    op.execute("DROP TABLE IF EXISTS book_prices CASCADE")
@@ -0,0 +1,30 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Отпечаток данных книги и время последнего появления в выдаче парсера
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers
+revision = '010_book_content_hash'
+down_revision = '009_book_price_history'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    """Добавляем content_hash и last_seen_at"""
+    op.add_column('books', sa.Column('last_seen_at', sa.DateTime(), nullable=True,
+                                     comment='Когда книга последний раз встречалась парсеру'))
+    op.add_column('books', sa.Column('content_hash', sa.String(length=32), nullable=True,
+                                     comment='Отпечаток данных книги'))
+    # content_hash заполнится при следующем сохранении книги
+    op.execute("UPDATE books SET last_seen_at = parsed_at")
+
+
+def downgrade():
+    """Удаляем content_hash и last_seen_at"""
+    op.drop_column('books', 'content_hash')
+    op.drop_column('books', 'last_seen_at')
@@ -0,0 +1,40 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Индексы курсорной пагинации по ключу coalesce(колонка, значение для NULL)
+
+Сравнение кортежей (ключ, id) < (курсор) читает индекс с позиции курсора
+только для ключа без NULL: сортировки по дате парсинга и скидке используют
+coalesce (services/book_search.py, KEYSET_ORDERS).
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers
+revision = '011_book_keyset_null_keys'
+down_revision = '010_book_content_hash'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    """Пересоздаём индексы по выражению coalesce"""
+    op.execute("DROP INDEX IF EXISTS idx_book_parsed_at_id")
+    op.execute("DROP INDEX IF EXISTS idx_book_discount_id")
+    op.execute(
+        "CREATE INDEX IF NOT EXISTS idx_book_parsed_at_id "
+        "ON books ((coalesce(parsed_at, '-infinity'::timestamp)) DESC, id DESC)"
+    )
+    op.execute(
+        "CREATE INDEX IF NOT EXISTS idx_book_discount_id "
+        "ON books ((coalesce(discount_percent, -1)) DESC, id DESC)"
+    )
+
+
+def downgrade():
+    """Возвращаем индексы по колонкам (NULLS LAST)"""
+    op.execute("DROP INDEX IF EXISTS idx_book_discount_id")
+    op.execute("DROP INDEX IF EXISTS idx_book_parsed_at_id")
+    op.execute("CREATE INDEX IF NOT EXISTS idx_book_parsed_at_id ON books (parsed_at DESC NULLS LAST, id DESC)")
+    op.execute("CREATE INDEX IF NOT EXISTS idx_book_discount_id ON books (discount_percent DESC NULLS LAST, id DESC)")
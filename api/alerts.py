@@ -9,6 +9,7 @@ from models.alert import Alert
 from models.notification import Notification
 from models.book import Book
 from services.logger import api_logger as logger
+from services.alert_index import publish_alert_changes
 
 router = APIRouter()
 
@@ -200,6 +201,7 @@ async def create_alert(
         # Обновляем счетчик подписок пользователя
         user.total_alerts = (user.total_alerts or 0) + 1
         await db.commit()
+        await publish_alert_changes([new_alert.id])
         
         logger.info(f"Создана новая подписка: {new_alert.book_title}")
 
@@ -259,6 +261,7 @@ async def update_alert(
         alert.updated_at = datetime.utcnow()
         
         await db.commit()
+        await publish_alert_changes([alert_id])
         
         logger.info(f"Обновлена подписка: {alert.book_title}")
         
@@ -314,6 +317,7 @@ async def delete_alert(
             user.total_alerts = max(0, (user.total_alerts or 0) - 1)
 
         await db.commit()
+        await publish_alert_changes([alert_id])
         
         logger.info(f"Подписка полностью удалена: {alert.book_title}")
 
@@ -412,6 +416,7 @@ async def create_alert_from_book(
         # Обновляем счетчик подписок пользователя
         user.total_alerts = (user.total_alerts or 0) + 1
         await db.commit()
+        await publish_alert_changes([new_alert.id])
         
         logger.info(f"Создана подписка на книгу '{book.title}' с целевой ценой {target_price}₽")
 
@@ -449,6 +454,7 @@ async def toggle_alert(
         alert.updated_at = datetime.utcnow()
         
         await db.commit()
+        await publish_alert_changes([alert_id])
         
         status = "активирована" if alert.is_active else "деактивирована"
         logger.info(f"Подписка {status}: {alert.book_title}")
@@ -596,6 +602,7 @@ async def update_user_alert_for_book(
         alert.updated_at = datetime.utcnow()
         
         await db.commit()
+        await publish_alert_changes([alert.id])
         
         logger.info(f"Обновлена подписка на книгу '{alert.book_title}'")
         
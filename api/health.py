@@ -40,10 +40,8 @@ async def health_check() -> Dict[str, Any]:
     
     # Проверка Redis (опционально)
     try:
-        import redis.asyncio as redis
-        redis_client = redis.from_url("redis://redis:6379/0")
-        await redis_client.ping()
-        await redis_client.close()
+        from services.redis_client import get_async_redis
+        await get_async_redis().ping()
         health_status["components"]["redis"] = {
             "status": "healthy", 
             "message": "Подключение к Redis активно"
@@ -156,10 +154,8 @@ async def readiness_check() -> Dict[str, str]:
             
         # Redis проверка опциональна
         try:
-            import redis.asyncio as redis
-            redis_client = redis.from_url("redis://redis:6379/0")
-            await redis_client.ping()
-            await redis_client.close()
+            from services.redis_client import get_async_redis
+            await get_async_redis().ping()
         except ImportError:
             pass  # Redis не критичен для запуска
             
@@ -1,15 +1,19 @@
 from fastapi import APIRouter, HTTPException, Depends, Query
+from fastapi.responses import StreamingResponse
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
-from sqlalchemy import select, func, or_
+from sqlalchemy import select
 from typing import Optional, List
 from celery.result import AsyncResult
+import os
 import uuid
-import string
-import re
+import json
+import asyncio
 
 from database.config import get_db, get_sync_db
-from services.celery_tasks import parse_books
+from services.parse_flight import start_parse
+from services import book_search
+from services import price_history
 from services.logger import logger
 from api.request_limits import RequestLimitChecker
 from models.book import Book
@@ -19,18 +23,8 @@ router = APIRouter()
 
 __all__ = ["router"]
 
-def clean_search_words(text: str) -> List[str]:
-    """
-    Очищает текст от знаков пунктуации и разбивает на слова.
-    """
-    # Заменяем запятые, точки и другие разделители на пробелы
-    text = re.sub(r'[,\.\!\?\:\;\-\—\(\)\[\]\{\}<>]', ' ', text)
-    # Разбиваем на слова и очищаем каждый
-    words = text.lower().split()
-    # Удаляем оставшиеся знаки пунктуации из слов
-    cleaned_words = [word.strip(string.punctuation) for word in words]
-    # Убираем пустые строки
-    return [word for word in cleaned_words if word.strip()]
+# Страниц выдачи при подробном поиске (force_parse); обычный поиск - одна страница
+DEEP_SEARCH_PAGES = int(os.getenv("DEEP_SEARCH_PAGES", "3"))
 
 
 def check_request_limit(sync_db: Session, telegram_id: int) -> tuple[bool, Optional[User], str]:
@@ -65,35 +59,14 @@ async def search_books_in_db(query: str, db: AsyncSession, sources: List[str] =
     Returns:
         tuple: (books_list: List[dict], total: int)
     """
-    search_words = clean_search_words(query)
-    stop_words = {"и", "в", "на", "с", "от", "до", "по", "о", "об", "а", "но", "или"}
-    search_words = [word for word in search_words if word.strip() and word not in stop_words]
-    
-    if search_words:
-        word_conditions = []
-        for word in search_words:
-            word_conditions.append(
-                or_(
-                    func.lower(Book.title).like(f"%{word}%"),
-                    func.lower(Book.author).like(f"%{word}%")
-                )
-            )
-        db_query = select(Book).where(or_(*word_conditions))
-    else:
-        db_query = select(Book)
-            
-    # Фильтр по источникам
-    if sources:
-        db_query = db_query.where(Book.source.in_(sources))
-            
-    # Подсчёт общего количества
-    count_result = await db.execute(select(func.count()).select_from(db_query.subquery()))
-    total = count_result.scalar() or 0
-    
-    # Получаем книги
-    db_query = db_query.order_by(Book.current_price.asc()).limit(limit)
-    result = await db.execute(db_query)
-    books = result.scalars().all()
+    # Книги и общее количество одним запросом, сначала дешёвые
+    books, total = await book_search.search_books(
+        db,
+        query=query,
+        sources=sources,
+        order=book_search.ORDER_PRICE,
+        limit=limit,
+    )
     
     books_list = []
     for book in books:
@@ -102,6 +75,42 @@ async def search_books_in_db(query: str, db: AsyncSession, sources: List[str] =
     
     return books_list, total
 
+
+async def search_books_in_cache(query: str, db: AsyncSession, sources: List[str]) -> Optional[tuple[List[dict], List[str]]]:
+    """
+    Ищет выдачу по запросу в кэше результатов поиска (первая страница каждого источника).
+    
+    Книги из кэша сопоставляются с записями в базе по (source, source_id),
+    чтобы у карточек были id.
+    
+    Returns:
+        tuple: (books_list: List[dict], stale_sources: List[str]) или None,
+        если хотя бы для одного источника в кэше нет выдачи
+    """
+    from services.search_cache import get_cached_page
+    
+    books_list = []
+    stale_sources = []
+    
+    for src in sources:
+        cached = await get_cached_page(src, query, 1)
+        if cached is None:
+            return None
+        if not cached.fresh:
+            stale_sources.append(src)
+        
+        source_ids = [book.source_id for book in cached.books]
+        result = await db.execute(
+            select(Book).where(Book.source == src, Book.source_id.in_(source_ids))
+        )
+        db_books = {book.source_id: book for book in result.scalars().all()}
+        if not db_books:
+            return None
+        
+        books_list.extend(db_books[source_id].to_dict() for source_id in source_ids if source_id in db_books)
+    
+    return books_list, stale_sources
+
 @router.post("/parse")
 async def parse_books_on_demand(
     query: str = Query(..., description="Поисковый запрос"),
@@ -111,13 +120,11 @@ async def parse_books_on_demand(
     """Запуск парсинга книг по запросу в реальном времени"""
     
     try:
-        # Запускаем фоновую задачу парсинга
-        task = parse_books.delay(query, source)
-        
-        logger.info(f"Запущен парсинг для запроса: '{query}' (task_id: {task.id})")
+        # Запускаем фоновую задачу парсинга (или подключаемся к такой же запущенной)
+        task_id, _ = await start_parse(query, source)
         
         return {
-            "task_id": task.id,
+            "task_id": task_id,
             "status": "started",
             "message": f"Парсинг запущен для запроса: '{query}'",
             "query": query,
@@ -195,61 +202,66 @@ async def parse_books_from_body(
         should_parse = total == 0 or force_parse
         
         if should_parse:
-            # Проверяем, не запущен ли уже парсинг для этого запроса (дедупликация)
-            # НО: если force_parse=true (подробный поиск) - всегда запускаем новый парсинг
-            import redis
-            import os
-            redis_url = os.getenv("REDIS_URL", "redis://localhost:6379/0")
-            redis_password = os.getenv("REDIS_PASSWORD")
-            
-            parse_already_running = False
-            # Для подробного поиска (force_parse) не проверяем запущенный парсинг
-            if not force_parse and redis_url and redis_password:
-                try:
-                    import re
-                    redis_pattern = r'redis://:(?P<password>[^@]+)@(?P<host>[^:]+):(?P<port>\d+)/\d+'
-                    match = re.match(redis_pattern, redis_url)
-                    if not match:
-                        host = redis_url.split("://")[1].split(":")[0]
-                        port = redis_url.split(":")[-1].split("/")[0]
-                        redis_url = f"redis://:{redis_password}@{host}:{port}/0"
-                    
-                    redis_client = redis.from_url(redis_url, decode_responses=True)
-                    parse_lock_key = f"parse_lock:{query.lower().strip()}"
-                    
-                    if redis_client.exists(parse_lock_key):
-                        parse_already_running = True
-                        logger.info(f"Парсинг для '{query}' уже запущен, пропускаем")
-                    else:
-                        redis_client.setex(parse_lock_key, 300, "1")
-                    
-                    redis_client.close()
-                except Exception as e:
-                    logger.warning(f"Ошибка проверки Redis: {e}")
-            
-            if not parse_already_running:
-                # Запускаем фоновую задачу парсинга для каждого источника
-                # max_pages=1 означает парсить только первую страницу (25 книг)
-                task_ids = []
-                for src in sources:
-                    task = parse_books.delay(query=query, source=src, fetch_details=fetch_details, max_pages=1)
-                    task_ids.append({"source": src, "task_id": task.id})
-                    logger.info(f"Запущен парсинг для '{query}' из '{src}' (task_id: {task.id})")
+            # Выдача по запросу уже есть в кэше - отдаём сразу, без парсинга.
+            # Устаревшие источники обновляются в фоне (одна задача на все запросы).
+            # Подробный поиск (force_parse) всегда запускает новый парсинг
+            cached_result = None
+            if not force_parse:
+                cached_result = await search_books_in_cache(query, db, sources)
+            if cached_result:
+                from services.search_cache import acquire_revalidation
+                
+                cached_books, stale_sources = cached_result
+                for src in stale_sources:
+                    if await acquire_revalidation(src, query):
+                        # Обновление кэша парсит, даже если книги уже есть в базе
+                        task_id, _ = await start_parse(
+                            query, src, fetch_details=fetch_details, max_pages=1, force=True
+                        )
+                        logger.info(f"Кэш '{query}' из '{src}' устарел, обновляем в фоне (task_id: {task_id})")
                 
-                # Когда запускается парсинг - НЕ возвращаем книги из базы (они устареют после парсинга)
-                # Фронтенд будет ждать завершения парсинга и загрузит свежие данные
+                logger.info(f"Выдача для '{query}' из кэша ({len(cached_books)} шт.)")
                 return {
-                    "tasks": task_ids,
-                    "status": "started",
-                    "message": f"Парсинг запущен для источников: {', '.join(sources)}",
+                    "task_id": None,
+                    "status": "found_in_cache",
+                    "message": f"Найдено {len(cached_books)} книг",
                     "query": query,
                     "sources": sources,
-                    "fetch_details": fetch_details,
-                    "books": [],  # Не возвращаем старые книги - дождёмся парсинга
-                    "total": 0,
-                    "found_in_db": False,
-                    "parsed": True
+                    "books": cached_books,
+                    "total": len(cached_books),
+                    "found_in_db": True,
+                    "parsed": False,
+                    "revalidating": stale_sources
                 }
+            
+            # Запускаем фоновую задачу парсинга для каждого источника.
+            # Если такой же парсинг уже выполняется (в т.ч. для другого пользователя),
+            # подключаемся к нему: тот же task_id и тот же поток книг.
+            # Обычный поиск - первая страница (25 книг), подробный - DEEP_SEARCH_PAGES
+            # страниц (загружаются параллельно)
+            max_pages = DEEP_SEARCH_PAGES if force_parse else 1
+            task_ids = []
+            for src in sources:
+                task_id, _ = await start_parse(
+                    query, src, fetch_details=fetch_details, max_pages=max_pages, force=force_parse
+                )
+                task_ids.append({"source": src, "task_id": task_id})
+            
+            # Когда запускается парсинг - НЕ возвращаем книги из базы (они устареют после парсинга)
+            # Фронтенд получает книги потоком по stream_url по мере загрузки страниц
+            return {
+                "tasks": task_ids,
+                "stream_url": f"/api/parser/stream?task_ids={','.join(t['task_id'] for t in task_ids)}",
+                "status": "started",
+                "message": f"Парсинг запущен для источников: {', '.join(sources)}",
+                "query": query,
+                "sources": sources,
+                "fetch_details": fetch_details,
+                "books": [],  # Книги придут потоком
+                "total": 0,
+                "found_in_db": False,
+                "parsed": True
+            }
         
         # Книги уже есть в базе - не запускаем парсинг
         logger.info(f"Книги уже есть в базе ({total} шт.). Парсинг не требуется.")
@@ -327,6 +339,80 @@ async def get_parse_status(
         logger.error(f"Ошибка проверки статуса задачи: {e}")
         raise HTTPException(status_code=500, detail=f"Ошибка проверки статуса: {str(e)}")
 
+def _finished_task_result(task_id: str) -> Optional[dict]:
+    """
+    Итог завершённой задачи из result backend (None - задача не завершена)
+
+    AsyncResult обращается к Redis синхронно: вызывается в потоке, не в event loop
+    """
+    task = AsyncResult(task_id)
+    if not task.ready():
+        return None
+    return task.result if isinstance(task.result, dict) else {"message": str(task.result)}
+
+
+def _format_sse(event: str, data: dict) -> str:
+    """Форматирование события Server-Sent Events"""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False, default=str)}\n\n"
+
+
+@router.get("/stream")
+async def stream_parse_results(
+    task_ids: str = Query(..., description="ID задач парсинга через запятую")
+):
+    """
+    Потоковая выдача книг по мере парсинга (Server-Sent Events)
+    
+    События:
+    - books: порция книг (формат Book.to_dict()) после каждой загруженной страницы
+    - done: задача завершена (result - итог parse_books)
+    - end: все задачи завершены, поток закрывается
+    """
+    from services.parse_stream import iter_parse_events, stream_exists
+    
+    ids = [task_id.strip() for task_id in task_ids.split(",") if task_id.strip()]
+    if not ids:
+        raise HTTPException(status_code=400, detail="Не переданы task_ids")
+    if len(ids) > 10:
+        raise HTTPException(status_code=400, detail="Слишком много задач (максимум 10)")
+    
+    async def event_source():
+        done = set()
+        yield "retry: 3000\n\n"
+        
+        async for event in iter_parse_events(ids):
+            if event is None:
+                # Событий нет: задача могла завершиться без потока (например, упала до старта)
+                for task_id in ids:
+                    if task_id in done:
+                        continue
+                    result = await asyncio.to_thread(_finished_task_result, task_id)
+                    if result is not None and not await stream_exists(task_id):
+                        done.add(task_id)
+                        yield _format_sse("done", {"type": "done", "task_id": task_id, "result": result})
+                if len(done) == len(ids):
+                    break
+                yield ": keep-alive\n\n"
+                continue
+            
+            if event.get("type") == "done":
+                done.add(event.get("task_id"))
+            yield _format_sse(event.get("type", "message"), event)
+            
+            if len(done) == len(ids):
+                break
+        
+        yield _format_sse("end", {"task_ids": ids, "completed": list(done)})
+    
+    return StreamingResponse(
+        event_source(),
+        media_type="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            "X-Accel-Buffering": "no"  # Отключаем буферизацию в nginx
+        }
+    )
+
 @router.post("/search")
 async def search_books_with_parsing(
     query: str = Query(..., description="Поисковый запрос"),
@@ -337,42 +423,19 @@ async def search_books_with_parsing(
     """Поиск книг с автоматическим парсингом новых результатов"""
     
     try:
-        # Сначала ищем в базе данных
-        from sqlalchemy import select, func, and_, or_
-        from models import Book
-        
-        # Улучшенный поиск: разбиваем запрос на слова и очищаем от пунктуации
-        search_words = clean_search_words(query)
-        
-        # Фильтруем предлоги и союзы
-        stop_words = {"и", "в", "на", "с", "от", "до", "по", "о", "об", "а", "но", "или"}
-        search_words = [word for word in search_words if word.strip() and word not in stop_words]
-        
-        if search_words:
-            # Создаем условия для каждого слова
-            word_conditions = []
-            for word in search_words:
-                word_conditions.append(
-                    or_(
-                        func.lower(Book.title).like(f"%{word}%"),
-                        func.lower(Book.author).like(f"%{word}%")
-                    )
-                )
-            
-            # Применяем логику ИЛИ - слово найдено в любом поле
-            db_query = select(Book).where(or_(*word_conditions))
-        else:
-            db_query = select(Book)
-            
-        db_query = db_query.order_by(Book.parsed_at.desc()).limit(20)
-        
-        db_result = await db.execute(db_query)
-        db_books = db_result.scalars().all()
+        # Сначала ищем в базе данных, самые релевантные первыми
+        db_books, _ = await book_search.search_books(
+            db,
+            query=query,
+            order=book_search.ORDER_RELEVANCE,
+            limit=20,
+            with_total=False,
+        )
         
         # Запускаем парсинг в фоне с использованием ключевых слов
-        parse_task = parse_books.delay(query=query, source=source)
+        parse_task_id, _ = await start_parse(query, source)
         
-        logger.info(f"Запущен поиск с парсингом для: '{query}' (task_id: {parse_task.id})")
+        logger.info(f"Запущен поиск с парсингом для: '{query}' (task_id: {parse_task_id})")
         
         # Возвращаем результат с информацией о фоновом парсинге
         return {
@@ -393,7 +456,7 @@ async def search_books_with_parsing(
                 }
                 for book in db_books
             ],
-            "parse_task_id": parse_task.id,
+            "parse_task_id": parse_task_id,
             "parse_status": "started",
             "message": f"Найдено {len(db_books)} книг в базе. Запущен поиск новых книг...",
             "total_db_books": len(db_books)
@@ -412,38 +475,20 @@ async def get_books_by_query(
     """Получение книг по конкретному поисковому запросу для динамического добавления"""
     
     try:
-        from sqlalchemy import select, func, or_
-        from models.book import Book
-        
         # Декодируем URL-кодированный запрос
         import urllib.parse
         decoded_query = urllib.parse.unquote(query)
         
         logger.info(f"Searching for books with query: '{decoded_query}' (original: '{query}')")
         
-        # Улучшенный поиск: ищем по всем словам из запроса и очищаем от пунктуации
-        search_terms = clean_search_words(decoded_query)
-        
-        # Создаем условия поиска для каждого слова
-        search_conditions = []
-        for term in search_terms:
-            if term.strip():  # Игнорируем пустые слова
-                search_conditions.extend([
-                    func.lower(Book.title).like(f"%{term.strip()}%"),
-                    func.lower(Book.author).like(f"%{term.strip()}%")
-                ])
-        
-        # Если есть условия поиска, применяем их
-        if search_conditions:
-            search_query = select(Book).where(
-                or_(*search_conditions)
-            ).order_by(Book.parsed_at.desc()).limit(50)
-        else:
-            # Если запрос пустой, возвращаем последние книги
-            search_query = select(Book).order_by(Book.parsed_at.desc()).limit(50)
-        
-        result = await db.execute(search_query)
-        books = result.scalars().all()
+        # Самые релевантные книги; если запрос пустой - последние книги
+        books, _ = await book_search.search_books(
+            db,
+            query=decoded_query,
+            order=book_search.ORDER_RELEVANCE,
+            limit=50,
+            with_total=False,
+        )
         
         # Преобразуем в словари используя метод to_dict()
         books_list = []
@@ -519,3 +564,36 @@ async def get_book_by_id(
     except Exception as e:
         logger.error(f"Ошибка получения книги {book_id}: {e}")
         raise HTTPException(status_code=500, detail=f"Ошибка получения книги: {str(e)}")
+
+
+@router.get("/book/{book_id}/prices")
+async def get_book_prices(
+    book_id: int,
+    days: int = Query(30, ge=1, le=365, description="Окно статистики в днях"),
+    db: AsyncSession = Depends(get_db)
+):
+    """История цены книги и статистика за последние days дней"""
+    
+    try:
+        book = await db.get(Book, book_id)
+        if not book:
+            raise HTTPException(status_code=404, detail="Книга не найдена")
+        
+        history = await price_history.get_price_history(db, book_id, days)
+        stats = await price_history.get_price_stats(db, [book_id], days)
+        lowest = await price_history.get_lowest_in_days(db, [book_id], days)
+        
+        return {
+            "success": True,
+            "book_id": book_id,
+            "days": days,
+            "history": history,
+            "stats": stats.get(book_id),
+            "lowest_in_days": lowest.get(book_id, False)
+        }
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Ошибка получения истории цен книги {book_id}: {e}")
+        raise HTTPException(status_code=500, detail=f"Ошибка получения истории цен: {str(e)}")
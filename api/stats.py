@@ -89,9 +89,10 @@ async def get_stats(db: AsyncSession = Depends(get_db)) -> Dict[str, Any]:
     """Получение общей статистики системы"""
     
     try:
-        # Статистика по книгам
+        # Статистика по книгам: встречавшиеся парсеру за 30 дней (parsed_at
+        # меняется только при изменении данных книги)
         books_result = await db.execute(
-            select(func.count(Book.id)).where(Book.parsed_at >= datetime.now() - timedelta(days=30))
+            select(func.count(Book.id)).where(Book.last_seen_at >= datetime.now() - timedelta(days=30))
         )
         books_last_30_days = books_result.scalar() or 0
         
@@ -196,10 +197,10 @@ async def get_books_stats(db: AsyncSession = Depends(get_db)) -> Dict[str, Any]:
         )
         top_stores = dict(top_stores_result.all())
         
-        # Книги, добавленные за последние 7 дней
+        # Книги, встречавшиеся парсеру за последние 7 дней
         recent_result = await db.execute(
             select(func.count(Book.id)).where(
-                Book.parsed_at >= datetime.now() - timedelta(days=7)
+                Book.last_seen_at >= datetime.now() - timedelta(days=7)
             )
         )
         recent_books = recent_result.scalar() or 0
@@ -388,3 +389,19 @@ async def get_parsing_stats(db: AsyncSession = Depends(get_db)) -> Dict[str, Any
     except Exception as e:
         logger.error(f"Ошибка получения статистики парсинга: {e}")
         raise HTTPException(status_code=500, detail="Ошибка получения статистики парсинга")
+
+
+@router.get("/rate-limits")
+async def get_rate_limits_stats() -> Dict[str, Any]:
+    """Статистика лимитеров запросов к магазинам (ожидание, 429)"""
+    
+    try:
+        from services.rate_limiter import get_rate_limit_stats
+        
+        return {
+            "limiters": await get_rate_limit_stats()
+        }
+        
+    except Exception as e:
+        logger.error(f"Ошибка получения статистики лимитеров: {e}")
+        raise HTTPException(status_code=500, detail="Ошибка получения статистики лимитеров")
@@ -33,6 +33,10 @@ if "@" in DATABASE_URL:
 
 print(f"Using database: {safe_db_url}")
 
+# Пул соединений асинхронного движка (асинхронному воркеру Celery нужно больше)
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+
 # Глобальные переменные для движка и сессии
 _engine = None
 _AsyncSessionLocal = None
@@ -48,6 +52,8 @@ def get_engine():
             echo=False,  # Отключаем логирование для продакшена
             pool_pre_ping=True,
             pool_recycle=3600,
+            pool_size=DB_POOL_SIZE,
+            max_overflow=DB_MAX_OVERFLOW,
         )
     return _engine
 
@@ -65,13 +71,25 @@ def get_sync_engine():
 
 def get_session_factory():
     """Получение или создание фабрики асинхронных сессий"""
-    # Всегда создаём новую фабрику, чтобы избежать проблем с event loop в Celery
-    engine = get_engine()
-    return sessionmaker(
-        engine,
-        class_=AsyncSession,
-        expire_on_commit=False
-    )
+    # Пул движка привязан к event loop: воркер Celery выполняет задачи в одном
+    # цикле процесса (services/worker_runtime.py)
+    global _AsyncSessionLocal
+    if _AsyncSessionLocal is None:
+        engine = get_engine()
+        _AsyncSessionLocal = sessionmaker(
+            engine,
+            class_=AsyncSession,
+            expire_on_commit=False
+        )
+    return _AsyncSessionLocal
+
+def reset_engine_after_fork():
+    """Отказ от соединений, унаследованных от родительского процесса (prefork)"""
+    if _engine is not None:
+        # close=False: сокеты принадлежат родителю, закрывать их нельзя
+        _engine.sync_engine.dispose(close=False)
+    if _sync_engine is not None:
+        _sync_engine.dispose(close=False)
 
 def get_sync_session_factory():
     """Получение или создание фабрики синхронных сессий"""
@@ -106,7 +124,7 @@ def get_sync_db():
 async def init_db():
     """Инициализация базы данных с импортом моделей"""
     # Импортируем модели для их регистрации в Base.metadata
-    from models import User, Book, Alert, Notification, ParsingLog, Base
+    from models import User, Book, BookPrice, Alert, Notification, ParsingLog, Base
     from models.user_activity import UserActivity
     from models.settings import Settings
     from models.notification_template import NotificationTemplate
@@ -118,8 +136,8 @@ async def init_db():
 
 async def close_db():
     """Закрытие соединения с базой данных"""
-    engine = get_engine()
-    await engine.dispose()
+    if _engine is not None:
+        await _engine.dispose()
 
     # Закрываем синхронный движок
     global _sync_engine
@@ -131,6 +149,7 @@ __all__ = [
     "get_sync_engine",
     "get_session_factory", 
     "get_sync_session_factory",
+    "reset_engine_after_fork",
     "get_db",
     "get_sync_db",
     "init_db",
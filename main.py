@@ -89,6 +89,19 @@ async def lifespan(app: FastAPI):
     yield
     
     # Очистка при завершении
+    try:
+        from services.http_pool import close_http_session
+        await close_http_session()
+    except Exception as e:
+        logger.error(f"❌ Ошибка закрытия HTTP пула: {e}")
+
+    try:
+        from services.redis_client import close_async_redis, close_sync_redis
+        await close_async_redis()
+        close_sync_redis()
+    except Exception as e:
+        logger.error(f"❌ Ошибка закрытия пула Redis: {e}")
+
     logger.info("System shutdown complete")
 
 # Создание FastAPI приложения
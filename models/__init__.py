@@ -7,6 +7,7 @@
 from .base import Base
 from .user import User
 from .book import Book
+from .book_price import BookPrice
 from .alert import Alert
 from .notification import Notification
 from .parsing_log import ParsingLog
@@ -15,6 +16,7 @@ __all__ = [
     "Base",
     "User",
     "Book", 
+    "BookPrice",
     "Alert",
     "Notification",
     "ParsingLog"
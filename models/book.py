@@ -4,11 +4,22 @@
 Модель книг для системы мониторинга скидок на книги
 """
 
-from sqlalchemy import Column, Integer, String, DateTime, Text, ForeignKey, Index, Numeric
-from sqlalchemy.orm import relationship
+from sqlalchemy import Column, Integer, String, DateTime, Text, ForeignKey, Index, Numeric, Computed, text
+from sqlalchemy.dialects.postgresql import TSVECTOR
+from sqlalchemy.orm import relationship, deferred
 from datetime import datetime
 from .base import Base
 
+# Русская конфигурация даёт поиск по словоформам, simple - по точным словам
+# (латиница, фамилии, которые русский стеммер обрезает неудачно)
+SEARCH_VECTOR_EXPRESSION = (
+    "setweight(to_tsvector('russian', coalesce(title, '')), 'A') || "
+    "setweight(to_tsvector('simple', coalesce(title, '')), 'A') || "
+    "setweight(to_tsvector('russian', coalesce(author, '')), 'B') || "
+    "setweight(to_tsvector('simple', coalesce(author, '')), 'B') || "
+    "setweight(to_tsvector('russian', coalesce(publisher, '')), 'C')"
+)
+
 
 class Book(Base):
     """Модель книги в системе мониторинга"""
@@ -39,8 +50,20 @@ class Book(Base):
     source = Column(String(100), nullable=False, comment="Название магазина")
     source_id = Column(String(255), nullable=False, comment="ID товара в магазине")
     
-    # Время парсинга
+    # Время парсинга (обновляется, только если данные книги изменились)
     parsed_at = Column(DateTime, nullable=True, comment="Время парсинга данных")
+    last_seen_at = Column(DateTime, nullable=True, comment="Когда книга последний раз встречалась парсеру")
+    # Отпечаток данных парсера (services/book_upsert.py): неизменные книги не перезаписываются
+    content_hash = Column(String(32), nullable=True, comment="Отпечаток данных книги")
+    
+    # Полнотекстовый поиск (services/book_search.py): вычисляется PostgreSQL,
+    # в объекты не загружается
+    search_vector = deferred(Column(
+        TSVECTOR,
+        Computed(SEARCH_VECTOR_EXPRESSION, persisted=True),
+        nullable=True,
+        comment="Поисковый вектор по названию, автору и издательству"
+    ))
     
     # Связи
     alerts = relationship("Alert", back_populates="book", cascade="all, delete-orphan")
@@ -52,7 +75,19 @@ class Book(Base):
         Index('idx_book_source_price', 'source', 'current_price'),
         Index('idx_book_discount', 'discount_percent'),
         Index('idx_book_parsed_at', 'parsed_at'),
-        Index('books_source_source_id_key', 'source', 'source_id'),
+        # Уникальность нужна для пакетного upsert (ON CONFLICT (source, source_id))
+        Index('books_source_source_id_key', 'source', 'source_id', unique=True),
+        # Поиск: полнотекстовый по search_vector и подстрочный (ILIKE) через pg_trgm
+        Index('idx_book_search_vector', 'search_vector', postgresql_using='gin'),
+        Index('idx_book_title_trgm', 'title', postgresql_using='gin',
+              postgresql_ops={'title': 'gin_trgm_ops'}),
+        Index('idx_book_author_trgm', 'author', postgresql_using='gin',
+              postgresql_ops={'author': 'gin_trgm_ops'}),
+        # Курсорная пагинация (services/book_search.py): сортировка (ключ, id),
+        # ключ колонок с NULL - coalesce(колонка, значение для NULL)
+        Index('idx_book_price_id', 'current_price', 'id'),
+        Index('idx_book_parsed_at_id', text("(coalesce(parsed_at, '-infinity'::timestamp)) DESC"), text('id DESC')),
+        Index('idx_book_discount_id', text('(coalesce(discount_percent, -1)) DESC'), text('id DESC')),
     )
     
     def __repr__(self):
@@ -0,0 +1,36 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Модель истории цен книг
+"""
+
+from sqlalchemy import Column, Integer, SmallInteger, DateTime, ForeignKey, Index, Numeric
+from .base import Base
+
+
+class BookPrice(Base):
+    """
+    Точка истории цены книги (services/price_history.py)
+
+    Таблица только дополняется и пишется лишь при изменении цены: цена
+    действует с ts до следующей записи. Секционирована по месяцам (ts),
+    секции создаются по мере необходимости.
+    """
+    
+    __tablename__ = "book_prices"
+    
+    book_id = Column(Integer, ForeignKey("books.id", ondelete="CASCADE"), primary_key=True, comment="ID книги")
+    ts = Column(DateTime, primary_key=True, comment="Время, с которого действует цена")
+    
+    price = Column(Numeric(10, 2), nullable=False, comment="Цена")
+    original_price = Column(Numeric(10, 2), nullable=True, comment="Цена без скидки")
+    discount = Column(SmallInteger, nullable=True, comment="Скидка в процентах")
+    
+    __table_args__ = (
+        # Записи добавляются по времени: BRIN по ts почти ничего не весит
+        Index('idx_book_prices_ts_brin', 'ts', postgresql_using='brin'),
+        {'postgresql_partition_by': 'RANGE (ts)'},
+    )
+    
+    def __repr__(self):
+        return f"<BookPrice(book_id={self.book_id}, ts={self.ts}, price={self.price})>"
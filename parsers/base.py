@@ -1,11 +1,13 @@
 from abc import ABC, abstractmethod
-from typing import List, Optional, Dict, Any
+from typing import List, Optional, Dict, Any, Callable, Awaitable
 from datetime import datetime
 import asyncio
 import random
 import aiohttp
 from pydantic import BaseModel, Field
 from services.logger import parser_logger
+from services.http_pool import get_http_session
+from services.rate_limiter import get_host_limiter
 
 class Book(BaseModel):
     """Модель книги для унификации данных от всех парсеров"""
@@ -48,21 +50,36 @@ class BaseParser(ABC):
                 'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
             }
             
+        # Лимитер хоста общий для всех парсеров и воркеров
+        rate_limiter = get_host_limiter(
+            url,
+            rate=2.0 / max(self.delay_min + self.delay_max, 0.1)
+        )
+            
         for attempt in range(3):  # До 3 попыток
             try:
-                await self._random_delay()
+                await rate_limiter.acquire()
                 
-                async with aiohttp.ClientSession(
-                    timeout=aiohttp.ClientTimeout(total=30),
-                    headers=headers
-                ) as session:
-                    async with session.get(url) as response:
-                        if response.status == 200:
-                            return await response.text()
-                        else:
-                            self.logger.warning(
-                                f"HTTP {response.status} for {url}"
-                            )
+                session = get_http_session()
+                async with session.get(
+                    url,
+                    headers=headers,
+                    timeout=aiohttp.ClientTimeout(total=30)
+                ) as response:
+                    if response.status == 200:
+                        return await response.text()
+                    elif response.status == 429:
+                        # Общий backoff дождутся следующая попытка и другие воркеры
+                        retry_after = response.headers.get('Retry-After')
+                        await rate_limiter.report_throttled(
+                            float(retry_after) if retry_after and retry_after.isdigit() else None
+                        )
+                        self.logger.warning(f"HTTP 429 for {url}")
+                        continue
+                    else:
+                        self.logger.warning(
+                            f"HTTP {response.status} for {url}"
+                        )
                             
             except asyncio.TimeoutError:
                 self.logger.warning(f"Timeout for {url} (attempt {attempt + 1})")
@@ -74,6 +91,19 @@ class BaseParser(ABC):
                 
         return None
     
+    async def _emit_page(
+        self,
+        on_page: Optional[Callable[[List["Book"]], Awaitable[None]]],
+        books: List["Book"]
+    ):
+        """Передача загруженной страницы обработчику (ошибки обработчика не прерывают поиск)"""
+        if on_page is None or not books:
+            return
+        try:
+            await on_page(books)
+        except Exception as e:
+            self.logger.warning(f"[{self.name}] Ошибка обработчика страницы: {e}")
+    
     @abstractmethod
     async def search_books(self, query: str) -> List[Book]:
         """Поиск книг по названию/автору
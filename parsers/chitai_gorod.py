@@ -7,13 +7,25 @@
 - Структурированные данные
 """
 
+import os
 import asyncio
 import time
-from typing import List, Optional
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
 from datetime import datetime
 from parsers.base import BaseParser, Book
 from services.chitai_gorod_api_client import ChitaiGorodAPIClient, ChitaiGorodBook
 from services.logger import parser_logger
+from services.search_cache import get_cached_page, set_cached_page
+
+# Количество страниц поиска, запрашиваемых параллельно
+PAGE_CONCURRENCY = int(os.getenv("CHITAI_GOROD_PAGE_CONCURRENCY", "3"))
+SEARCH_PER_PAGE = 60
+
+# Популярные категории и запросы для поиска скидок
+DISCOUNT_QUERIES = [
+    "книги", "программирование", "python", "javascript", "java",
+    "математика", "бизнес", "психология", "фантастика", "детектив"
+]
 
 
 class ChitaiGorodParser(BaseParser):
@@ -26,13 +38,15 @@ class ChitaiGorodParser(BaseParser):
             delay_min=self.delay_min,
             delay_max=self.delay_max
         )
+        self.page_concurrency = PAGE_CONCURRENCY
         
     async def search_books(
         self,
         query: str,
         max_pages: int = 1,
         limit: int = None,
-        fetch_details: bool = False
+        fetch_details: bool = False,
+        on_page: Optional[Callable[[List[Book]], Awaitable[None]]] = None
     ) -> List[Book]:
         """
         Поиск книг на сайте chitai-gorod.ru через API
@@ -42,6 +56,7 @@ class ChitaiGorodParser(BaseParser):
             max_pages: Максимальное количество страниц для поиска
             limit: Максимальное количество книг для возврата
             fetch_details: Загружать ли детальную информацию (всегда True для API)
+            on_page: Корутина, вызываемая с книгами каждой загруженной страницы
             
         Returns:
             Список найденных книг
@@ -52,30 +67,30 @@ class ChitaiGorodParser(BaseParser):
         search_start = time.time()
 
         try:
-            all_books = []
+            # Первая страница: сразу узнаём из meta, сколько всего страниц
+            first_books, total_pages, has_results = await self._search_page(query, 1)
+            pages = {1: first_books}
+            empty_pages = set() if has_results else {1}
+            await self._emit_page(on_page, pages[1])
             
-            for page in range(1, max_pages + 1):
-                # Ищем товары через API
-                api_books = await self.api_client.search_products(
-                    phrase=query,
-                    page=page,
-                    per_page=60
+            last_page = max_pages
+            if total_pages:
+                last_page = min(max_pages, total_pages)
+            
+            if has_results and last_page > 1 and not (limit and len(pages[1]) >= limit):
+                await self._fetch_pages_concurrently(
+                    query, range(2, last_page + 1), limit, pages, empty_pages, on_page
                 )
-                
-                # Преобразуем в стандартную модель Book
-                books = [self._api_book_to_book(book) for book in api_books]
-                books = [book for book in books if book is not None]  # Убираем None
-                
-                all_books.extend(books)
-                
-                # Если на странице нет результатов, прерываем
-                if not api_books:
-                    break
-                
-                # Если достигли лимита, прерываем
-                if limit and len(all_books) >= limit:
-                    all_books = all_books[:limit]
-                    break
+            
+            # Собираем результат в порядке страниц до первой пустой
+            all_books = []
+            page = 1
+            while page in pages and page not in empty_pages:
+                all_books.extend(pages[page])
+                page += 1
+            
+            if limit and len(all_books) > limit:
+                all_books = all_books[:limit]
             
             await self.log_operation(
                 "search",
@@ -94,6 +109,114 @@ class ChitaiGorodParser(BaseParser):
             await self.log_operation("search", "error", f"Ошибка поиска: {e}")
             return []
     
+    async def _search_page(self, query: str, page: int) -> Tuple[List[Book], Optional[int], bool]:
+        """
+        Загрузка страницы поиска через кэш результатов
+        
+        Свежая страница из кэша отдаётся без запроса к API. Устаревшая
+        используется, только если API не вернул результатов.
+        
+        Returns:
+            Кортеж (книги страницы, количество страниц или None, есть ли результаты)
+        """
+        cached = await get_cached_page(self.name, query, page)
+        if cached and cached.fresh:
+            parser_logger.info(f"[ChitaiGorod] Страница {page} по запросу '{query}' из кэша")
+            return cached.books, cached.total_pages, True
+        
+        api_books, total_pages = await self.api_client.search_products_page(
+            phrase=query,
+            page=page,
+            per_page=SEARCH_PER_PAGE
+        )
+        
+        if not api_books and cached:
+            # Пустой ответ неотличим от ошибки API - отдаём устаревшие данные
+            parser_logger.warning(
+                f"[ChitaiGorod] API не вернул страницу {page} по запросу '{query}', "
+                f"используем кэш ({cached.age:.0f} сек)"
+            )
+            return cached.books, cached.total_pages, True
+        
+        books = self._convert_page(api_books)
+        await set_cached_page(self.name, query, page, books, total_pages=total_pages)
+        return books, total_pages, bool(api_books)
+    
+    def _convert_page(self, api_books: List[ChitaiGorodBook]) -> List[Book]:
+        """Преобразование страницы API в стандартные книги (без None)"""
+        books = [self._api_book_to_book(book) for book in api_books]
+        return [book for book in books if book is not None]
+    
+    async def _fetch_pages_concurrently(
+        self,
+        query: str,
+        page_numbers,
+        limit: Optional[int],
+        pages: Dict[int, List[Book]],
+        empty_pages: set,
+        on_page: Optional[Callable[[List[Book]], Awaitable[None]]] = None
+    ):
+        """
+        Параллельная загрузка страниц поиска
+        
+        Одновременно выполняется не больше page_concurrency запросов, общий темп
+        ограничивает token bucket API клиента. Загрузка останавливается, как
+        только непрерывный префикс страниц набирает limit книг или встречается
+        пустая страница (последующие страницы тоже будут пустыми).
+        """
+        semaphore = asyncio.Semaphore(self.page_concurrency)
+        
+        async def fetch_page(page: int):
+            async with semaphore:
+                books, _, has_results = await self._search_page(query, page)
+                return page, books, has_results
+        
+        tasks = {asyncio.create_task(fetch_page(page)): page for page in page_numbers}
+        pending = set(tasks)
+        
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                
+                for task in done:
+                    if task.cancelled():
+                        continue
+                    if task.exception():
+                        parser_logger.warning(
+                            f"[ChitaiGorod] Ошибка загрузки страницы {tasks[task]}: {task.exception()}"
+                        )
+                        empty_pages.add(tasks[task])
+                        continue
+                    
+                    page, books, has_results = task.result()
+                    pages[page] = books
+                    await self._emit_page(on_page, pages[page])
+                    
+                    if not has_results:
+                        empty_pages.add(page)
+                        # Дальше этой страницы результатов нет
+                        for other in list(pending):
+                            if tasks[other] > page:
+                                other.cancel()
+                                pending.discard(other)
+                
+                if limit and self._prefix_size(pages, empty_pages) >= limit:
+                    break
+        finally:
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+    
+    def _prefix_size(self, pages: Dict[int, List[Book]], empty_pages: set) -> int:
+        """Количество книг в непрерывном префиксе загруженных страниц"""
+        size = 0
+        page = 1
+        while page in pages and page not in empty_pages:
+            size += len(pages[page])
+            page += 1
+        return size
+    
     async def get_book_details(self, url: str) -> Optional[Book]:
         """
         Получение детальной информации о книге
@@ -120,10 +243,13 @@ class ChitaiGorodParser(BaseParser):
         
         return None
     
-    async def check_discounts(self) -> List[Book]:
+    async def check_discounts(self, queries: Optional[List[str]] = None) -> List[Book]:
         """
         Сканирование акционных предложений
         
+        Args:
+            queries: Поисковые запросы (по умолчанию DISCOUNT_QUERIES)
+        
         Returns:
             Список книг со скидками
         """
@@ -131,13 +257,7 @@ class ChitaiGorodParser(BaseParser):
         
         all_discount_books = []
         
-        # Популярные категории и запросы для поиска скидок
-        popular_queries = [
-            "книги", "программирование", "python", "javascript", "java",
-            "математика", "бизнес", "психология", "фантастика", "детектив"
-        ]
-        
-        for query in popular_queries:
+        for query in queries or DISCOUNT_QUERIES:
             try:
                 # Ищем книги
                 books = await self.search_books(query, max_pages=1)
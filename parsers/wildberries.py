@@ -1,5 +1,5 @@
 # parsers/wildberries.py
-from typing import List, Optional, Dict
+from typing import Awaitable, Callable, List, Optional, Dict
 from parsers.base import BaseParser, Book
 from services.logger import parser_logger
 import aiohttp
@@ -8,7 +8,9 @@ import bisect
 import re
 import time
 import random
-import requests
+from services.http_pool import get_http_session
+from services.rate_limiter import get_host_limiter
+from services.search_cache import get_cached_page, set_cached_page
 
 
 class WildberriesParser(BaseParser):
@@ -41,20 +43,6 @@ class WildberriesParser(BaseParser):
         # Время последней смены прокси (для авто-ротации каждые 2 минуты)
         self._last_proxy_change = time.time()
         self._proxy_rotation_interval = 120  # 2 минуты
-    
-    @property
-    def proxy(self) -> str:
-        return self.proxies[self._current_proxy_index]
-    
-    def _rotate_proxy(self):
-        """Ротирует прокси (прокси сам меняет IP каждые 2 минуты)"""
-        # Сбрасываем таймер ротации
-        self._last_proxy_change = time.time()
-        parser_logger.info(f"[Wildberries] Прокси ротирован (авто-смена каждые 2 мин)")
-        
-        # Счетчик попыток
-        self._request_attempts = 0
-        self._max_attempts = 3
         
         # Shard для разных категории
         self._shards = [
@@ -65,12 +53,24 @@ class WildberriesParser(BaseParser):
             "product/catalog",    # общий
         ]
         self._current_shard = 0
+        # Shard из каталога WB запрашивается один раз, при первом поиске
+        self._shard_initialized = False
+        
+        # Общий для всех воркеров лимит запросов к API поиска WB
+        self.rate_limiter = get_host_limiter("search.wb.ru", rate=0.67, capacity=2)
     
-        # Попробуем сначала без прокси
-        self._use_proxy = True
+    @property
+    def proxy(self) -> str:
+        return self.proxies[self._current_proxy_index]
+    
+    def _rotate_proxy(self):
+        """Ротирует прокси (прокси сам меняет IP каждые 2 минуты)"""
+        # Сбрасываем таймер ротации
+        self._last_proxy_change = time.time()
+        parser_logger.info(f"[Wildberries] Прокси ротирован (авто-смена каждые 2 мин)")
     
-        # Попробуем найти правильный shard
-        self._init_shard()
+        # После ротации снова пробуем через прокси
+        self._use_proxy = True
     
     def _check_proxy_rotation(self):
         """Проверяет, нужно ли ротировать прокси по времени (каждые 2 минуты)"""
@@ -109,19 +109,49 @@ class WildberriesParser(BaseParser):
                 return self._find_book_shard(catalog['childs'], depth + 1)
         return None
     
-    def _init_shard(self):
+    def _is_connection_error(self, error: Exception) -> bool:
+        """Ошибка связана с прокси или соединением"""
+        if isinstance(error, (
+            aiohttp.ClientProxyConnectionError,
+            aiohttp.ClientConnectorError,
+            aiohttp.ServerDisconnectedError,
+            aiohttp.ClientOSError,
+        )):
+            return True
+        error_str = str(error).lower()
+        return "proxy" in error_str or "connection" in error_str
+    
+    async def _get_json(self, url: str, params: Dict = None, timeout: int = 10):
+        """
+        GET запрос через общий пул соединений (через прокси, если включён)
+        
+        Returns:
+            Кортеж (HTTP статус, JSON или None)
+        """
+        session = get_http_session()
+        async with session.get(
+            url,
+            params=params,
+            headers=self._get_headers(),
+            proxy=self.proxy if self._use_proxy else None,
+            timeout=aiohttp.ClientTimeout(total=timeout)
+        ) as response:
+            if response.status != 200:
+                return response.status, None
+            # WB иногда отдаёт JSON с content-type text/plain
+            return response.status, await response.json(content_type=None)
+    
+    async def _init_shard(self):
         """Получение правильного shard для книг из каталога WB"""
+        if self._shard_initialized:
+            return
+        self._shard_initialized = True
+        
         try:
             url = 'https://static-basket-01.wbbasket.ru/vol0/data/main-menu-ru-ru-v3.json'
-            headers = {"User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:109.0)"}
-            
-            proxies = None
-            if self._use_proxy:
-                proxies = {"http": self.proxy, "https": self.proxy}
             
-            r = requests.get(url, headers=headers, proxies=proxies, timeout=10)
-            if r.status_code == 200:
-                catalog = r.json()
+            status, catalog = await self._get_json(url)
+            if status == 200 and catalog is not None:
                 # Ищем раздел "Книги" рекурсивно
                 shard = self._find_book_shard(catalog)
                 if shard:
@@ -142,7 +172,8 @@ class WildberriesParser(BaseParser):
         query: str,
         max_pages: int = 1,
         limit: int = None,
-        fetch_details: bool = False
+        fetch_details: bool = False,
+        on_page: Optional[Callable[[List[Book]], Awaitable[None]]] = None
     ) -> List[Book]:
         """
         Поиск книг на Wildberries
@@ -152,6 +183,7 @@ class WildberriesParser(BaseParser):
             max_pages: Максимальное количество страниц
             limit: Максимальное количество книг
             fetch_details: Загружать детальную информацию
+            on_page: Корутина, вызываемая с книгами каждой загруженной страницы
             
         Returns:
             Список найденных книг
@@ -162,10 +194,15 @@ class WildberriesParser(BaseParser):
         
         search_start = time.time()
         books = []
+        # Устаревшие страницы из кэша - на случай, если WB не ответит
+        stale_pages = {}
         
         self._request_attempts = 0
         self._current_shard = 0  # сбрасываем shard для каждого нового поиска
         
+        # Находим shard книг в каталоге (один раз на экземпляр парсера)
+        await self._init_shard()
+        
         # Цикл с повторами
         while self._request_attempts < self._max_attempts:
             self._request_attempts += 1
@@ -176,6 +213,18 @@ class WildberriesParser(BaseParser):
                 page_books = []
                 
                 for page in range(1, max_pages + 1):
+                    # Свежая страница из кэша результатов - без запроса к WB
+                    cached = await get_cached_page(self.name, query, page)
+                    if cached and cached.fresh:
+                        parser_logger.info(f"[Wildberries] Страница {page} по запросу '{query}' из кэша")
+                        page_books.extend(cached.books)
+                        await self._emit_page(on_page, cached.books)
+                        if limit and len(page_books) >= limit:
+                            break
+                        continue
+                    if cached:
+                        stale_pages[page] = cached.books
+                    
                     # Пробуем search.wb.ru/exactmatch - как в работающих парсерах
                     search_url = "https://search.wb.ru/exactmatch/ru/common/v4/search"
                     
@@ -192,31 +241,17 @@ class WildberriesParser(BaseParser):
                         "spp": 30
                     }
             
-                    headers = self._get_headers()
-                    
                     # Проверяем необходимость ротации прокси (каждые 2 минуты)
                     self._check_proxy_rotation()
                     
-                    # Задержка перед запросом
-                    await asyncio.sleep(random.uniform(1, 2))
-                    
-                    # Используем requests
-                    proxies = None
-                    if self._use_proxy:
-                        proxies = {"http": self.proxy, "https": self.proxy}
+                    # Ожидание бюджета запросов (без паузы, если бюджет свободен)
+                    await self.rate_limiter.acquire()
                     
                     try:
-                        r = requests.get(
-                            search_url, 
-                            params=params, 
-                            headers=headers,
-                            proxies=proxies,
-                            timeout=10
-                        )
-                        parser_logger.info(f"[Wildberries] HTTP status: {r.status_code}")
+                        status, data = await self._get_json(search_url, params=params)
+                        parser_logger.info(f"[Wildberries] HTTP status: {status}")
                         
-                        if r.status_code == 200:
-                            data = r.json()
+                        if status == 200 and data is not None:
                             
                             # Пробуем разные пути
                             products = data.get("data", {}).get("products", [])
@@ -236,6 +271,7 @@ class WildberriesParser(BaseParser):
                                     parser_logger.info(f"[Wildberries] image: {first_prod['image']}")
                             
                             parser_logger.info(f"[Wildberries] Страница {page}: найдено {len(products)} товаров")
+                            page_start = len(page_books)
                             
                             for product in products:
                                 # Фильтр - только книги
@@ -302,26 +338,31 @@ class WildberriesParser(BaseParser):
                                 if book:
                                     page_books.append(book)
                             
-                        elif r.status_code == 429:
+                            await self._emit_page(on_page, page_books[page_start:])
+                            if products:
+                                await set_cached_page(self.name, query, page, page_books[page_start:])
+                            
+                        elif status == 429:
                             # Ротируем прокси (сброс таймера для авто-ротации)
+                            # Общий backoff дождутся в лимитере все воркеры
                             if self._use_proxy:
                                 self._rotate_proxy()
                                 parser_logger.warning(f"[Wildberries] 429, ротируем прокси")
-                                await asyncio.sleep(3)
+                                await self.rate_limiter.report_throttled(3)
                                 continue
                             wait_time = random.randint(30, 60)
-                            parser_logger.warning(f"[Wildberries] Rate limit (429), ждём {wait_time} сек...")
-                            await asyncio.sleep(wait_time)
+                            parser_logger.warning(f"[Wildberries] Rate limit (429), пауза {wait_time} сек...")
+                            await self.rate_limiter.report_throttled(wait_time)
                             continue
                         
-                        elif r.status_code == 403:
+                        elif status == 403:
                             parser_logger.warning("[Wildberries] 403 Forbidden")
                             # Ротируем прокси при 403
                             if self._use_proxy:
                                 self._rotate_proxy()
                             break
                         
-                        elif r.status_code == 404:
+                        elif status == 404:
                             # Ротируем прокси
                             if self._use_proxy:
                                 self._rotate_proxy()
@@ -334,12 +375,11 @@ class WildberriesParser(BaseParser):
                                 break
                         
                         else:
-                            parser_logger.error(f"[Wildberries] HTTP {r.status_code}")
+                            parser_logger.error(f"[Wildberries] HTTP {status}")
                             
                     except Exception as e:
                         # Проверяем, что ошибка связана с прокси
-                        error_str = str(e).lower()
-                        if "proxy" in error_str or "connection" in error_str:
+                        if self._is_connection_error(e):
                             if self._use_proxy:
                                 self._rotate_proxy()
                                 parser_logger.warning(f"[Wildberries] Ошибка прокси, ротируем")
@@ -372,6 +412,11 @@ class WildberriesParser(BaseParser):
                 await self.log_operation("search", "error", f"Ошибка поиска: {e}")
                 break
         
+        # WB не ответил - отдаём устаревшие данные из кэша
+        if not books and stale_pages:
+            parser_logger.warning(f"[Wildberries] Нет ответа по запросу '{query}', используем устаревший кэш")
+            books = [book for page in sorted(stale_pages) for book in stale_pages[page]]
+        
         # Дедупликация: оставляем только книги с минимальной ценой для каждого названия
         if books:
             unique_books = {}
@@ -596,28 +641,19 @@ class WildberriesParser(BaseParser):
             # API детальной информации
             detail_url = f"https://search.wb.ru/exactmatch/ru/common/v4/product/{product_id}"
             
-            headers = self._get_headers()
-            
             # Проверяем необходимость ротации прокси
             self._check_proxy_rotation()
             
-            await self._random_delay()
-            
-            # Используем requests
-            proxies = None
-            if self._use_proxy:
-                proxies = {"http": self.proxy, "https": self.proxy}
+            await self.rate_limiter.acquire()
             
             try:
-                r = requests.get(
-                    detail_url, 
-                    headers=headers,
-                    proxies=proxies,
-                    timeout=10
-                )
-                if r.status_code == 200:
-                    data = r.json()
+                status, data = await self._get_json(detail_url)
+                if status == 200 and data is not None:
                     return self._parse_product(data, "")
+                if status == 429:
+                    await self.rate_limiter.report_throttled()
+                if status in (403, 429) and self._use_proxy:
+                    self._rotate_proxy()
             except Exception as e:
                 parser_logger.error(f"[Wildberries] Ошибка получения деталей: {e}")
                         
@@ -652,27 +688,18 @@ class WildberriesParser(BaseParser):
                 "spp": 30
             }
             
-            headers = self._get_headers()
-            
             # Проверяем необходимость ротации прокси
             self._check_proxy_rotation()
             
-            await self._random_delay()
-            
-            proxies = None
-            if self._use_proxy:
-                proxies = {"http": self.proxy, "https": self.proxy}
+            await self.rate_limiter.acquire()
             
             try:
-                r = requests.get(
-                    discount_url, 
-                    params=params,
-                    headers=headers,
-                    proxies=proxies,
-                    timeout=10
-                )
-                if r.status_code == 200:
-                    data = r.json()
+                status, data = await self._get_json(discount_url, params=params)
+                if status == 429:
+                    await self.rate_limiter.report_throttled()
+                if status in (403, 429) and self._use_proxy:
+                    self._rotate_proxy()
+                if status == 200 and data is not None:
                     products = data.get("data", {}).get("products", [])
                     
                     for product in products:
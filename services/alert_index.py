@@ -0,0 +1,297 @@
+"""
+Индекс активных подписок в памяти воркера
+
+Сопоставление книги с подписками без перебора всех подписок:
+- подписки на конкретную книгу - словарь book_id -> подписки
+- подписки по названию - инвертированный индекс (магазин, слово) -> подписки;
+  слова нормализуются get_words_set (services/search_utils.py)
+- каждый список индекса отсортирован по ценовому порогу подписки
+  (min(target_price, max_price)): подписки, которым подходит цена книги,
+  находятся бинарным поиском
+- скидка, фильтры автора и издательства и доля совпавших слов проверяются
+  только у найденных кандидатов
+
+Индекс строится один раз на процесс и обновляется по изменениям: API подписок
+после commit добавляет ID подписки в Redis stream ALERT_INDEX_CHANGES_KEY,
+воркер перед сопоставлением перечитывает из БД только изменённые подписки.
+Раз в ALERT_INDEX_RELOAD_INTERVAL индекс перестраивается целиком.
+"""
+
+import os
+import time
+import asyncio
+from bisect import bisect_left, insort
+from dataclasses import dataclass
+from datetime import datetime
+from functools import lru_cache
+from typing import Dict, FrozenSet, Iterable, List, Optional, Set, Tuple
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from models import Alert
+from services.logger import logger, celery_logger
+from services.redis_client import async_pipeline, get_async_redis
+from services.search_utils import get_words_set, normalize_text
+
+# Redis stream с ID изменённых подписок
+ALERT_INDEX_CHANGES_KEY = "alert_index:changes"
+ALERT_INDEX_CHANGES_MAXLEN = 10000
+# Полная перестройка индекса (сек)
+ALERT_INDEX_RELOAD_INTERVAL = int(os.getenv("ALERT_INDEX_RELOAD_INTERVAL", "900"))
+
+# Доля слов названия подписки, которые должны быть в названии книги
+TITLE_MATCH_RATIO = 0.5
+
+_NO_LIMIT = float("inf")
+
+
+@lru_cache(maxsize=65536)
+def alert_title_words(title: str) -> FrozenSet[str]:
+    """Значимые слова названия подписки (если таких нет - все слова)"""
+    title = title or ""
+    return frozenset(get_words_set(title) or normalize_text(title).split())
+
+
+def book_title_words(title: str) -> Set[str]:
+    """Все слова названия книги"""
+    return set(normalize_text(title or "").split())
+
+
+def title_words_match(alert_words: FrozenSet[str], book_words: Set[str]) -> bool:
+    """Не меньше TITLE_MATCH_RATIO слов подписки есть в названии книги"""
+    if not alert_words:
+        return False
+    return len(alert_words & book_words) / len(alert_words) >= TITLE_MATCH_RATIO
+
+
+@dataclass(frozen=True)
+class IndexedAlert:
+    """Условия подписки, нужные для сопоставления"""
+
+    id: int
+    book_id: Optional[int]
+    source: Optional[str]
+    words: FrozenSet[str]
+    price_limit: float
+    min_discount: float
+    author_filter: Optional[str]
+    publisher_filter: Optional[str]
+    expires_at: Optional[datetime]
+
+    @classmethod
+    def from_row(cls, row) -> "IndexedAlert":
+        limits = [price for price in (row.target_price, row.max_price) if price]
+        return cls(
+            id=row.id,
+            book_id=row.book_id,
+            source=row.book_source,
+            words=alert_title_words(row.book_title) if row.book_id is None else frozenset(),
+            price_limit=min(limits) if limits else _NO_LIMIT,
+            min_discount=row.min_discount or 0,
+            author_filter=(row.author_filter or "").lower() or None,
+            publisher_filter=(row.publisher_filter or "").lower() or None,
+            expires_at=row.expires_at,
+        )
+
+    def matches(self, book, book_words: Set[str], now: datetime) -> bool:
+        """Проверка условий по сохранённой книге"""
+        if self.expires_at and self.expires_at < now:
+            return False
+        if float(book.current_price or 0) > self.price_limit:
+            return False
+        if (book.discount_percent or 0) < self.min_discount:
+            return False
+        if self.author_filter and self.author_filter not in (book.author or "").lower():
+            return False
+        if self.publisher_filter and self.publisher_filter not in (book.publisher or "").lower():
+            return False
+        if self.book_id is None:
+            return self.source == book.source and title_words_match(self.words, book_words)
+        return self.book_id == book.id
+
+
+# Колонки подписки, из которых строится IndexedAlert
+_ALERT_COLUMNS = (
+    Alert.id, Alert.book_id, Alert.book_source, Alert.book_title,
+    Alert.target_price, Alert.max_price, Alert.min_discount,
+    Alert.author_filter, Alert.publisher_filter, Alert.expires_at,
+)
+
+
+class AlertIndex:
+    """Инвертированный индекс активных подписок"""
+
+    def __init__(self):
+        self._loaded_at: Optional[float] = None
+        # Последняя применённая запись stream изменений (None - Redis недоступен)
+        self._stream_id: Optional[str] = None
+        # Одна актуализация за раз: в асинхронном воркере задачи делят индекс
+        self._refresh_lock = asyncio.Lock()
+        self._clear()
+
+    def _clear(self):
+        self._alerts: Dict[int, IndexedAlert] = {}
+        self._by_book: Dict[int, Set[int]] = {}
+        # (магазин, слово) -> [(ценовой порог, ID подписки)] по возрастанию порога
+        self._postings: Dict[Tuple[str, str], List[Tuple[float, int]]] = {}
+
+    def __len__(self) -> int:
+        return len(self._alerts)
+
+    def add(self, alert: IndexedAlert):
+        """Добавление (или замена) подписки"""
+        self.discard(alert.id)
+        self._alerts[alert.id] = alert
+        if alert.book_id is not None:
+            self._by_book.setdefault(alert.book_id, set()).add(alert.id)
+            return
+        for word in alert.words:
+            insort(self._postings.setdefault((alert.source, word), []), (alert.price_limit, alert.id))
+
+    def discard(self, alert_id: int):
+        """Удаление подписки из индекса"""
+        alert = self._alerts.pop(alert_id, None)
+        if alert is None:
+            return
+        if alert.book_id is not None:
+            alert_ids = self._by_book.get(alert.book_id)
+            if alert_ids:
+                alert_ids.discard(alert_id)
+                if not alert_ids:
+                    del self._by_book[alert.book_id]
+            return
+        for word in alert.words:
+            key = (alert.source, word)
+            posting = self._postings.get(key)
+            if not posting:
+                continue
+            position = bisect_left(posting, (alert.price_limit, alert_id))
+            if position < len(posting) and posting[position] == (alert.price_limit, alert_id):
+                del posting[position]
+            if not posting:
+                del self._postings[key]
+
+    def match(self, book, now: Optional[datetime] = None) -> List[int]:
+        """ID подписок, условия которых выполнены для книги"""
+        now = now or datetime.utcnow()
+        price = float(book.current_price or 0)
+        book_words = book_title_words(book.title)
+
+        candidates = set(self._by_book.get(book.id, ()))
+        for word in book_words:
+            posting = self._postings.get((book.source, word))
+            if posting:
+                # Подписки с порогом не ниже цены книги
+                start = bisect_left(posting, (price, -1))
+                candidates.update(alert_id for _, alert_id in posting[start:])
+
+        return [
+            alert_id for alert_id in candidates
+            if self._alerts[alert_id].matches(book, book_words, now)
+        ]
+
+    async def _stream_head(self) -> Optional[str]:
+        """ID последней записи stream изменений ("0-0" для пустого)"""
+        entries = await get_async_redis().xrevrange(ALERT_INDEX_CHANGES_KEY, count=1)
+        return entries[0][0] if entries else "0-0"
+
+    async def _read_changes(self) -> Optional[Set[int]]:
+        """
+        ID подписок, изменённых после _stream_id
+
+        Returns:
+            None, если изменения могли быть потеряны (нужна полная перестройка)
+        """
+        entries = await get_async_redis().xrange(
+            ALERT_INDEX_CHANGES_KEY,
+            min=f"({self._stream_id}",
+            max="+",
+            count=ALERT_INDEX_CHANGES_MAXLEN,
+        )
+
+        if len(entries) >= ALERT_INDEX_CHANGES_MAXLEN:
+            return None
+        if entries:
+            self._stream_id = entries[-1][0]
+        return {int(fields["alert_id"]) for _, fields in entries}
+
+    async def load(self, db: AsyncSession):
+        """Полная перестройка индекса"""
+        # Позиция stream берётся до чтения подписок: изменения во время загрузки не теряются
+        try:
+            stream_id = await self._stream_head()
+        except Exception as e:
+            celery_logger.warning(f"Stream изменений подписок недоступен: {e}")
+            stream_id = None
+
+        result = await db.execute(select(*_ALERT_COLUMNS).where(Alert.is_active == True))
+
+        self._clear()
+        for row in result:
+            self.add(IndexedAlert.from_row(row))
+        self._loaded_at = time.monotonic()
+        self._stream_id = stream_id
+        celery_logger.info(f"Индекс подписок построен: {len(self._alerts)} активных подписок")
+
+    async def reload_alerts(self, db: AsyncSession, alert_ids: Iterable[int]):
+        """Перечитывание изменённых подписок из БД"""
+        alert_ids = list(alert_ids)
+        if not alert_ids:
+            return
+        result = await db.execute(
+            select(*_ALERT_COLUMNS).where(Alert.id.in_(alert_ids), Alert.is_active == True)
+        )
+        for alert_id in alert_ids:
+            self.discard(alert_id)
+        for row in result:
+            self.add(IndexedAlert.from_row(row))
+
+    async def refresh(self, db: AsyncSession):
+        """Актуализация индекса перед сопоставлением"""
+        async with self._refresh_lock:
+            await self._refresh(db)
+
+    async def _refresh(self, db: AsyncSession):
+        stale = (
+            self._loaded_at is None
+            or self._stream_id is None
+            or time.monotonic() - self._loaded_at > ALERT_INDEX_RELOAD_INTERVAL
+        )
+        if not stale:
+            try:
+                changed_ids = await self._read_changes()
+            except Exception as e:
+                celery_logger.warning(f"Ошибка чтения изменений подписок: {e}")
+                changed_ids = None
+            if changed_ids is not None:
+                await self.reload_alerts(db, changed_ids)
+                return
+        await self.load(db)
+
+
+# Индекс процесса воркера
+alert_index = AlertIndex()
+
+
+async def publish_alert_changes(alert_ids: Iterable[int]):
+    """
+    Сообщить воркерам об изменении подписок (вызывается после commit)
+
+    Ошибка не прерывает запрос: индекс воркеров перестроится по таймеру.
+    """
+    alert_ids = sorted(set(alert_ids))
+    if not alert_ids:
+        return
+    try:
+        # Все записи одним запросом
+        async with async_pipeline() as pipe:
+            for alert_id in alert_ids:
+                pipe.xadd(
+                    ALERT_INDEX_CHANGES_KEY,
+                    {"alert_id": alert_id},
+                    maxlen=ALERT_INDEX_CHANGES_MAXLEN,
+                    approximate=True,
+                )
+    except Exception as e:
+        logger.error(f"Ошибка публикации изменения подписок {alert_ids}: {e}")
@@ -0,0 +1,122 @@
+"""
+Сопоставление подписок с книгами по событиям изменения цен
+
+Вместо периодического перепарсинга каждой подписки подписки проверяются в
+момент сохранения данных:
+- пакетный upsert (services/book_upsert.py) после commit публикует событие -
+  ID новых книг и книг с изменившейся ценой (задача match_price_changes)
+- для события выбираются только подписки-кандидаты из индекса подписок
+  воркера (services/alert_index.py): на эти книги (book_id) и подписки по
+  словам названия на их магазины
+- условия подписки (target_price, min_discount, max_price, фильтры автора и
+  издательства, совпадение названия) проверяются по сохранённой книге
+
+Периодическая check_subscriptions_prices остаётся страховкой: обновляет цены
+книг подписок и проверяет их тем же кодом.
+"""
+
+from datetime import datetime
+from typing import Dict, Iterable, List, Set, Tuple
+
+from sqlalchemy import select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from models import Alert, Book
+from services.logger import celery_logger
+from services.alert_index import (
+    IndexedAlert, alert_index, alert_title_words, book_title_words, title_words_match,
+    publish_alert_changes,
+)
+
+MATCH_PRICE_CHANGES_TASK = "services.celery_tasks.match_price_changes"
+
+
+def publish_price_changes(book_ids: Iterable[int]):
+    """Событие изменения цен: проверка подписок на книги в фоновой задаче"""
+    book_ids = sorted(set(book_ids))
+    if not book_ids:
+        return
+    try:
+        from services.celery_app import celery_app
+        celery_app.send_task(MATCH_PRICE_CHANGES_TASK, args=[book_ids])
+    except Exception as e:
+        # Подписки проверит периодическая задача
+        celery_logger.error(f"Ошибка публикации изменений цен ({len(book_ids)} книг): {e}")
+
+
+def title_matches(alert: Alert, book: Book) -> bool:
+    """Совпадение названия: не меньше половины слов подписки есть в названии книги"""
+    return title_words_match(alert_title_words(alert.book_title), book_title_words(book.title))
+
+
+def alert_matches_book(alert: Alert, book: Book) -> bool:
+    """Проверка условий подписки по сохранённой книге"""
+    return IndexedAlert.from_row(alert).matches(book, book_title_words(book.title), datetime.utcnow())
+
+
+async def find_matches(db: AsyncSession, book_ids: Iterable[int]) -> List[Tuple[Alert, Book]]:
+    """
+    Подписки, условия которых выполнены для книг
+
+    Кандидаты берутся из индекса подписок воркера (services/alert_index.py),
+    из БД загружаются только совпавшие подписки.
+
+    Returns:
+        Пары (подписка, книга); для подписки по названию берётся книга с
+        максимальной скидкой
+    """
+    book_ids = list(set(book_ids))
+    if not book_ids:
+        return []
+
+    result = await db.execute(select(Book).where(Book.id.in_(book_ids)))
+    books = list(result.scalars().all())
+    if not books:
+        return []
+
+    await alert_index.refresh(db)
+
+    now = datetime.utcnow()
+    best: Dict[int, Book] = {}
+    for book in books:
+        for alert_id in alert_index.match(book, now):
+            current = best.get(alert_id)
+            if current is None or (book.discount_percent or 0) > (current.discount_percent or 0):
+                best[alert_id] = book
+    if not best:
+        return []
+
+    # Индекс мог отстать от БД: условия перепроверяются по загруженной подписке
+    result = await db.execute(
+        select(Alert).where(Alert.id.in_(list(best.keys())), Alert.is_active == True)
+    )
+    return [
+        (alert, best[alert.id])
+        for alert in result.scalars().all()
+        if alert_matches_book(alert, best[alert.id])
+    ]
+
+
+async def claim_alerts(db: AsyncSession, alerts: List[Alert]) -> Set[int]:
+    """
+    Деактивация подписок перед уведомлением (один UPDATE, без commit)
+
+    Условный UPDATE: подписки, уже обработанные другим воркером, не
+    возвращаются
+
+    Returns:
+        ID деактивированных этим вызовом подписок
+    """
+    if not alerts:
+        return set()
+    result = await db.execute(
+        update(Alert)
+        .where(Alert.id.in_([alert.id for alert in alerts]), Alert.is_active == True)
+        .values(is_active=False, updated_at=datetime.now())
+        .returning(Alert.id)
+        .execution_options(synchronize_session=False)
+    )
+    claimed = set(result.scalars().all())
+    for alert in alerts:
+        alert_index.discard(alert.id)
+    return claimed
@@ -0,0 +1,392 @@
+"""
+Поиск книг в базе данных
+
+Все поисковые эндпоинты и задачи ищут книги через search_books(): один
+модуль строит условие, сортировку и подсчёт, поэтому индексы и ранжирование
+меняются в одном месте.
+
+Условие поиска. Запрос разбивается на слова (без предлогов и союзов), книга
+подходит, если хотя бы одно слово:
+- найдено полнотекстовым поиском по search_vector (словоформы и префиксы слов
+  названия, автора и издательства, GIN индекс)
+- или встречается подстрокой в названии/авторе (регулярное выражение по GIN
+  индексам pg_trgm; только слова от MIN_SUBSTRING_WORD_LENGTH символов - для
+  более коротких триграммный индекс бесполезен)
+
+Релевантность: ts_rank_cd по вектору (название весит больше автора и
+издательства) плюс триграммное сходство названия с запросом.
+
+План запроса:
+- страница и общее количество считаются одним запросом (count(*) over ())
+- без поискового запроса и фильтров количество берётся из статистики
+  PostgreSQL, если таблица больше ESTIMATED_COUNT_THRESHOLD строк
+- курсорная пагинация (сортировки по цене, дате парсинга и скидке): курсор -
+  непрозрачная строка с ключом сортировки и id последней книги, следующая
+  страница читается по индексу (ключ, id) и стоит столько же, сколько первая;
+  offset остаётся режимом совместимости и единственным для релевантности
+- слова передаются параметрами (tsquery и одно регулярное выражение), поэтому
+  текст SQL не зависит от числа слов: SQLAlchemy берёт скомпилированный
+  запрос из кэша, а asyncpg - подготовленный запрос из кэша соединения
+"""
+
+import re
+import json
+import base64
+import string
+from datetime import datetime
+from decimal import Decimal
+from typing import Any, List, Optional, Tuple
+
+from sqlalchemy import func, or_, select, tuple_, literal_column, text as sql_text
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.sql.elements import ColumnElement
+
+from models.book import Book
+
+# Предлоги и союзы, которые не участвуют в поиске
+STOP_WORDS = {"и", "в", "на", "с", "от", "до", "по", "о", "об", "а", "но", "или"}
+
+# Минимальная длина слова для подстрочного поиска через pg_trgm
+MIN_SUBSTRING_WORD_LENGTH = 3
+
+# С какого размера таблицы общее количество без фильтров берётся из статистики
+ESTIMATED_COUNT_THRESHOLD = 100_000
+
+# Сортировки выдачи
+ORDER_RELEVANCE = "relevance"  # релевантность, среди равных - свежие
+ORDER_PRICE = "price"          # сначала дешёвые
+ORDER_RECENT = "recent"        # сначала свежие
+ORDER_DISCOUNT = "discount"    # сначала с наибольшей скидкой
+ORDERS = (ORDER_RELEVANCE, ORDER_PRICE, ORDER_RECENT, ORDER_DISCOUNT)
+
+# Сортировки с курсорной пагинацией: колонка ключа, направление (по убыванию?)
+# и значение ключа для NULL (SQL). Ключ колонки с NULL - coalesce(колонка,
+# значение): NULL оказываются в конце выдачи, а условие курсора остаётся одним
+# сравнением кортежей по индексу (выражения совпадают с индексами models/book.py)
+KEYSET_ORDERS = {
+    ORDER_PRICE: (Book.current_price, False, None),
+    ORDER_RECENT: (Book.parsed_at, True, "'-infinity'::timestamp"),
+    ORDER_DISCOUNT: (Book.discount_percent, True, "-1"),
+}
+
+
+def clean_search_words(text: str) -> List[str]:
+    """
+    Очищает текст от знаков пунктуации и разбивает на слова.
+    """
+    # Заменяем запятые, точки и другие разделители на пробелы
+    text = re.sub(r'[,\.\!\?\:\;\-\—\(\)\[\]\{\}<>]', ' ', text or "")
+    # Разбиваем на слова и очищаем каждый
+    words = text.lower().split()
+    # Удаляем оставшиеся знаки пунктуации из слов
+    cleaned_words = [word.strip(string.punctuation) for word in words]
+    # Убираем пустые строки
+    return [word for word in cleaned_words if word.strip()]
+
+
+def search_words(text: str) -> List[str]:
+    """Значимые слова запроса: без пунктуации, предлогов и союзов"""
+    return [word for word in clean_search_words(text) if word not in STOP_WORDS]
+
+
+def _ts_query(words: List[str]) -> Optional[ColumnElement]:
+    """tsquery "слово1:* | слово2:*" в русской и simple конфигурациях"""
+    lexemes = []
+    for word in words:
+        # В лексеме to_tsquery допустимы только буквы и цифры
+        lexeme = re.sub(r'[\W_]+', '', word)
+        if lexeme and f"{lexeme}:*" not in lexemes:
+            lexemes.append(f"{lexeme}:*")
+
+    if not lexemes:
+        return None
+
+    query_text = " | ".join(lexemes)
+    return func.to_tsquery(literal_column("'russian'::regconfig"), query_text).op('||')(
+        func.to_tsquery(literal_column("'simple'::regconfig"), query_text)
+    )
+
+
+def _substring_pattern(words: List[str]) -> Optional[str]:
+    """Регулярное выражение "слово1|слово2" для подстрочного поиска"""
+    substrings = [re.escape(word) for word in words if len(word) >= MIN_SUBSTRING_WORD_LENGTH]
+    if not substrings:
+        return None
+    return "|".join(dict.fromkeys(substrings))
+
+
+def build_book_search(query: str) -> Optional[Tuple[ColumnElement, ColumnElement]]:
+    """
+    Условие поиска книг и выражение релевантности
+
+    Args:
+        query: Поисковый запрос пользователя
+
+    Returns:
+        Кортеж (condition, rank) или None, если в запросе нет значимых слов.
+        condition - для where(), rank - для order_by(rank.desc())
+    """
+    words = search_words(query)
+    if not words:
+        return None
+
+    conditions = []
+    ts_query = _ts_query(words)
+    if ts_query is not None:
+        conditions.append(Book.search_vector.op('@@')(ts_query))
+
+    # Подстроки внутри слов ("поттер" в "гаррипоттер") - через триграммы
+    pattern = _substring_pattern(words)
+    if pattern is not None:
+        conditions.append(Book.title.op('~*')(pattern))
+        conditions.append(Book.author.op('~*')(pattern))
+
+    if not conditions:
+        return None
+
+    rank = func.similarity(Book.title, " ".join(words))
+    if ts_query is not None:
+        rank = func.ts_rank_cd(Book.search_vector, ts_query) + rank
+
+    return or_(*conditions), rank
+
+
+async def _estimated_books_count(db: AsyncSession) -> int:
+    """Количество книг по статистике PostgreSQL (без полного прохода по таблице)"""
+    result = await db.execute(
+        sql_text("SELECT reltuples::bigint FROM pg_class WHERE oid = 'books'::regclass")
+    )
+    return max(int(result.scalar() or 0), 0)
+
+
+def _resolve_order(order: str, rank: Optional[ColumnElement]) -> str:
+    """Фактическая сортировка: релевантность без поисковых слов - свежие"""
+    if order not in ORDERS:
+        raise ValueError(f"Неизвестная сортировка: {order}")
+    if order == ORDER_RELEVANCE and rank is None:
+        return ORDER_RECENT
+    return order
+
+
+def _encode_key(order: str, value) -> Optional[str]:
+    """Значение ключа сортировки для курсора"""
+    if value is None:
+        return None
+    if order == ORDER_RECENT:
+        return value.isoformat()
+    return str(value)
+
+
+def _decode_key(order: str, value: Optional[str]):
+    """Значение ключа сортировки из курсора"""
+    if value is None:
+        return None
+    if order == ORDER_PRICE:
+        return Decimal(value)
+    if order == ORDER_RECENT:
+        return datetime.fromisoformat(value)
+    return int(value)
+
+
+def encode_cursor(book: Book, order: str) -> str:
+    """Курсор, указывающий на позицию сразу после книги в выдаче с сортировкой order"""
+    column = KEYSET_ORDERS[order][0]
+    payload = {
+        "o": order,
+        "k": _encode_key(order, getattr(book, column.key)),
+        "i": book.id,
+    }
+    raw = json.dumps(payload, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[str, Any, int]:
+    """
+    Разбор курсора
+
+    Returns:
+        Кортеж (order, sort_key, book_id)
+
+    Raises:
+        ValueError: Курсор повреждён
+    """
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        payload = json.loads(raw)
+        order = payload["o"]
+        if order not in KEYSET_ORDERS:
+            raise ValueError(order)
+        return order, _decode_key(order, payload["k"]), int(payload["i"])
+    except Exception:
+        raise ValueError("Некорректный курсор пагинации")
+
+
+def _sort_key(order: str) -> ColumnElement:
+    """Выражение ключа сортировки (как в индексе)"""
+    column, _, null_key = KEYSET_ORDERS[order]
+    if null_key is None:
+        return column
+    return func.coalesce(column, literal_column(null_key))
+
+
+def _keyset_condition(order: str, sort_key, book_id: int) -> ColumnElement:
+    """Условие "строки после курсора" для сортировки (ключ, id)"""
+    _, descending, null_key = KEYSET_ORDERS[order]
+
+    # Курсор на книге с NULL: ключ в индексе - значение для NULL
+    value = literal_column(null_key) if sort_key is None else sort_key
+    if descending:
+        return tuple_(_sort_key(order), Book.id) < tuple_(value, book_id)
+    return tuple_(_sort_key(order), Book.id) > tuple_(value, book_id)
+
+
+def cursor_condition(cursor: str, order: str) -> ColumnElement:
+    """
+    Условие "книги после курсора" для сортировки order
+
+    Raises:
+        ValueError: Курсор повреждён или относится к другой сортировке
+    """
+    cursor_order, sort_key, book_id = decode_cursor(cursor)
+    if cursor_order != order:
+        raise ValueError("Курсор пагинации относится к другой сортировке")
+    return _keyset_condition(order, sort_key, book_id)
+
+
+def keyset_order_by(order: str) -> Tuple[ColumnElement, ColumnElement]:
+    """ORDER BY (ключ, id) для сортировки с курсорной пагинацией"""
+    key = _sort_key(order)
+    if KEYSET_ORDERS[order][1]:
+        return key.desc(), Book.id.desc()
+    return key.asc(), Book.id.asc()
+
+
+def next_cursor(books: List[Book], limit: Optional[int], order: str,
+                query: Optional[str] = None) -> Optional[str]:
+    """
+    Курсор следующей страницы (books - книги или строки с id и ключом сортировки)
+
+    Returns:
+        Курсор или None, если страница последняя или сортировка не поддерживает
+        курсоры (релевантность - только offset)
+    """
+    if not books or limit is None or len(books) < limit:
+        return None
+    if order == ORDER_RELEVANCE and query and build_book_search(query) is not None:
+        return None
+    if order == ORDER_RELEVANCE:
+        order = ORDER_RECENT
+    return encode_cursor(books[-1], order)
+
+
+async def search_books(
+    db: AsyncSession,
+    query: Optional[str] = None,
+    sources: Optional[List[str]] = None,
+    min_discount: Optional[int] = None,
+    max_price: Optional[float] = None,
+    order: str = ORDER_RELEVANCE,
+    limit: Optional[int] = None,
+    offset: Optional[int] = None,
+    with_total: bool = True,
+    cursor: Optional[str] = None,
+) -> Tuple[List[Book], Optional[int]]:
+    """
+    Поиск книг с фильтрами, сортировкой и подсчётом за один запрос
+
+    Args:
+        db: Сессия базы данных
+        query: Поисковый запрос (пустой - без поиска, только фильтры)
+        sources: Источники (None или пустой список - все)
+        min_discount: Минимальная скидка в процентах
+        max_price: Максимальная цена
+        order: ORDER_RELEVANCE, ORDER_PRICE, ORDER_RECENT или ORDER_DISCOUNT
+        limit: Размер страницы (None - без ограничения)
+        offset: Смещение страницы (режим совместимости, при cursor игнорируется)
+        with_total: Считать ли общее количество найденных книг
+        cursor: Курсор из next_cursor() - страница сразу после предыдущей
+
+    Returns:
+        Кортеж (books, total). Без with_total total - число книг на странице,
+        с курсором - None (общее количество известно с первой страницы)
+
+    Raises:
+        ValueError: Неизвестная сортировка или курсор не подходит к сортировке
+    """
+    conditions = []
+    rank = None
+
+    if query:
+        book_search = build_book_search(query)
+        if book_search is not None:
+            search_condition, rank = book_search
+            conditions.append(search_condition)
+
+    if sources:
+        conditions.append(Book.source.in_(sources))
+    if min_discount is not None:
+        conditions.append(Book.discount_percent >= min_discount)
+    if max_price is not None:
+        conditions.append(Book.current_price <= max_price)
+
+    order = _resolve_order(order, rank)
+
+    # Курсор: страница читается по индексу (ключ, id) с позиции курсора,
+    # стоимость не зависит от глубины; общее количество не пересчитывается
+    keyset_condition = None
+    if cursor:
+        keyset_condition = cursor_condition(cursor, order)
+        offset = None
+        with_total = False
+
+    # Без фильтров на большой таблице точный count(*) стоит полного прохода
+    estimated_total = None
+    if with_total and not conditions:
+        estimated_total = await _estimated_books_count(db)
+        if estimated_total < ESTIMATED_COUNT_THRESHOLD:
+            estimated_total = None
+
+    count_in_query = with_total and estimated_total is None
+    if count_in_query:
+        stmt = select(Book, func.count().over().label("total"))
+    else:
+        stmt = select(Book)
+
+    if conditions:
+        stmt = stmt.where(*conditions)
+    if keyset_condition is not None:
+        stmt = stmt.where(keyset_condition)
+
+    # Book.id в конце - стабильный порядок страниц при равных ключах
+    if order == ORDER_RELEVANCE:
+        stmt = stmt.order_by(rank.desc(), Book.parsed_at.desc(), Book.id.desc())
+    else:
+        stmt = stmt.order_by(*keyset_order_by(order))
+
+    if offset:
+        stmt = stmt.offset(offset)
+    if limit is not None:
+        stmt = stmt.limit(limit)
+
+    result = await db.execute(stmt)
+
+    if not count_in_query:
+        books = list(result.scalars().all())
+        if cursor:
+            return books, None
+        return books, estimated_total if estimated_total is not None else len(books)
+
+    rows = result.all()
+    books = [row[0] for row in rows]
+    if rows:
+        return books, rows[0].total
+
+    # Страница за концом выдачи: окно пустое, общее количество считаем отдельно
+    if offset:
+        count_stmt = select(func.count()).select_from(Book)
+        if conditions:
+            count_stmt = count_stmt.where(*conditions)
+        count_result = await db.execute(count_stmt)
+        return books, count_result.scalar() or 0
+
+    return books, 0
@@ -0,0 +1,297 @@
+"""
+Пакетное сохранение книг из парсеров
+
+Страница книг сохраняется одним запросом INSERT ... ON CONFLICT (source, source_id)
+DO UPDATE в одной транзакции вместо SELECT + commit на каждую книгу.
+
+Правила обновления совпадают с прежним _save_book:
+- цена, скидка, время парсинга, название, издательство и обложка перезаписываются
+- Wildberries: author и binding не обновляются, при вставке - "Coming soon"
+- жанры и ISBN обновляются, только если парсер их вернул
+- url не меняется
+
+Обнаружение изменений: перед upsert сохранённое состояние пачки читается одним
+запросом. content_hash - отпечаток данных парсера (цены, название, автор,
+издательство, переплёт, обложка, жанры); книги с тем же отпечатком не
+перезаписываются, у них только обновляется last_seen_at (одним UPDATE на
+пачку и не чаще BOOK_TOUCH_INTERVAL). parsed_at поэтому означает время
+последнего изменения данных. Если парсер не вернул жанры (парсинг без
+деталей), отпечаток считается с сохранёнными жанрами - теми, что останутся
+в строке, иначе парсинги с деталями и без них меняли бы его по очереди.
+
+История цен: для новых книг и изменившихся цен в той же транзакции пишутся
+точки book_prices (services/price_history.py). После commit эти же книги
+публикуются как событие для проверки подписок (services/alert_matching.py).
+"""
+
+import os
+import json
+import hashlib
+from datetime import datetime, timedelta
+from typing import Dict, List, Tuple
+
+from sqlalchemy import case, func, literal_column, select, tuple_, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from models import Book as DBBook
+from parsers.base import Book as ParserBook
+from services.logger import celery_logger
+from services import price_history
+from services import alert_matching
+
+# Книг в одном INSERT (ограничение числа параметров запроса PostgreSQL)
+UPSERT_BATCH_SIZE = 500
+
+# Не чаще одного обновления last_seen_at неизменной книги за интервал (сек)
+BOOK_TOUCH_INTERVAL = int(os.getenv("BOOK_TOUCH_INTERVAL", "3600"))
+
+WILDBERRIES_COMING_SOON = "Coming soon"
+
+# Поля строки, входящие в отпечаток content_hash
+_FINGERPRINT_FIELDS = (
+    "current_price", "original_price", "discount_percent",
+    "title", "author", "publisher", "binding", "image_url", "genres",
+)
+
+
+def content_fingerprint(row: Dict) -> str:
+    """Отпечаток данных книги из парсера (md5 нормализованных полей строки)"""
+    values = []
+    for field in _FINGERPRINT_FIELDS:
+        value = row.get(field)
+        if field in ("current_price", "original_price"):
+            value = price_history.money(value)
+        elif isinstance(value, str):
+            value = value.strip()
+        values.append(None if value in (None, "") else str(value))
+    payload = json.dumps(values, ensure_ascii=False, separators=(",", ":"))
+    return hashlib.md5(payload.encode("utf-8")).hexdigest()
+
+
+def _book_row(book: ParserBook, seen_at: datetime) -> Dict:
+    """Строка таблицы books для вставки"""
+    # Для Wildberries не сохраняем author и binding - ставим "Coming soon"
+    is_wildberries = book.source == "wildberries"
+
+    row = {
+        "source": book.source,
+        "source_id": book.source_id,
+        "title": book.title,
+        "author": WILDBERRIES_COMING_SOON if is_wildberries else book.author,
+        "publisher": book.publisher,
+        "binding": WILDBERRIES_COMING_SOON if is_wildberries else book.binding,
+        "current_price": book.current_price,
+        "original_price": book.original_price,
+        "discount_percent": book.discount_percent,
+        "url": book.url,
+        "image_url": book.image_url,
+        # Жанры хранятся JSON строкой
+        "genres": json.dumps(book.genres) if book.genres else None,
+        "isbn": book.isbn or None,
+        "parsed_at": book.parsed_at,
+        "last_seen_at": seen_at,
+    }
+    row["content_hash"] = content_fingerprint(row)
+    return row
+
+
+def _build_upsert(rows: List[Dict]):
+    """INSERT ... ON CONFLICT DO UPDATE для пачки строк"""
+    stmt = pg_insert(DBBook).values(rows)
+    excluded = stmt.excluded
+    is_wildberries = excluded.source == "wildberries"
+
+    return stmt.on_conflict_do_update(
+        index_elements=[DBBook.source, DBBook.source_id],
+        set_={
+            "current_price": excluded.current_price,
+            "original_price": excluded.original_price,
+            "discount_percent": excluded.discount_percent,
+            "parsed_at": excluded.parsed_at,
+            "title": excluded.title,
+            "publisher": excluded.publisher,
+            "image_url": excluded.image_url,
+            # Для ВБ не обновляем author и binding
+            "author": case((is_wildberries, DBBook.author), else_=excluded.author),
+            "binding": case((is_wildberries, DBBook.binding), else_=excluded.binding),
+            "genres": func.coalesce(excluded.genres, DBBook.genres),
+            "isbn": func.coalesce(excluded.isbn, DBBook.isbn),
+            "content_hash": excluded.content_hash,
+            "last_seen_at": excluded.last_seen_at,
+        }
+    ).returning(
+        DBBook.id,
+        DBBook.source,
+        DBBook.source_id,
+        # xmax = 0 только у строки, вставленной этим запросом
+        literal_column("xmax = 0").label("inserted"),
+    )
+
+
+async def _load_saved(db: AsyncSession, rows: List[Dict]) -> Dict[Tuple[str, str], Tuple]:
+    """Сохранённое состояние книг пачки: {(source, source_id): строка id, content_hash, жанры, цены}"""
+    keys = [(row["source"], row["source_id"]) for row in rows]
+    result = await db.execute(
+        select(
+            DBBook.id,
+            DBBook.source,
+            DBBook.source_id,
+            DBBook.content_hash,
+            DBBook.genres,
+            DBBook.current_price,
+            DBBook.original_price,
+            DBBook.discount_percent,
+        ).where(tuple_(DBBook.source, DBBook.source_id).in_(keys))
+    )
+    return {(row.source, row.source_id): row for row in result}
+
+
+async def _touch_books(db: AsyncSession, book_ids: List[int], seen_at: datetime):
+    """Отметка неизменных книг как увиденных (не чаще BOOK_TOUCH_INTERVAL)"""
+    if not book_ids:
+        return
+    touch_before = seen_at - timedelta(seconds=BOOK_TOUCH_INTERVAL)
+    await db.execute(
+        update(DBBook)
+        .where(
+            # Порядок ID - тот же порядок блокировок во всех воркерах
+            DBBook.id.in_(sorted(book_ids)),
+            (DBBook.last_seen_at.is_(None)) | (DBBook.last_seen_at < touch_before),
+        )
+        .values(last_seen_at=seen_at)
+        .execution_options(synchronize_session=False)
+    )
+
+
+async def _save_batch(
+    db: AsyncSession, batch: List[Dict], rows_by_key: Dict, seen_at: datetime
+) -> Tuple[Dict[str, int], List[int]]:
+    """
+    Сохранение пачки строк (без commit)
+
+    Returns:
+        Кортеж (статистика пачки, ID новых книг и книг с изменившейся ценой)
+    """
+    stats = {"inserted": 0, "updated": 0, "unchanged": 0}
+    saved_books = await _load_saved(db, batch)
+
+    changed_rows = []
+    unchanged_ids = []
+    for book_row in batch:
+        saved = saved_books.get((book_row["source"], book_row["source_id"]))
+        if saved is not None and book_row["genres"] is None and saved.genres:
+            # Без жанров в строке останутся сохранённые (coalesce в _build_upsert)
+            book_row["content_hash"] = content_fingerprint({**book_row, "genres": saved.genres})
+        if saved is not None and saved.content_hash == book_row["content_hash"]:
+            unchanged_ids.append(saved.id)
+        else:
+            changed_rows.append(book_row)
+
+    stats["unchanged"] = len(unchanged_ids)
+    await _touch_books(db, unchanged_ids, seen_at)
+    if not changed_rows:
+        return stats, []
+
+    result = await db.execute(_build_upsert(changed_rows))
+    price_entries = []
+    for row in result:
+        if row.inserted:
+            stats["inserted"] += 1
+        else:
+            stats["updated"] += 1
+
+        # Точка истории: новая книга или изменившаяся цена
+        book_row = rows_by_key[(row.source, row.source_id)]
+        entry = price_history.price_entry(
+            row.id,
+            book_row["parsed_at"],
+            book_row["current_price"],
+            book_row["original_price"],
+            book_row["discount_percent"],
+        )
+        saved = saved_books.get((row.source, row.source_id))
+        if saved is None or price_history.price_changed(
+            saved.current_price, saved.original_price, saved.discount_percent, entry
+        ):
+            price_entries.append(entry)
+
+    await price_history.record_prices(db, price_entries)
+    return stats, [entry["book_id"] for entry in price_entries]
+
+
+async def _save_in_savepoint(
+    db: AsyncSession, batch: List[Dict], rows_by_key: Dict, seen_at: datetime
+) -> Tuple[Dict[str, int], List[int]]:
+    """Сохранение пачки в SAVEPOINT: ошибка откатывает только эту пачку"""
+    try:
+        async with db.begin_nested():
+            return await _save_batch(db, batch, rows_by_key, seen_at)
+    except Exception:
+        # Секции истории цен, созданные в откатанном SAVEPOINT, больше не существуют
+        price_history.reset_partition_cache()
+        raise
+
+
+async def upsert_books(db: AsyncSession, books: List[ParserBook]) -> Dict[str, int]:
+    """
+    Сохранение списка книг одной транзакцией
+
+    Каждая пачка сохраняется в своём SAVEPOINT. Если пачка не сохранилась,
+    её книги сохраняются по одной: в failed попадают только ошибочные книги,
+    остальные страницы парсинга не теряются.
+
+    Args:
+        db: Сессия базы данных
+        books: Книги из парсера
+
+    Returns:
+        Словарь {"inserted": новых книг, "updated": изменившихся,
+        "unchanged": без изменений, "failed": не сохранённых}
+    """
+    stats = {"inserted": 0, "updated": 0, "unchanged": 0, "failed": 0}
+    if not books:
+        return stats
+
+    # В одном INSERT строка не может обновиться дважды: оставляем последнюю версию книги
+    seen_at = datetime.now()
+    rows_by_key = {}
+    for book in books:
+        rows_by_key[(book.source, book.source_id)] = _book_row(book, seen_at)
+    # Строки books блокируются в порядке ключа: параллельные парсинги с общими
+    # книгами ждут друг друга, а не ловят deadlock в многострочном INSERT
+    rows = [rows_by_key[key] for key in sorted(rows_by_key)]
+    # Новые книги и книги с изменившейся ценой
+    price_changed_ids = []
+
+    def add_saved(batch_stats: Dict[str, int], changed_ids: List[int]):
+        for key, value in batch_stats.items():
+            stats[key] += value
+        price_changed_ids.extend(changed_ids)
+
+    try:
+        for start in range(0, len(rows), UPSERT_BATCH_SIZE):
+            batch = rows[start:start + UPSERT_BATCH_SIZE]
+            try:
+                add_saved(*await _save_in_savepoint(db, batch, rows_by_key, seen_at))
+                continue
+            except Exception as e:
+                celery_logger.error(f"Ошибка пакетного сохранения {len(batch)} книг, сохраняем по одной: {e}")
+
+            for book_row in batch:
+                try:
+                    add_saved(*await _save_in_savepoint(db, [book_row], rows_by_key, seen_at))
+                except Exception as e:
+                    stats["failed"] += 1
+                    celery_logger.error(
+                        f"Ошибка сохранения книги {book_row['source']}/{book_row['source_id']}: {e}"
+                    )
+        await db.commit()
+    except Exception as e:
+        celery_logger.error(f"Ошибка сохранения {len(rows)} книг: {e}")
+        await db.rollback()
+        price_history.reset_partition_cache()
+        return {"inserted": 0, "updated": 0, "unchanged": 0, "failed": len(rows)}
+
+    alert_matching.publish_price_changes(price_changed_ids)
+    return stats
@@ -1,18 +1,84 @@
 from celery import Celery
+from kombu import Queue
 from celery.schedules import crontab
+from celery.signals import worker_process_init, worker_process_shutdown, worker_shutdown
 import os
 from dotenv import load_dotenv
 
 # Загрузка переменных окружения
 load_dotenv()
 
+# Интервал страховочной проверки подписок (сек), по умолчанию раз в сутки
+SUBSCRIPTIONS_CHECK_INTERVAL = float(os.getenv("SUBSCRIPTIONS_CHECK_INTERVAL", "86400"))
+
+# Очереди задач. Каждую очередь обслуживает свой воркер (docker-compose):
+# - interactive: парсинг по запросу пользователя - асинхронный воркер
+#   (-P threads, services/worker_runtime.py), фоновые задачи его не занимают
+# - notifications: проверка подписок по событиям и отправка уведомлений -
+#   асинхронный воркер
+# - refresh: проверка подписок и сканирование скидок - prefork воркер
+# - maintenance: очистка, обновление токенов и cookies - prefork воркер
+# Приоритет (Redis: 0 - высший) учитывается, если один воркер слушает
+# несколько очередей. Лимиты времени (soft, hard, сек): soft вызывает
+# SoftTimeLimitExceeded в задаче, hard завершает процесс; в асинхронном
+# воркере корутина задачи отменяется по soft лимиту.
+TASK_QUEUES = {
+    'interactive': {'priority': 0, 'soft_time_limit': 240, 'time_limit': 300},
+    'notifications': {'priority': 2, 'soft_time_limit': 600, 'time_limit': 660},
+    'refresh': {'priority': 5, 'soft_time_limit': 7200, 'time_limit': 7500},
+    'maintenance': {'priority': 8, 'soft_time_limit': 1800, 'time_limit': 1900},
+}
+
+# Очередь каждой задачи services.celery_tasks
+TASK_QUEUE_BY_NAME = {
+    'services.celery_tasks.parse_books': 'interactive',
+    'services.celery_tasks.match_price_changes': 'notifications',
+    'services.celery_tasks.send_pending_notifications': 'notifications',
+    'services.celery_tasks.check_all_alerts': 'refresh',
+    'services.celery_tasks.check_alerts_chunk': 'refresh',
+    'services.celery_tasks.summarize_alert_checks': 'refresh',
+    'services.celery_tasks.check_subscriptions_prices': 'refresh',
+    'services.celery_tasks.scan_discounts': 'refresh',
+    'services.celery_tasks.scan_discounts_chunk': 'refresh',
+    'services.celery_tasks.summarize_discount_scan': 'refresh',
+    'services.celery_tasks.update_popular_books': 'refresh',
+    'services.celery_tasks.cleanup_old_logs': 'maintenance',
+    'services.celery_tasks.cleanup_books': 'maintenance',
+    'services.celery_tasks.update_chitai_gorod_token': 'maintenance',
+    'services.celery_tasks.update_wildberries_cookies': 'maintenance',
+    'services.celery_tasks.test_task': 'maintenance',
+    'services.celery_tasks.test_simple': 'maintenance',
+}
+
+# Незарегистрированные в TASK_QUEUE_BY_NAME задачи
+DEFAULT_QUEUE = 'maintenance'
+
+
+def _task_routes() -> dict:
+    """Очередь и приоритет задачи"""
+    return {
+        name: {'queue': queue, 'priority': TASK_QUEUES[queue]['priority']}
+        for name, queue in TASK_QUEUE_BY_NAME.items()
+    }
+
+
+def _task_annotations() -> dict:
+    """Лимиты времени задачи по её очереди"""
+    return {
+        name: {
+            'soft_time_limit': TASK_QUEUES[queue]['soft_time_limit'],
+            'time_limit': TASK_QUEUES[queue]['time_limit'],
+        }
+        for name, queue in TASK_QUEUE_BY_NAME.items()
+    }
+
 # Определяем расписание задач
 CELERY_BEAT_SCHEDULE = {
-    # Проверка цен подписок каждые 4 часа (по book_id - точное совпадение)
-    # ЭТО ЕДИНСТВЕННАЯ задача проверки подписок
-    'check-subscriptions-prices-every-4-hours': {
+    # Страховочная проверка цен подписок (по book_id - точное совпадение).
+    # Основная проверка - по событиям изменения цен (match_price_changes)
+    'check-subscriptions-prices-safety-net': {
         'task': 'services.celery_tasks.check_subscriptions_prices',
-        'schedule': 14400.0,  # 4 часа в секундах
+        'schedule': SUBSCRIPTIONS_CHECK_INTERVAL,
     },
     # Отправка pending уведомлений каждые 15 минут
     'send-pending-notifications-every-15-min': {
@@ -60,6 +126,21 @@ def setup_celery() -> Celery:
         # Настройки для повторных попыток
         task_acks_late=True,
         worker_prefetch_multiplier=1,
+
+        # Очереди, маршруты, приоритеты и лимиты времени (TASK_QUEUES)
+        task_queues=[Queue(name, routing_key=name) for name in TASK_QUEUES],
+        task_default_queue=DEFAULT_QUEUE,
+        task_default_routing_key=DEFAULT_QUEUE,
+        task_routes=_task_routes(),
+        task_annotations=_task_annotations(),
+        task_queue_max_priority=10,
+        task_default_priority=TASK_QUEUES[DEFAULT_QUEUE]['priority'],
+        broker_transport_options={
+            'priority_steps': list(range(10)),
+            'sep': ':',
+            # Воркер нескольких очередей берёт задачи в порядке -Q
+            'queue_order_strategy': 'priority',
+        },
         
         # Логирование
         worker_log_format='[%(asctime)s: %(levelname)s/%(processName)s] %(message)s',
@@ -80,5 +161,31 @@ def setup_celery() -> Celery:
 # Создаем глобальный экземпляр Celery
 celery_app = setup_celery()
 
+
+@worker_process_init.connect
+def init_worker_runtime(**kwargs):
+    """Цикл событий и пулы соединений процесса воркера (services/worker_runtime.py)"""
+    from services.worker_runtime import init_worker_process
+    init_worker_process()
+
+
+@worker_process_shutdown.connect
+@worker_shutdown.connect
+def close_worker_runtime(**kwargs):
+    """
+    Закрытие пулов БД, HTTP и Telegram и цикла при остановке процесса воркера
+    (worker_shutdown - для пула threads, где дочерних процессов нет)
+    """
+    try:
+        from services.worker_runtime import shutdown_worker_process
+        shutdown_worker_process()
+    except Exception:
+        pass
+    try:
+        from services.http_pool import close_http_sessions_sync
+        close_http_sessions_sync()
+    except Exception:
+        pass
+
 if __name__ == "__main__":
     celery_app.start()
@@ -4,11 +4,10 @@ from services.logger import celery_logger
 from database.config import get_session_factory, AsyncSession
 from models import Alert, Book as DBBook, Notification, User, ParsingLog
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, and_, or_
+from sqlalchemy import select, update, and_, or_
 from datetime import datetime, timedelta
 import asyncio
 import traceback
-import json
 import os
 import sys
 import time
@@ -19,8 +18,9 @@ from parsers.base import Book as ParserBook
 # Импортируем celery_app после создания, чтобы избежать циклического импорта
 from services.celery_app import celery_app
 
-# Глобальная переменная для хранения фабрики сессий в Celery задачах
-_task_session_factory = None
+# Корутины задач выполняются в event loop процесса воркера: пулы БД, HTTP и
+# Telegram переиспользуются между задачами
+from services.worker_runtime import async_task
 
 # Импортируем утилиты умного поиска
 from services.search_utils import (
@@ -33,30 +33,50 @@ from services.search_utils import (
     PARSE_LIMIT_LOADED
 )
 
+# Поиск книг в БД по индексам
+from services.book_search import search_books, search_words, ORDER_RELEVANCE
+from services import price_history
+from services import alert_matching
+
+# Подписок в одной части проверки check_all_alerts
+ALERT_CHECK_CHUNK_SIZE = int(os.getenv("ALERT_CHECK_CHUNK_SIZE", "20"))
+# Поисковых запросов в одной части сканирования скидок
+DISCOUNT_SCAN_CHUNK_SIZE = int(os.getenv("DISCOUNT_SCAN_CHUNK_SIZE", "2"))
+
+
+def _chunks(items: list, size: int) -> List[list]:
+    """Разбиение списка на части по size элементов"""
+    size = max(size, 1)
+    return [items[i:i + size] for i in range(0, len(items), size)]
+
+
 @celery_app.task(bind=True, autoretry_for=(Exception,), retry_kwargs={'max_retries': 3})
 def check_all_alerts(self):
-    """Проверка всех активных подписок пользователей с реальным парсером"""
+    """
+    Проверка всех активных подписок пользователей с реальным парсером
     
-    def run_async_task():
-        """Запуск асинхронной задачи в синхронном контексте Celery"""
-        # Импортируем внутри функции, чтобы избежать проблем с асинхронным движком
-        from database.config import get_session_factory
-        
-        # Сохраняем фабрику в глобальной переменной для использования в async функциях
-        global _task_session_factory
-        _task_session_factory = get_session_factory()
-        
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-        try:
-            return loop.run_until_complete(_check_all_alerts_async())
-        finally:
-            loop.close()
+    Координатор: подписки делятся на части по ALERT_CHECK_CHUNK_SIZE, части
+    проверяются параллельно задачами check_alerts_chunk (chord), статистику
+    собирает summarize_alert_checks.
+    """
+    from celery import chord
     
+    @async_task
+    async def run_async_task():
+        return await _active_alert_ids()
+
     try:
-        result = run_async_task()
-        celery_logger.info(f"Проверка подписок завершена. Найдено книг: {result}")
-        return result
+        alert_ids = run_async_task()
+        if not alert_ids:
+            celery_logger.info("Нет активных подписок для проверки")
+            return {"alerts": 0, "chunks": 0}
+        
+        chunks = _chunks(alert_ids, ALERT_CHECK_CHUNK_SIZE)
+        chord(check_alerts_chunk.s(chunk) for chunk in chunks)(
+            summarize_alert_checks.s(total=len(alert_ids), started_at=time.time())
+        )
+        celery_logger.info(f"Проверка подписок запущена: {len(alert_ids)} подписок, {len(chunks)} частей")
+        return {"alerts": len(alert_ids), "chunks": len(chunks)}
     except Exception as e:
         celery_logger.error(f"Ошибка при проверке подписок: {e}")
         celery_logger.error(traceback.format_exc())
@@ -65,189 +85,240 @@ def check_all_alerts(self):
 # Регистрируем задачу
 check_all_alerts_task = celery_app.task(check_all_alerts, bind=True, autoretry_for=(Exception,), retry_kwargs={'max_retries': 3})
 
-async def _check_all_alerts_async():
-    """Асинхронная функция проверки подписок с реальным парсингом"""
+async def _active_alert_ids() -> List[int]:
+    """ID активных подписок"""
+    session_factory = get_session_factory()
+    async with session_factory() as db:
+        result = await db.execute(
+            select(Alert.id).where(Alert.is_active == True).order_by(Alert.id)
+        )
+        return list(result.scalars().all())
+
+
+@celery_app.task(bind=True, max_retries=3)
+def check_alerts_chunk(self, alert_ids: List[int]):
+    """
+    Проверка части подписок
     
-    # Запоминаем время начала
-    task_start_time = time.time()
+    Повтор продолжает с контрольной точки (services/task_checkpoint.py).
+    Если попытки исчерпаны, возвращается статистика с ошибкой - chord
+    не прерывается из-за одной части.
+    """
+    from services.task_checkpoint import ChunkCheckpoint
+    
+    @async_task
+    async def run_async_task():
+        checkpoint = await ChunkCheckpoint(self.request.id).load()
+        await _check_alerts_chunk_async(alert_ids, checkpoint)
+        await checkpoint.clear()
+        return checkpoint.result()
+
+    try:
+        return run_async_task()
+    except Exception as e:
+        celery_logger.error(f"Ошибка проверки части подписок {alert_ids[0]}..{alert_ids[-1]}: {e}")
+        if self.request.retries < self.max_retries:
+            raise self.retry(countdown=60, exc=e)
+        return {"failed": len(alert_ids), "errors": [f"Подписки {alert_ids[0]}..{alert_ids[-1]}: {e}"]}
+
+
+@celery_app.task
+def summarize_alert_checks(results: List[Dict], total: int, started_at: float):
+    """Callback chord проверки подписок: общая статистика в Telegram"""
+    stats: Dict[str, int] = {}
+    errors: List[str] = []
+    for result in results:
+        for key, value in result.items():
+            if key == "errors":
+                errors.extend(value)
+            else:
+                stats[key] = stats.get(key, 0) + value
+    
+    books_found = stats.get("matched", 0)
+    deactivated_count = stats.get("deactivated", 0)
+    celery_logger.info(
+        f"Проверка подписок завершена: проверено {stats.get('checked', 0)} из {total}, "
+        f"найдено {books_found} книг, создано {stats.get('notifications_created', 0)} уведомлений"
+    )
     
-    # Используем фабрику, установленную в run_async_task
-    session_factory = _task_session_factory
+    # Отправляем статистику в Telegram
+    try:
+        from services.token_manager import TokenManager
+        token_manager = TokenManager()
+        token_manager.send_subscriptions_check_notification(
+            total_checked=total,
+            active_count=total - deactivated_count,
+            matched_count=books_found,
+            deactivated_count=deactivated_count,
+            notifications_sent=stats.get("notifications_sent", 0),
+            duration_seconds=time.time() - started_at,
+            errors="\n".join(errors[:10]) if errors else None
+        )
+    except Exception as e:
+        celery_logger.error(f"Ошибка отправки статистики: {e}")
+    
+    return books_found
+
+
+def _alert_parsers():
+    """Парсеры Читай-города и WB для проверки подписок"""
+    try:
+        import sys
+        import os
+        # Добавляем корневую папку в PYTHONPATH
+        current_dir = os.path.dirname(os.path.abspath(__file__))
+        root_dir = os.path.dirname(os.path.dirname(current_dir))
+        if root_dir not in sys.path:
+            sys.path.append(root_dir)
+        
+        from parsers.chitai_gorod import ChitaiGorodParser
+        from parsers.wildberries import WildberriesParser
+        return ChitaiGorodParser(), WildberriesParser()
+    except ImportError as e:
+        celery_logger.warning(f"Не удалось импортировать парсеры: {e}")
+        # Создаем заглушку для демонстрации
+        return MockParser(), MockParser()
+
+
+async def _check_alerts_chunk_async(alert_ids: List[int], checkpoint):
+    """Асинхронная проверка части подписок с реальным парсингом"""
+    
+    session_factory = get_session_factory()
     async with session_factory() as db:
-        try:
-            # Получаем все активные подписки
-            result = await db.execute(
-                select(Alert).where(Alert.is_active == True)
-            )
-            alerts = result.scalars().all()
-            
-            if not alerts:
-                celery_logger.info("Нет активных подписок для проверки")
-                return 0
-            
-            # Импортируем парсеры
-            try:
-                import sys
-                import os
-                # Добавляем корневую папку в PYTHONPATH
-                current_dir = os.path.dirname(os.path.abspath(__file__))
-                root_dir = os.path.dirname(os.path.dirname(current_dir))
-                if root_dir not in sys.path:
-                    sys.path.append(root_dir)
-                
-                from parsers.chitai_gorod import ChitaiGorodParser
-                from parsers.wildberries import WildberriesParser
-                chitai_parser = ChitaiGorodParser()
-                wb_parser = WildberriesParser()
-            except ImportError as e:
-                celery_logger.warning(f"Не удалось импортировать парсеры: {e}")
-                # Создаем заглушку для демонстрации
-                chitai_parser = MockParser()
-                wb_parser = MockParser()
-            
-            books_found = 0
-            notifications_created = 0
-            notifications_sent = 0
-            deactivated_count = 0
-            
-            for alert in alerts:
-                try:
-                    # Выбираем парсер на основе источника книги в подписке
-                    source = alert.book_source if alert.book_source else "chitai-gorod"
-                    if source == "wildberries":
-                        parser = wb_parser
-                        celery_logger.info(f"Используем парсер WB для подписки {alert.id}")
-                    else:
-                        parser = chitai_parser
-                        celery_logger.info(f"Используем парсер Chitai-Gorod для подписки {alert.id}")
-                    
-                    # Если есть URL книги - парсим её напрямую
-                    books = []
-                    if alert.book_url:
-                        celery_logger.info(f"Парсим конкретную книгу по URL для подписки {alert.id}: {alert.book_url}")
-                        try:
-                            # Парсим книгу по URL
-                            book = await parser.get_book_details(alert.book_url)
-                            if book:
-                                # Конвертируем Book в ParserBook
-                                from dataclasses import replace
-                                parser_book = ParserBook(
-                                    source=source,
-                                    source_id=book.source_id or "",
-                                    title=book.title or "",
-                                    author=book.author or "",
-                                    publisher=book.publisher,
-                                    binding=book.binding,
-                                    current_price=book.current_price or 0,
-                                    original_price=book.original_price or 0,
-                                    discount_percent=book.discount_percent or 0,
-                                    url=book.url or "",
-                                    image_url=book.image_url or "",
-                                    genres=book.genres,
-                                    isbn=book.isbn,
-                                    parsed_at=datetime.now()
-                                )
-                                books = [parser_book]
-                                celery_logger.info(f"Получена книга по URL: {book.title} - {book.current_price} руб.")
-                        except Exception as e:
-                            celery_logger.error(f"Ошибка парсинга книги по URL: {e}")
-                            # Если не удалось распарсить по URL, пробуем поиск по названию
-                            books = []
-                    
-                    # Если книга не найдена по URL или URL нет - ищем по названию
-                    if not books:
-                        # Формируем запрос для поиска
-                        search_query = alert.book_title
-                        if alert.book_author:
-                            search_query += f" {alert.book_author}"
-                        
-                        celery_logger.info(f"Поиск книг для подписки {alert.id}: '{search_query}' (источник: {source})")
-                        
-                        # Реальный поиск книг (только по нужному источнику)
-                        all_books = await parser.search_books(search_query)
-                        
-                        # Фильтруем книги только по нужному источнику
-                        books = [b for b in all_books if b.source == source]
-                    
-                    if not books:
-                        celery_logger.info(f"Книги не найдены для запроса: {search_query}")
-                        continue
-                    
-                    # Фильтруем книги по условиям подписки
-                    suitable_books = []
-                    for book in books:
-                        if await _is_book_suitable_for_alert(book, alert):
-                            suitable_books.append(book)
-                    
-                    if suitable_books:
-                        # Берем лучшую книгу (с максимальной скидкой)
-                        best_book = max(suitable_books, key=lambda x: x.discount_percent or 0)
-                        
-                        # Проверяем, не отправляли ли мы уже уведомление для этой книги
-                        celery_logger.info(f"Проверяем, было ли уведомление для книги: {best_book.title}")
-                        was_sent = await _was_notification_sent_recently(db, alert.id, best_book.title)
-                        celery_logger.info(f"Результат проверки: was_sent={was_sent}")
-                        
-                        if not was_sent:
-                            
-                            # Сохраняем книгу в БД
-                            await _save_book(db, best_book)
-                            
-                            # Добавляем в Google Sheets
-                            await _add_to_sheets(best_book)
-                            
-                            # Создаем уведомление
-                            celery_logger.info(f"Создаём уведомление для книги: {best_book.title}")
-                            notification = await _create_notification(db, alert, best_book)
-                            if notification:
-                                notifications_created += 1
-                                
-                                # Отправляем уведомление через Telegram
-                                send_success = await _send_telegram_notification(alert.user_id, best_book, alert, notification.id)
-                                if send_success:
-                                    notifications_sent += 1
-                                    deactivated_count += 1
-                            
-                            books_found += 1
-                            celery_logger.info(f"Найдена подходящая книга: {best_book.title} - {best_book.current_price}₽ (скидка {best_book.discount_percent}%)")
-                        
-                    else:
-                        celery_logger.info(f"Нет подходящих книг для подписки {alert.id}")
-                    
-                    # Задержка между запросами для вежливого парсинга
-                    await asyncio.sleep(2)
-                    
-                except Exception as e:
-                    celery_logger.error(f"Ошибка обработки подписки {alert.id}: {e}")
-                    continue
-            
-            # Логируем результат
-            await _log_parsing_result(db, "alert_check", "success", 
-                                    f"Проверено {len(alerts)} подписок, найдено {books_found} книг, создано {notifications_created} уведомлений")
-            
-            # Отправляем статистику в Telegram
+        result = await db.execute(
+            select(Alert).where(Alert.id.in_(alert_ids), Alert.is_active == True).order_by(Alert.id)
+        )
+        alerts = [alert for alert in result.scalars().all() if alert.id not in checkpoint.done]
+        
+        chitai_parser, wb_parser = _alert_parsers()
+        
+        for alert in alerts:
             try:
-                from services.token_manager import TokenManager
-                token_manager = TokenManager()
-                active_alerts = len([a for a in alerts if a.is_active])
-                execution_time = time.time() - task_start_time
-                token_manager.send_subscriptions_check_notification(
-                    total_checked=len(alerts),
-                    active_count=active_alerts,
-                    matched_count=books_found,
-                    deactivated_count=deactivated_count,
-                    notifications_sent=notifications_sent,
-                    duration_seconds=execution_time
-                )
+                await _check_alert(db, alert, chitai_parser, wb_parser, checkpoint)
             except Exception as e:
-                celery_logger.error(f"Ошибка отправки статистики: {e}")
-            
-            return books_found
-            
+                celery_logger.error(f"Ошибка обработки подписки {alert.id}: {e}")
+                checkpoint.errors.append(f"Подписка {alert.id}: {e}")
+            checkpoint.add("checked")
+            await checkpoint.mark_done(alert.id)
+        
+        # Логируем результат
+        await _log_parsing_result(db, "alert_check", "success", 
+                                f"Проверено {len(alerts)} подписок, найдено {checkpoint.stats.get('matched', 0)} книг")
+
+
+async def _check_alert(db: AsyncSession, alert: Alert, chitai_parser, wb_parser, checkpoint):
+    """Проверка одной подписки: поиск книги, уведомление и деактивация"""
+    
+    # Выбираем парсер на основе источника книги в подписке
+    source = alert.book_source if alert.book_source else "chitai-gorod"
+    if source == "wildberries":
+        parser = wb_parser
+        celery_logger.info(f"Используем парсер WB для подписки {alert.id}")
+    else:
+        parser = chitai_parser
+        celery_logger.info(f"Используем парсер Chitai-Gorod для подписки {alert.id}")
+    
+    # Формируем запрос для поиска
+    search_query = alert.book_title
+    if alert.book_author:
+        search_query += f" {alert.book_author}"
+    
+    # Если есть URL книги - парсим её напрямую
+    books = []
+    if alert.book_url:
+        celery_logger.info(f"Парсим конкретную книгу по URL для подписки {alert.id}: {alert.book_url}")
+        try:
+            # Парсим книгу по URL
+            book = await parser.get_book_details(alert.book_url)
+            if book:
+                # Конвертируем Book в ParserBook
+                parser_book = ParserBook(
+                    source=source,
+                    source_id=book.source_id or "",
+                    title=book.title or "",
+                    author=book.author or "",
+                    publisher=book.publisher,
+                    binding=book.binding,
+                    current_price=book.current_price or 0,
+                    original_price=book.original_price or 0,
+                    discount_percent=book.discount_percent or 0,
+                    url=book.url or "",
+                    image_url=book.image_url or "",
+                    genres=book.genres,
+                    isbn=book.isbn,
+                    parsed_at=datetime.now()
+                )
+                books = [parser_book]
+                celery_logger.info(f"Получена книга по URL: {book.title} - {book.current_price} руб.")
         except Exception as e:
-            celery_logger.error(f"Критическая ошибка при проверке подписок: {e}")
-            await _log_parsing_result(db, "alert_check", "error", str(e))
-            raise
+            celery_logger.error(f"Ошибка парсинга книги по URL: {e}")
+            # Если не удалось распарсить по URL, пробуем поиск по названию
+            books = []
+    
+    # Если книга не найдена по URL или URL нет - ищем по названию
+    if not books:
+        celery_logger.info(f"Поиск книг для подписки {alert.id}: '{search_query}' (источник: {source})")
+        
+        # Реальный поиск книг (только по нужному источнику)
+        all_books = await parser.search_books(search_query)
+        
+        # Фильтруем книги только по нужному источнику
+        books = [b for b in all_books if b.source == source]
+    
+    if not books:
+        celery_logger.info(f"Книги не найдены для запроса: {search_query}")
+        return
+    
+    # Фильтруем книги по условиям подписки
+    suitable_books = []
+    for book in books:
+        if await _is_book_suitable_for_alert(book, alert):
+            suitable_books.append(book)
+    
+    if not suitable_books:
+        celery_logger.info(f"Нет подходящих книг для подписки {alert.id}")
+        return
+    
+    # Берем лучшую книгу (с максимальной скидкой)
+    best_book = max(suitable_books, key=lambda x: x.discount_percent or 0)
+    
+    # Проверяем, не отправляли ли мы уже уведомление для этой книги
+    celery_logger.info(f"Проверяем, было ли уведомление для книги: {best_book.title}")
+    was_sent = await _was_notification_sent_recently(db, alert.id, best_book.title)
+    celery_logger.info(f"Результат проверки: was_sent={was_sent}")
+    
+    if was_sent:
+        return
+    
+    # Сохраняем книгу в БД
+    await _save_book(db, best_book)
+    
+    # Добавляем в Google Sheets
+    await _add_to_sheets(best_book)
+
+    # Сохранение книги публикует событие изменения цены: подписку могла уже
+    # обработать match_price_changes. Уведомляет тот, кто деактивировал подписку
+    # (условный UPDATE); деактивация фиксируется вместе с уведомлением
+    if not await alert_matching.claim_alerts(db, [alert]):
+        celery_logger.info(f"Подписка {alert.id} уже обработана по событию изменения цены")
+        await db.commit()
+        return
+
+    # Создаем уведомление
+    celery_logger.info(f"Создаём уведомление для книги: {best_book.title}")
+    notification = await _create_notification(db, alert, best_book)
+    if notification:
+        checkpoint.add("notifications_created")
+        await alert_matching.publish_alert_changes([alert.id])
+
+        # Отправляем уведомление через Telegram
+        send_success = await _send_telegram_notification(alert.user_id, best_book, alert, notification.id)
+        if send_success:
+            checkpoint.add("notifications_sent")
+            checkpoint.add("deactivated")
+    
+    checkpoint.add("matched")
+    celery_logger.info(f"Найдена подходящая книга: {best_book.title} - {best_book.current_price}₽ (скидка {best_book.discount_percent}%)")
  
 async def _is_book_suitable_for_alert(book: ParserBook, alert: Alert) -> bool:
     """Проверка, подходит ли книга под условия подписки"""
@@ -269,27 +340,10 @@ async def _is_book_suitable_for_alert(book: ParserBook, alert: Alert) -> bool:
         celery_logger.info(f"  ❌ Отклонено: скидка {book.discount_percent}% < min_discount {alert.min_discount}%")
         return False
     
-    # Проверка соответствия запросу (гибкое сравнение)
-    if alert.book_title:
-        query_words = set(alert.book_title.lower().split())
-        book_title_lower = book.title.lower()
-        
-        # Убираем знаки препинания из названия книги
-        import re
-        book_title_clean = re.sub(r'[^\w\s]', '', book_title_lower)
-        book_words = set(book_title_clean.split())
-        
-        # Проверяем, есть ли хотя бы 50% слов из запроса в названии книги
-        matching_words = query_words & book_words
-        match_ratio = len(matching_words) / len(query_words) if query_words else 0
-        
-        celery_logger.info(f"  📝 Слова запроса: {query_words}")
-        celery_logger.info(f"  📝 Слова книги: {book_words}")
-        celery_logger.info(f"  📝 Совпадения: {matching_words} (совпадение {match_ratio*100:.0f}%)")
-        
-        if match_ratio < 0.5:  # Требуем минимум 50% совпадения
-            celery_logger.info(f"  ❌ Отклонено: недостаточно совпадений слов")
-            return False
+    # Проверка соответствия запросу (не меньше 50% слов подписки в названии книги)
+    if alert.book_title and not alert_matching.title_matches(alert, book):
+        celery_logger.info(f"  ❌ Отклонено: недостаточно совпадений слов")
+        return False
     
     celery_logger.info(f"  ✅ Книга подходит под условия подписки!")
     return True
@@ -322,79 +376,18 @@ async def _was_notification_sent_recently(db, alert_id: int, book_title: str) ->
     return False
 
 async def _save_book(db: AsyncSession, book: ParserBook):
-    """Сохранение книги в базу данных"""
-    
-    try:
-        # Для Wildberries не сохраняем author и binding - ставим "Coming soon"
-        is_wildberries = book.source == "wildberries"
-        coming_soon = "Coming soon"
-        
-        # Проверяем, существует ли книга
-        result = await db.execute(
-            select(DBBook).where(
-                and_(DBBook.source == book.source, DBBook.source_id == book.source_id)
-            )
-        )
-        existing_book = result.scalar_one_or_none()
-        
-        if existing_book:
-            # Обновляем существующую книгу
-            existing_book.current_price = book.current_price
-            existing_book.original_price = book.original_price
-            existing_book.discount_percent = book.discount_percent
-            existing_book.parsed_at = book.parsed_at
-            
-            # Обновляем дополнительные поля если они изменились
-            if book.title != existing_book.title:
-                existing_book.title = book.title
-            # Для ВБ не обновляем author и binding
-            if not is_wildberries and book.author != existing_book.author:
-                existing_book.author = book.author
-            if book.publisher != existing_book.publisher:
-                existing_book.publisher = book.publisher
-            # Для ВБ не обновляем binding
-            if not is_wildberries and book.binding != existing_book.binding:
-                existing_book.binding = book.binding
-            if book.image_url != existing_book.image_url:
-                existing_book.image_url = book.image_url
-                
-            # Обновляем жанры если они есть
-            if book.genres:
-                genres_json = json.dumps(book.genres)
-                existing_book.genres = genres_json
-
-            # Обновляем ISBN если он есть
-            if book.isbn:
-                existing_book.isbn = book.isbn
-                
-        else:
-            # Создаем новую книгу
-            # Преобразуем genres в JSON строку для сохранения в БД
-            genres_json = json.dumps(book.genres) if book.genres else None
-            
-            db_book = DBBook(
-                source=book.source,
-                source_id=book.source_id,
-                title=book.title,
-                author=coming_soon if is_wildberries else book.author,
-                publisher=book.publisher,
-                binding=coming_soon if is_wildberries else book.binding,
-                current_price=book.current_price,
-                original_price=book.original_price,
-                discount_percent=book.discount_percent,
-                url=book.url,
-                image_url=book.image_url,
-                genres=genres_json,
-                isbn=book.isbn,
-                parsed_at=book.parsed_at
-            )
-            db.add(db_book)
-        
-        await db.commit()
-        
-    except Exception as e:
-        celery_logger.error(f"Ошибка сохранения книги: {e}")
-        await db.rollback()
+    """Сохранение одной книги в базу данных (для нескольких книг - _save_books)"""
+    return await _save_books(db, [book])
+
+async def _save_books(db: AsyncSession, books: List[ParserBook]) -> Dict[str, int]:
+    """
+    Пакетное сохранение книг в базу данных (один INSERT ... ON CONFLICT на пачку)
+
+    Returns:
+        Словарь {"inserted", "updated", "unchanged", "failed"}
+    """
+    from services.book_upsert import upsert_books
+    return await upsert_books(db, books)
 
 async def _add_to_sheets(book: ParserBook):
     """Добавление книги в Google Sheets (устарело - используй _add_to_sheets_batch)"""
@@ -402,6 +395,15 @@ async def _add_to_sheets(book: ParserBook):
     await _add_to_sheets_batch([book])
 
 
+def _add_to_sheets_sync(books: List[ParserBook], max_books: int):
+    """Запись в Google Sheets в текущем (не event loop) потоке"""
+    from services.sheets_manager import SheetManager
+    sheets_manager = SheetManager()
+    # Передаём весь список - метод сам выберет топ-5 дешёвых; внутри метода
+    # нет асинхронного I/O, поэтому хватает временного цикла потока
+    return asyncio.run(sheets_manager.add_books_batch(books, max_books=max_books))
+
+
 async def _add_to_sheets_batch(books: List[ParserBook], max_books: int = 5):
     """
     Добавление книг в Google Sheets (только топ-N самых дешёвых)
@@ -411,10 +413,9 @@ async def _add_to_sheets_batch(books: List[ParserBook], max_books: int = 5):
         max_books: Максимальное количество книг для добавления (по умолчанию 5)
     """
     try:
-        from services.sheets_manager import SheetManager
-        sheets_manager = SheetManager()
-        # Передаём весь список - метод сам выберет топ-5 дешёвых
-        await sheets_manager.add_books_batch(books, max_books=max_books)
+        # Клиент Google API синхронный: запись в отдельном потоке не блокирует
+        # event loop, общий для задач процесса (services/worker_runtime.py)
+        await asyncio.to_thread(_add_to_sheets_sync, books, max_books)
     except Exception as e:
         celery_logger.error(f"Ошибка добавления в Google Sheets: {e}")
         # Не прерываем выполнение из-за ошибки с Sheets
@@ -468,116 +469,69 @@ async def _send_telegram_notification(user_id: int, book: ParserBook, alert: Ale
     """Отправка уведомления через Telegram Bot
     Returns: True если уведомление успешно отправлено, False в противном случае
     """
-
-    try:
-        from app.bot.telegram_bot import TelegramBot
-        bot = TelegramBot()
-        
-        # Получаем telegram_id пользователя из БД
-        session_factory = get_session_factory()
-        async with session_factory() as db:
-            result = await db.execute(select(User).where(User.id == user_id))
-            user = result.scalar_one_or_none()
-            
-            if not user or not user.telegram_id:
-                celery_logger.error(f"❌ У пользователя {user_id} нет telegram_id")
-                if notification_id:
-                    await _mark_notification_failed(notification_id, "No telegram_id")
-                return False
-            
-            telegram_id = user.telegram_id
-            celery_logger.info(f"📱 Отправляем уведомление пользователю telegram_id={telegram_id}")
-        
-        # Формируем сообщение
-        message = f"📚 <b>Найдена книга по вашей подписке!</b>\n\n"
-        message += f"📖 <b>{book.title}</b>\n"
-        if book.author:
-            message += f"👤 Автор: {book.author}\n"
-        message += f"💰 Цена: <b>{book.current_price} руб.</b>\n"
-        if book.original_price and book.original_price > book.current_price:
-            message += f"💸 Старая цена: <s>{book.original_price} руб.</s>\n"
-        if book.discount_percent:
-            message += f"🔥 Скидка: <b>{book.discount_percent}%</b>\n"
-        message += f"\n🔗 <a href='{book.url}'>Ссылка на книгу</a>"
-        
-        if alert.target_price:
-            message += f"\n\n✅ Цена соответствует вашему лимиту ({alert.target_price} руб.)"
-        
-        # Отправляем сообщение
-        await bot.send_message(telegram_id, message)
-        
-        celery_logger.info(f"✅ Уведомление отправлено пользователю telegram_id={telegram_id} для книги {book.title}")
-        
-        # Обновляем статус уведомления в БД если есть ID
-        if notification_id:
-            await _mark_notification_sent(notification_id)
-        
-        # Деактивируем подписку после успешного уведомления
-        try:
-            session_factory = get_session_factory()
-            async with session_factory() as db:
-                # Получаем alert заново в новой сессии
-                alert_result = await db.execute(select(Alert).where(Alert.id == alert.id))
-                alert_to_deactivate = alert_result.scalar_one_or_none()
-                
-                if alert_to_deactivate and alert_to_deactivate.is_active:
-                    alert_to_deactivate.is_active = False
-                    await db.commit()
-                    celery_logger.info(f"✅ Подписка {alert.id} деактивирована после успешного уведомления")
-        except Exception as e:
-            celery_logger.error(f"Ошибка деактивации подписки: {e}")
-        
-        return True
-        
-    except Exception as e:
-        celery_logger.error(f"❌ Ошибка отправки Telegram уведомления: {e}")
-        # Обновляем статус ошибки если есть ID
-        if notification_id:
-            await _mark_notification_failed(notification_id, str(e))
-        return False
-
-
-async def _mark_notification_sent(notification_id: int):
-    """Отметка уведомления как отправленного"""
+    from services import notification_delivery as delivery
+
+    message = delivery.book_message(
+        title=book.title,
+        author=book.author,
+        current_price=book.current_price,
+        url=book.url,
+        original_price=book.original_price,
+        discount_percent=book.discount_percent,
+        target_price=alert.target_price if alert else None,
+    )
+    
+    # Поиск пользователя, статус уведомления и деактивация подписки - в одной сессии
     session_factory = get_session_factory()
     async with session_factory() as db:
         try:
-            result = await db.execute(
-                select(Notification).where(Notification.id == notification_id)
-            )
-            notification = result.scalar_one_or_none()
+            telegram_id = (await db.execute(
+                select(User.telegram_id).where(User.id == user_id)
+            )).scalar_one_or_none()
+            
+            if not telegram_id:
+                celery_logger.error(f"❌ У пользователя {user_id} нет telegram_id")
+                result = delivery.DeliveryResult(
+                    delivery.OutboundMessage(0, message, notification_id), False, error="No telegram_id"
+                )
+            else:
+                celery_logger.info(f"📱 Отправляем уведомление пользователю telegram_id={telegram_id}")
+                result = (await delivery.send_messages(
+                    [delivery.OutboundMessage(telegram_id, message, notification_id)]
+                ))[0]
+            
+            await delivery.record_results(db, [result])
+            
+            # Деактивируем подписку после успешного уведомления
+            if result.sent and alert:
+                await db.execute(
+                    update(Alert)
+                    .where(Alert.id == alert.id, Alert.is_active == True)
+                    .values(is_active=False, updated_at=datetime.now())
+                    .execution_options(synchronize_session=False)
+                )
+            await db.commit()
+            if result.sent and alert:
+                await alert_matching.publish_alert_changes([alert.id])
+            
+            if result.sent:
+                celery_logger.info(f"✅ Уведомление отправлено пользователю telegram_id={telegram_id} для книги {book.title}")
+            else:
+                celery_logger.error(f"❌ Ошибка отправки Telegram уведомления: {result.error}")
+            return result.sent
             
-            if notification:
-                notification.status = "sent"
-                notification.is_sent = True
-                notification.sent_at = datetime.now()
-                await db.commit()
-                celery_logger.info(f"✅ Уведомление {notification_id} помечено как отправленное")
         except Exception as e:
-            celery_logger.error(f"Ошибка обновления статуса уведомления: {e}")
+            celery_logger.error(f"❌ Ошибка отправки Telegram уведомления: {e}")
             await db.rollback()
+            # Обновляем статус ошибки если есть ID
+            if notification_id:
+                await delivery.record_results(db, [delivery.DeliveryResult(
+                    delivery.OutboundMessage(0, message, notification_id), False, error=str(e)
+                )])
+                await db.commit()
+            return False
 
 
-async def _mark_notification_failed(notification_id: int, error_message: str):
-    """Отметка уведомления как неудачного"""
-    session_factory = get_session_factory()
-    async with session_factory() as db:
-        try:
-            result = await db.execute(
-                select(Notification).where(Notification.id == notification_id)
-            )
-            notification = result.scalar_one_or_none()
-            
-            if notification:
-                notification.status = "failed"
-                notification.error_message = error_message
-                notification.retry_count += 1
-                await db.commit()
-                celery_logger.info(f"❌ Уведомление {notification_id} помечено как неудачное")
-        except Exception as e:
-            celery_logger.error(f"Ошибка обновления статуса уведомления: {e}")
-            await db.rollback()
-        
 async def _log_parsing_result(db: AsyncSession, source: str, status: str, message: str):
     """Логирование результата парсинга"""
     
@@ -596,14 +550,10 @@ async def _log_parsing_result(db: AsyncSession, source: str, status: str, messag
 def cleanup_old_logs():
     """Очистка старых логов парсинга"""
     
-    def run_async_task():
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-        try:
-            return loop.run_until_complete(_cleanup_old_logs_async())
-        finally:
-            loop.close()
-    
+    @async_task
+    async def run_async_task():
+        return await _cleanup_old_logs_async()
+
     try:
         result = run_async_task()
         celery_logger.info(f"Очистка логов завершена. Удалено записей: {result}")
@@ -613,99 +563,6 @@ def cleanup_old_logs():
         raise
 
 
-@celery_app.task(bind=True, autoretry_for=(Exception,), retry_kwargs={'max_retries': 3})
-def send_pending_notifications(self):
-    """Отправка уведомлений со статусом 'pending'"""
-    
-    def run_async_task():
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-        try:
-            return loop.run_until_complete(_send_pending_notifications_async())
-        finally:
-            loop.close()
-    
-    try:
-        result = run_async_task()
-        celery_logger.info(f"Отправка pending-уведомлений завершена. Отправлено: {result}")
-        return result
-    except Exception as e:
-        celery_logger.error(f"Ошибка при отправке pending-уведомлений: {e}")
-        celery_logger.error(traceback.format_exc())
-        raise
-
-
-async def _send_pending_notifications_async():
-    """Асинхронная отправка pending уведомлений"""
-    
-    session_factory = get_session_factory()
-    async with session_factory() as db:
-        try:
-            # Получаем все уведомления со статусом 'pending'
-            result = await db.execute(
-                select(Notification).where(Notification.status == "pending")
-            )
-            pending_notifications = result.scalars().all()
-            
-            if not pending_notifications:
-                celery_logger.info("Нет pending уведомлений для отправки")
-                return 0
-            
-            celery_logger.info(f"Начинаем отправку {len(pending_notifications)} pending уведомлений")
-            
-            sent_count = 0
-            failed_count = 0
-            
-            for notification in pending_notifications:
-                try:
-                    # Получаем пользователя
-                    user_result = await db.execute(
-                        select(User).where(User.id == notification.user_id)
-                    )
-                    user = user_result.scalar_one_or_none()
-                    
-                    if not user or not user.telegram_id:
-                        celery_logger.error(f"❌ У пользователя {notification.user_id} нет telegram_id")
-                        await _mark_notification_failed(notification.id, "No telegram_id")
-                        failed_count += 1
-                        continue
-                    
-                    # Создаём объект книги из уведомления (минимальный набор данных)
-                    book = ParserBook(
-                        source="chitai-gorod",
-                        source_id=notification.book_url.split("/")[-1] if notification.book_url else "",
-                        title=notification.book_title,
-                        author=notification.book_author or "",
-                        current_price=float(notification.book_price.replace(" руб.", "").strip()) if notification.book_price else 0,
-                        original_price=0,
-                        discount_percent=int(notification.book_discount.replace("%", "").strip()) if notification.book_discount else 0,
-                        url=notification.book_url or "",
-                        image_url="",
-                        parsed_at=datetime.now()
-                    )
-                    
-                    # Получаем alert для проверки target_price
-                    alert_result = await db.execute(
-                        select(Alert).where(Alert.id == notification.alert_id)
-                    )
-                    alert = alert_result.scalar_one_or_none()
-                    
-                    # Отправляем уведомление
-                    await _send_telegram_notification(user.id, book, alert, notification.id)
-                    sent_count += 1
-                    
-                except Exception as e:
-                    celery_logger.error(f"Ошибка отправки уведомления {notification.id}: {e}")
-                    await _mark_notification_failed(notification.id, str(e))
-                    failed_count += 1
-                    
-            celery_logger.info(f"Отправка завершена: отправлено={sent_count}, не удалось={failed_count}")
-            return sent_count
-            
-        except Exception as e:
-            celery_logger.error(f"Ошибка при отправке pending уведомлений: {e}")
-            return 0
-
 async def _cleanup_old_logs_async():
     """Асинхронная очистка старых логов"""
 
@@ -770,7 +627,8 @@ def test_simple(query: str):
 class MockParser:
     """Заглушка парсера для демонстрации функциональности"""
     
-    async def search_books(self, query: str, max_pages: int = 1, limit: int = None) -> List[ParserBook]:
+    async def search_books(self, query: str, max_pages: int = 1, limit: int = None,
+                           fetch_details: bool = False, on_page=None) -> List[ParserBook]:
         """Мок-парсер, возвращающий демо-книги до 550 рублей"""
         
         # Создаем демо-книги для демонстрации (цены до 550 рублей)
@@ -868,12 +726,13 @@ class MockParser:
         celery_logger.info(f"MockParser: создано {len(demo_books)} демо-книг для запроса '{query}' (цены до 550 руб., max_pages={max_pages}, limit={limit})")
         return demo_books
     
-    async def check_discounts(self) -> List[ParserBook]:
+    async def check_discounts(self, queries: Optional[List[str]] = None) -> List[ParserBook]:
         """Мок-метод для проверки скидок"""
         return []
 
 @celery_app.task(bind=True, autoretry_for=(Exception,), retry_kwargs={'max_retries': 3})
-def parse_books(self, query: str, source: str = "chitai-gorod", fetch_details: bool = False, max_pages: int = 1):
+def parse_books(self, query: str, source: str = "chitai-gorod", fetch_details: bool = False, max_pages: int = 1,
+                force: bool = False):
     """Задача для парсинга книг по запросу с реальным парсером
 
     Args:
@@ -881,27 +740,16 @@ def parse_books(self, query: str, source: str = "chitai-gorod", fetch_details: b
         source: Источник парсинга (по умолчанию chitai-gorod)
         fetch_details: Загружать ли детальную страницу для извлечения характеристик (издательство, переплёт, жанры)
         max_pages: Максимальное количество страниц для парсинга (по умолчанию 1)
+        force: Парсить, даже если похожие книги уже есть в базе
     """
 
-    def run_async_task():
-        # Проверяем, есть ли уже запущенный event loop
-        try:
-            loop = asyncio.get_running_loop()
-            celery_logger.warning("Event loop уже запущен, создаем новый")
-            # Если loop уже запущен, создаем новый в отдельном потоке
-            import concurrent.futures
-            with concurrent.futures.ThreadPoolExecutor() as executor:
-                future = executor.submit(asyncio.run, _parse_books_async(query, source, fetch_details, max_pages))
-                return future.result()
-        except RuntimeError:
-            # Нет запущенного loop, можно создать новый
-            loop = asyncio.new_event_loop()
-            asyncio.set_event_loop(loop)
-            try:
-                return loop.run_until_complete(_parse_books_async(query, source, fetch_details, max_pages))
-            finally:
-                loop.close()
-    
+    # По task_id клиент получает книги потоком (см. services.parse_stream)
+    task_id = self.request.id
+
+    @async_task
+    async def run_async_task():
+        return await _parse_books_async(query, source, fetch_details, max_pages, task_id, force)
+
     try:
         # ДИАГНОСТИКА: Логируем начало задачи
         celery_logger.info(f"DEBUG: parse_books started with query='{query}', source='{source}', fetch_details={fetch_details}")
@@ -957,20 +805,17 @@ async def _check_existing_books_in_db(db: AsyncSession, query: str) -> Tuple[boo
         Кортеж (has_exact_match: bool, similar_books: List[DBBook], reason: str)
     """
     try:
-        # Ищем книги, похожие на запрос (LIKE поиск)
-        search_pattern = f"%{query}%"
-        
-        result = await db.execute(
-            select(DBBook)
-            .where(
-                or_(
-                    DBBook.title.ilike(search_pattern),
-                    DBBook.author.ilike(search_pattern)
-                )
-            )
-            .limit(20)
+        # Ищем книги, похожие на запрос (только при значимых словах в запросе)
+        if not search_words(query):
+            return False, [], "no_existing_books"
+
+        existing_books, _ = await search_books(
+            db,
+            query=query,
+            order=ORDER_RELEVANCE,
+            limit=20,
+            with_total=False,
         )
-        existing_books = result.scalars().all()
 
         if not existing_books:
             return False, [], "no_existing_books"
@@ -989,25 +834,66 @@ async def _check_existing_books_in_db(db: AsyncSession, query: str) -> Tuple[boo
         return False, [], "error_checking"
 
 
-async def _parse_books_async(query: str, source: str, fetch_details: bool = False, max_pages: int = 1):
+async def _parse_books_async(query: str, source: str, fetch_details: bool = False, max_pages: int = 1,
+                             task_id: Optional[str] = None, force: bool = False):
     """Асинхронная функция парсинга книг с реальным парсером
 
+    Если передан task_id, книги публикуются в поток задачи по мере загрузки
+    страниц, а в конце публикуется итог (событие done) и снимается ключ
+    single-flight (services.parse_flight).
+
     Args:
         query: Поисковый запрос
         source: Источник парсинга
         fetch_details: Загружать ли детальную страницу для извлечения характеристик
         max_pages: Максимальное количество страниц для парсинга
+        task_id: ID Celery задачи для потоковой выдачи результатов
+        force: Парсить, даже если похожие книги уже есть в базе
     """
+    stream = None
+    if task_id:
+        from services.parse_stream import ParseStreamPublisher
+        stream = ParseStreamPublisher(task_id, source)
+
+    result = None
+    try:
+        result = await _run_parse_books(query, source, fetch_details, max_pages, stream, force)
+        return result
+    except Exception as e:
+        result = {
+            "books_found": 0,
+            "books_added": 0,
+            "books_updated": 0,
+            "message": f"Ошибка парсинга: {str(e)}"
+        }
+        raise
+    finally:
+        if stream and result is not None:
+            await stream.publish_done(result)
+        if task_id:
+            # Задача завершена: следующий такой же запрос запустит новый парсинг
+            from services.parse_flight import release_flight
+            await release_flight(query, source, fetch_details, max_pages, task_id, force)
+
+
+async def _run_parse_books(query: str, source: str, fetch_details: bool, max_pages: int, stream=None,
+                           force: bool = False):
+    """Парсинг книг: проверка БД, поиск в магазине, сохранение (см. _parse_books_async)"""
 
     session_factory = get_session_factory()
     async with session_factory() as db:
         try:
             # ШАГ 1: Проверяем нагрузку сервера для определения лимита парсинга
             is_loaded, parse_limit = should_limit_parsing()
+            # Лимит задан на страницу выдачи: подробный поиск загружает max_pages страниц
+            parse_limit *= max(max_pages, 1)
             celery_logger.info(f"Лимит парсинга: {parse_limit} (нагрузка: {'высокая' if is_loaded else 'нормальная'})")
             
-            # ШАГ 2: Проверяем, есть ли в базе похожие книги
-            has_existing, existing_books, match_reason = await _check_existing_books_in_db(db, query)
+            # ШАГ 2: Проверяем, есть ли в базе похожие книги (принудительный парсинг -
+            # подробный поиск и обновление устаревшего кэша выдачи - не проверяет)
+            has_existing, existing_books, match_reason = False, [], "forced"
+            if not force:
+                has_existing, existing_books, match_reason = await _check_existing_books_in_db(db, query)
             
             if has_existing:
                 celery_logger.info(f"Найдены существующие книги в БД для запроса '{query}': {len(existing_books)} шт. (причина: {match_reason})")
@@ -1056,11 +942,42 @@ async def _parse_books_async(query: str, source: str, fetch_details: bool = Fals
             celery_logger.info(f"🔍 ОТЛАДКА: parser type = {type(parser)}")
             celery_logger.info(f"🔍 ОТЛАДКА: parser class = {parser.__class__.__name__}")
             
+            # Книги, уже сохранённые и отправленные в поток по ходу поиска
+            streamed_keys = set()
+            save_stats = {"inserted": 0, "updated": 0, "unchanged": 0, "failed": 0}
+
+            async def on_page(page_books: List[ParserBook]):
+                """Сохранение страницы и публикация её книг в поток задачи"""
+                page_books = page_books[:max(parse_limit - len(streamed_keys), 0)]
+                if not page_books:
+                    return
+
+                page_stats = await _save_books(db, page_books)
+                for key in save_stats:
+                    save_stats[key] += page_stats[key]
+                streamed_keys.update((b.source, b.source_id) for b in page_books)
+
+                saved_result = await db.execute(
+                    select(DBBook).where(
+                        and_(
+                            DBBook.source == source,
+                            DBBook.source_id.in_([b.source_id for b in page_books])
+                        )
+                    )
+                )
+                await stream.publish_books([b.to_dict() for b in saved_result.scalars().all()])
+
             # Замеряем время парсинга
             parse_start = time.time()
 
             # Ищем книги с правильными параметрами
-            books = await parser.search_books(query, max_pages=1, limit=parse_limit, fetch_details=fetch_details)
+            books = await parser.search_books(
+                query,
+                max_pages=max_pages,
+                limit=parse_limit,
+                fetch_details=fetch_details,
+                on_page=on_page if stream else None
+            )
 
             # Логируем время парсинга
             parse_time = time.time() - parse_start
@@ -1081,23 +998,20 @@ async def _parse_books_async(query: str, source: str, fetch_details: bool = Fals
                     "message": f"Книги не найдены для запроса: {query}"
                 }
             
-            # Сохраняем найденные книги в БД
-            saved_count = 0
-            updated_count = 0
+            # Сохраняем найденные книги в БД одним пакетом
+            # (книги, сохранённые при публикации страниц в поток, пропускаем)
+            page_stats = await _save_books(
+                db, [book for book in books if (book.source, book.source_id) not in streamed_keys]
+            )
+            for key in save_stats:
+                save_stats[key] += page_stats[key]
+            saved_count = save_stats["inserted"] + save_stats["updated"] + save_stats["unchanged"]
             
             for book in books:
-                try:
-                    await _save_book(db, book)
-                    saved_count += 1
-                    
-                    # Логируем каждую найденную книгу
-                    celery_logger.info(f"Найдена книга: {book.title} - {book.current_price} руб. (скидка {book.discount_percent}%)")
-                    if fetch_details:
-                        celery_logger.info(f"  Характеристики: publisher={book.publisher}, binding={book.binding}, genres={book.genres}")
-                    
-                except Exception as book_error:
-                    celery_logger.error(f"Ошибка сохранения книги {book.title}: {book_error}")
-                    continue
+                # Логируем каждую найденную книгу
+                celery_logger.info(f"Найдена книга: {book.title} - {book.current_price} руб. (скидка {book.discount_percent}%)")
+                if fetch_details:
+                    celery_logger.info(f"  Характеристики: publisher={book.publisher}, binding={book.binding}, genres={book.genres}")
                 
             # ШАГ 4: Добавляем ВСЕ найденные книги в Google Sheets (топ-5 по цене)
             if books:
@@ -1116,8 +1030,9 @@ async def _parse_books_async(query: str, source: str, fetch_details: bool = Fals
             
             return {
                 "books_found": len(books),
-                "books_added": saved_count,
-                "books_updated": updated_count,
+                "books_added": save_stats["inserted"],
+                "books_updated": save_stats["updated"],
+                "books_unchanged": save_stats["unchanged"],
                 "message": f"Парсинг завершен: найдено {len(books)} книг, сохранено {saved_count}",
                 "limit_used": parse_limit,
                 "was_loaded": is_loaded
@@ -1135,126 +1050,179 @@ async def _parse_books_async(query: str, source: str, fetch_details: bool = Fals
 
 @celery_app.task(bind=True, autoretry_for=(Exception,), retry_kwargs={'max_retries': 2})
 def scan_discounts(self):
-    """Периодическое сканирование акционных книг"""
+    """
+    Периодическое сканирование акционных книг
+    
+    Координатор: поисковые запросы делятся на части по
+    DISCOUNT_SCAN_CHUNK_SIZE, части сканируются параллельно задачами
+    scan_discounts_chunk (chord), итог и рассылку о высоких скидках делает
+    summarize_discount_scan.
+    """
+    from celery import chord
+    from parsers.chitai_gorod import DISCOUNT_QUERIES
     
-    def run_async_task():
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-        try:
-            return loop.run_until_complete(_scan_discounts_async())
-        finally:
-            loop.close()
-
     try:
-        result = run_async_task()
-        celery_logger.info(f"Сканирование скидок завершено. Найдено акционных книг: {result}")
-        return result
+        chunks = _chunks(list(DISCOUNT_QUERIES), DISCOUNT_SCAN_CHUNK_SIZE)
+        chord(scan_discounts_chunk.s(chunk) for chunk in chunks)(summarize_discount_scan.s())
+        celery_logger.info(f"Сканирование скидок запущено: {len(DISCOUNT_QUERIES)} запросов, {len(chunks)} частей")
+        return {"queries": len(DISCOUNT_QUERIES), "chunks": len(chunks)}
     except Exception as e:
         celery_logger.error(f"Ошибка при сканировании скидок: {e}")
         raise self.retry(countdown=900, exc=e)
 
-async def _scan_discounts_async():
-    """Асинхронное сканирование акционных книг"""
+
+@celery_app.task(bind=True, max_retries=2)
+def scan_discounts_chunk(self, queries: List[str]):
+    """Сканирование акционных книг по части запросов (повтор - с контрольной точки)"""
+    from services.task_checkpoint import ChunkCheckpoint
+    
+    @async_task
+    async def run_async_task():
+        checkpoint = await ChunkCheckpoint(self.request.id).load()
+        high_discount = await _scan_discounts_chunk_async(queries, checkpoint)
+        await checkpoint.clear()
+        return {**checkpoint.result(), "high_discount": high_discount}
+
+    try:
+        return run_async_task()
+    except Exception as e:
+        celery_logger.error(f"Ошибка сканирования скидок по запросам {queries}: {e}")
+        if self.request.retries < self.max_retries:
+            raise self.retry(countdown=900, exc=e)
+        return {"failed": len(queries), "errors": [f"Запросы {queries}: {e}"], "high_discount": []}
+
+
+@celery_app.task
+def summarize_discount_scan(results: List[Dict]):
+    """Callback chord сканирования скидок: итог и рассылка о высоких скидках"""
+    
+    @async_task
+    async def run_async_task():
+        high_discount_books = {}
+        for result in results:
+            for book in result.get("high_discount", []):
+                high_discount_books.setdefault(book["url"], book)
+        
+        # Отправляем уведомления о книгах с высокими скидками всем пользователям
+        if high_discount_books:
+            await _notify_high_discount_books(list(high_discount_books.values()))
+    
+    found = sum(result.get("found", 0) for result in results)
+    saved = sum(result.get("saved", 0) for result in results)
+    for result in results:
+        for error in result.get("errors", []):
+            celery_logger.error(f"Сканирование скидок: {error}")
+    
+    run_async_task()
+    celery_logger.info(f"Сканирование скидок завершено: найдено {found} акционных книг, сохранено {saved}")
+    return found
+
+
+async def _scan_discounts_chunk_async(queries: List[str], checkpoint) -> List[Dict]:
+    """
+    Асинхронное сканирование акционных книг по запросам
+    
+    Returns:
+        Книги с высокими скидками (для общей рассылки)
+    """
+    
+    try:
+        import sys
+        import os
+        # Добавляем корневую папку в PYTHONPATH
+        current_dir = os.path.dirname(os.path.abspath(__file__))
+        root_dir = os.path.dirname(os.path.dirname(current_dir))
+        if root_dir not in sys.path:
+            sys.path.append(root_dir)
+        
+        from parsers.chitai_gorod import ChitaiGorodParser
+        parser = ChitaiGorodParser()
+    except ImportError as e:
+        celery_logger.warning(f"Не удалось импортировать парсер: {e}")
+        # Создаем заглушку для демонстрации
+        parser = MockParser()
     
     session_factory = get_session_factory()
     async with session_factory() as db:
-        try:
-            try:
-                import sys
-                import os
-                # Добавляем корневую папку в PYTHONPATH
-                current_dir = os.path.dirname(os.path.abspath(__file__))
-                root_dir = os.path.dirname(os.path.dirname(current_dir))
-                if root_dir not in sys.path:
-                    sys.path.append(root_dir)
-                
-                from parsers.chitai_gorod import ChitaiGorodParser
-                parser = ChitaiGorodParser()
-            except ImportError as e:
-                celery_logger.warning(f"Не удалось импортировать парсер: {e}")
-                # Создаем заглушку для демонстрации
-                parser = MockParser()
-            
-            celery_logger.info("Начинаем сканирование акционных книг")
+        for query in queries:
+            if query in checkpoint.done:
+                continue
             
-            # Сканируем акционные книги
-            discount_books = await parser.check_discounts()
-            
-            if not discount_books:
-                celery_logger.info("Акционные книги не найдены")
-                await _log_parsing_result(db, "chitai-gorod", "no_discounts", "Акционные книги не найдены")
-                return 0
+            celery_logger.info(f"Сканирование акционных книг: '{query}'")
+            discount_books = await parser.check_discounts([query])
             
-            # Сохраняем акционные книги
-            saved_count = 0
-            high_discount_books = []
+            if discount_books:
+                # Сохраняем акционные книги одним пакетом
+                save_stats = await _save_books(db, discount_books)
+                checkpoint.add("found", len(discount_books))
+                checkpoint.add("saved", save_stats["inserted"] + save_stats["updated"] + save_stats["unchanged"])
             
             for book in discount_books:
-                await _save_book(db, book)
                 await _add_to_sheets(book)
-                saved_count += 1
                 
-                # Выделяем книги с высокими скидками
+                # Выделяем книги с высокими скидками (сохраняются в контрольной точке)
                 if book.discount_percent and book.discount_percent >= 30:
-                    high_discount_books.append(book)
+                    checkpoint.items.append(_discount_book_summary(book))
                 
                 celery_logger.info(f"Акционная книга: {book.title} - {book.current_price} руб. (скидка {book.discount_percent}%)")
             
-            # Отправляем уведомления о книгах с высокими скидками всем пользователям
-            if high_discount_books:
-                await _notify_high_discount_books(high_discount_books)
-            
-            # Логируем результат
-            await _log_parsing_result(db, "chitai-gorod", "discounts_found", 
-                                    f"Сканирование скидок: найдено {len(discount_books)} акционных книг, сохранено {saved_count}")
-            
-            return len(discount_books)
-            
-        except Exception as e:
-            celery_logger.error(f"Ошибка сканирования скидок: {e}")
-            await _log_parsing_result(db, "chitai-gorod", "discounts_error", str(e))
-            return 0
-
-async def _notify_high_discount_books(high_discount_books: list):
-    """Уведомление пользователей о книгах с высокими скидками"""
+            await checkpoint.mark_done(query)
+        
+        # Логируем результат
+        await _log_parsing_result(db, "chitai-gorod", "discounts_found", 
+                                f"Сканирование скидок {queries}: найдено {checkpoint.stats.get('found', 0)} акционных книг")
+    
+    # В рассылку попадает топ-3 всех частей: от части достаточно её топ-3
+    return sorted(checkpoint.items, key=lambda x: x["discount_percent"] or 0, reverse=True)[:3]
+
+
+def _discount_book_summary(book: ParserBook) -> Dict:
+    """Данные книги для рассылки о высоких скидках (передаются в callback chord)"""
+    return {
+        "title": book.title,
+        "author": book.author,
+        "current_price": book.current_price,
+        "original_price": book.original_price,
+        "discount_percent": book.discount_percent,
+        "url": book.url,
+    }
+
+async def _notify_high_discount_books(high_discount_books: List[Dict]):
+    """Уведомление пользователей о книгах с высокими скидками (рассылка с лимитами Telegram)"""
     
     try:
-        from app.bot.telegram_bot import TelegramBot
-        bot = TelegramBot()
+        from services import notification_delivery as delivery
+        
+        # Топ-3 книги с высокими скидками - одно сообщение для всех пользователей
+        top_books = sorted(high_discount_books, key=lambda x: x["discount_percent"] or 0, reverse=True)[:3]
+        
+        message = "🔥 <b>Отличные скидки на книги!</b>\n\n"
         
-        # Получаем всех пользователей
+        for i, book in enumerate(top_books, 1):
+            message += f"{i}. <b>{book['title']}</b>\n"
+            if book["author"]:
+                message += f"   👤 {book['author']}\n"
+            message += f"   💰 <b>{book['current_price']} руб.</b>\n"
+            if book["original_price"]:
+                message += f"   💸 <s>{book['original_price']} руб.</s>\n"
+            message += f"   🔥 <b>Скидка {book['discount_percent']}%</b>\n"
+            message += f"   🔗 <a href='{book['url']}'>Ссылка</a>\n\n"
+        
+        message += "💡 Подпишитесь на уведомления для получения персональных рекомендаций!"
+        
+        # Получаем всех пользователей с Telegram
         session_factory = get_session_factory()
         async with session_factory() as db:
-            result = await db.execute(select(User))
-            users = result.scalars().all()
-            
-            for user in users:
-                try:
-                    # Отправляем топ-3 книги с высокими скидками
-                    top_books = sorted(high_discount_books, key=lambda x: x.discount_percent or 0, reverse=True)[:3]
-                    
-                    message = "🔥 <b>Отличные скидки на книги!</b>\n\n"
-                    
-                    for i, book in enumerate(top_books, 1):
-                        message += f"{i}. <b>{book.title}</b>\n"
-                        if book.author:
-                            message += f"   👤 {book.author}\n"
-                        message += f"   💰 <b>{book.current_price} руб.</b>\n"
-                        if book.original_price:
-                            message += f"   💸 <s>{book.original_price} руб.</s>\n"
-                        message += f"   🔥 <b>Скидка {book.discount_percent}%</b>\n"
-                        message += f"   🔗 <a href='{book.url}'>Ссылка</a>\n\n"
-                    
-                    message += "💡 Подпишитесь на уведомления для получения персональных рекомендаций!"
-                    
-                    await bot.send_message(user.telegram_id, message)
-                    
-                except Exception as e:
-                    celery_logger.error(f"Ошибка отправки уведомления пользователю {user.id}: {e}")
-                    continue
-                
-                # Небольшая задержка между отправками
-                await asyncio.sleep(1)
+            result = await db.execute(select(User.telegram_id).where(User.telegram_id != None))
+            telegram_ids = result.scalars().all()
+        
+        results = await delivery.send_messages(
+            [delivery.OutboundMessage(telegram_id, message) for telegram_id in telegram_ids]
+        )
+        
+        for result in results:
+            if not result.sent:
+                celery_logger.error(f"Ошибка отправки уведомления пользователю {result.message.chat_id}: {result.error}")
                 
     except Exception as e:
         celery_logger.error(f"Ошибка уведомления о высоких скидках: {e}")
@@ -1263,14 +1231,10 @@ async def _notify_high_discount_books(high_discount_books: list):
 def update_popular_books():
     """Обновление базы популярных книг"""
     
-    def run_async_task():
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-        try:
-            return loop.run_until_complete(_update_popular_books_async())
-        finally:
-            loop.close()
-    
+    @async_task
+    async def run_async_task():
+        return await _update_popular_books_async()
+
     try:
         result = run_async_task()
         celery_logger.info(f"Обновление популярных книг завершено. Обработано категорий: {result}")
@@ -1308,17 +1272,14 @@ async def _update_popular_books_async():
                         # Берем топ-10 книг по скидке
                         best_books = sorted(books, key=lambda x: x.discount_percent or 0, reverse=True)[:10]
                         
+                        await _save_books(db, best_books)
                         for book in best_books:
-                            await _save_book(db, book)
                             await _add_to_sheets(book)
                         
                         celery_logger.info(f"Обновлена категория '{category}': сохранено {len(best_books)} книг")
                     
                     processed_categories += 1
                     
-                    # Задержка между категориями
-                    await asyncio.sleep(3)
-                    
                 except Exception as e:
                     celery_logger.error(f"Ошибка обновления категории '{category}': {e}")
                     continue
@@ -1353,13 +1314,9 @@ def update_chitai_gorod_token(self):
 
     load_dotenv()
 
-    def run_async_task():
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-        try:
-            return loop.run_until_complete(_update_chitai_gorod_token_async())
-        finally:
-            loop.close()
+    @async_task
+    async def run_async_task():
+        return await _update_chitai_gorod_token_async()
 
     try:
         celery_logger.info("Начинаем обновление токена Читай-города через FlareSolverr")
@@ -1579,33 +1536,17 @@ async def _update_chitai_gorod_token_async():
         # Если запрос был успешным, сохраняем токен
         if success_response and success_response.status_code == 200:
             # Сохраняем токен в Redis
-            redis_url = os.getenv("REDIS_URL", "redis://localhost:6379/0")
-            redis_password = os.getenv("REDIS_PASSWORD")
-
-            if redis_url and redis_password:
-                # Формируем URL с паролем
-                import re
-                redis_pattern = r'redis://:(?P<password>[^@]+)@(?P<host>[^:]+):(?P<port>\d+)/\d+'
-                match = re.match(redis_pattern, redis_url)
-                if not match:
-                    # Формируем правильный URL
-                    host = redis_url.split("://")[1].split(":")[0]
-                    port = redis_url.split(":")[-1].split("/")[0]
-                    redis_url = f"redis://:{redis_password}@{host}:{port}/0"
-
-                try:
-                    import redis
-                    redis_client = redis.from_url(redis_url, decode_responses=True)
-                    redis_client.setex(
-                        "chitai_gorod_token",
-                        86400,  # 24 часа TTL
-                        token
-                    )
-                    redis_client.close()
-                    celery_logger.info("Токен сохранен в Redis (TTL: 24 часа)")
-                except Exception as redis_error:
-                    celery_logger.error(f"Ошибка сохранения в Redis: {redis_error}")
-                    # Продолжаем даже если Redis недоступен
+            try:
+                from services.redis_client import get_sync_redis
+                get_sync_redis().setex(
+                    "chitai_gorod_token",
+                    86400,  # 24 часа TTL
+                    token
+                )
+                celery_logger.info("Токен сохранен в Redis (TTL: 24 часа)")
+            except Exception as redis_error:
+                celery_logger.error(f"Ошибка сохранения в Redis: {redis_error}")
+                # Продолжаем даже если Redis недоступен
 
             # Сохраняем cookies в Redis (если запрос был успешен с cookies)
             if success_response and success_response.status_code == 200:
@@ -1698,11 +1639,6 @@ async def _update_chitai_gorod_token_async():
 # Задача проверки подписок по ценам с парсингом (каждые 4 часа)
 # =============================================================================
 
-# Регистрируем задачу с явным именем
-celery_app.conf.task_routes = {
-    'check_subscriptions_prices': {'queue': 'celery'},
-    'services.celery_tasks.check_subscriptions_prices': {'queue': 'celery'},
-}
 
 @celery_app.task(name='services.celery_tasks.check_subscriptions_prices', bind=True, autoretry_for=(Exception,), retry_kwargs={'max_retries': 3})
 def check_subscriptions_prices(self):
@@ -1712,14 +1648,10 @@ def check_subscriptions_prices(self):
     Если цена книги соответствует условиям подписки - отправляем уведомление и деактивируем подписку.
     """
     
-    def run_async_task():
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-        try:
-            return loop.run_until_complete(_check_subscriptions_prices_async())
-        finally:
-            loop.close()
-    
+    @async_task
+    async def run_async_task():
+        return await _check_subscriptions_prices_async()
+
     try:
         result = run_async_task()
         celery_logger.info(f"✅ Проверка цен подписок завершена. Уведомлений отправлено: {result}")
@@ -1732,14 +1664,17 @@ def check_subscriptions_prices(self):
 async def _check_subscriptions_prices_async():
     """
     Асинхронная функция проверки цен подписок с реальным парсингом.
-    Для каждой подписки с book_id:
-    1. Находит книгу в БД
-    2. Парсит книгу по source_id для получения актуальной цены
-    3. Проверяет условия подписки
+    Страховка для событийной проверки (match_price_changes), работает пакетно
+    по различным книгам (см. services.price_refresh):
+    1. Группирует подписки с book_id по книгам и загружает книги одним запросом
+    2. Получает актуальную цену каждой книги один раз (параллельно, под лимитером)
+    3. Проверяет по этой цене подписки на книги (services.alert_matching)
     4. Отправляет уведомление и деактивирует подписку при совпадении
     """
     
     import time
+    from services.price_refresh import PriceRefreshEngine
+    
     start_time = time.time()
     errors = []
     total_checked = 0
@@ -1749,20 +1684,7 @@ async def _check_subscriptions_prices_async():
     session_factory = get_session_factory()
     async with session_factory() as db:
         try:
-            # Импортируем парсер
-            try:
-                import sys
-                import os
-                current_dir = os.path.dirname(os.path.abspath(__file__))
-                root_dir = os.path.dirname(os.path.dirname(current_dir))
-                if root_dir not in sys.path:
-                    sys.path.append(root_dir)
-                
-                from parsers.chitai_gorod import ChitaiGorodParser
-                parser = ChitaiGorodParser()
-            except ImportError as e:
-                celery_logger.warning(f"Не удалось импортировать парсер: {e}")
-                parser = MockParser()
+            engine = PriceRefreshEngine()
             
             # Получаем все активные подписки с book_id
             result = await db.execute(
@@ -1779,95 +1701,49 @@ async def _check_subscriptions_prices_async():
                 celery_logger.info("Нет активных подписок с book_id для проверки цен")
                 return 0
             
-            celery_logger.info(f"Начинаем проверку цен для {len(alerts)} подписок")
-            
             total_checked = len(alerts)
             active_count = total_checked
             notifications_sent = 0
             matched_count = 0
             
-            for alert in alerts:
-                try:
-                    # Находим книгу в БД по book_id
-                    book_result = await db.execute(
-                        select(DBBook).where(DBBook.id == alert.book_id)
-                    )
-                    db_book = book_result.scalar_one_or_none()
-                    
-                    if not db_book:
-                        celery_logger.warning(f"Книга {alert.book_id} не найдена в БД для подписки {alert.id}")
-                        continue
-                    
-                    celery_logger.info(f"Проверяем подписку {alert.id}: {db_book.title} (URL: {db_book.url})")
-                    
-                    # Парсим книгу по URL для получения актуальной цены
-                    # Используем URL - это наиболее надёжный способ
-                    try:
-                        parsed_book = await parser.get_book_by_url(db_book.url)
-                    except Exception as parse_error:
-                        celery_logger.error(f"Ошибка парсинга для {db_book.url}: {parse_error}")
-                        parsed_book = None
-                    
-                    if not parsed_book:
-                        celery_logger.info(f"❌ Не удалось получить актуальные данные для книги: {db_book.title}")
-                        continue
-                    
-                    celery_logger.info(f"✅ Получена книга: {parsed_book.title}, цена: {parsed_book.current_price}₽")
-                    
-                    celery_logger.info(
-                        f"Актуальная цена для {parsed_book.title}: {parsed_book.current_price}₽ "
-                        f"(скидка {parsed_book.discount_percent}%)"
+            # Группируем подписки по книгам и загружаем книги одним запросом
+            alerts_by_book = engine.group_alerts_by_book(alerts)
+            books = await engine.load_books(db, list(alerts_by_book.keys()))
+            
+            for book_id in alerts_by_book:
+                if book_id not in books:
+                    celery_logger.warning(
+                        f"Книга {book_id} не найдена в БД для подписок "
+                        f"{[alert.id for alert in alerts_by_book[book_id]]}"
                     )
-                    
-                    # Проверяем условия подписки
-                    price_match = True
-                    if alert.target_price and parsed_book.current_price > float(alert.target_price):
-                        price_match = False
-                    
-                    discount_match = True
-                    if alert.min_discount and (parsed_book.discount_percent or 0) < alert.min_discount:
-                        discount_match = False
-                    
-                    # Если оба условия выполняются
-                    if price_match and discount_match:
-                        celery_logger.info(
-                            f"✅ Найдена книга по подписке {alert.id}: {parsed_book.title} - "
-                            f"{parsed_book.current_price}₽ (скидка {parsed_book.discount_percent}%)"
-                        )
-                        
-                        matched_count += 1
-                        
-                        # Обновляем цену в БД
-                        db_book.current_price = parsed_book.current_price
-                        db_book.original_price = parsed_book.original_price
-                        db_book.discount_percent = parsed_book.discount_percent
-                        db_book.parsed_at = parsed_book.parsed_at
-                        await db.commit()
-                        
-                        # Отправляем уведомление
-                        await _send_subscription_notification_from_parser(db, alert, parsed_book, db_book)
-                        
-                        # Деактивируем подписку
-                        alert.is_active = False
-                        alert.updated_at = datetime.now()
-                        await db.commit()
-                        
-                        notifications_sent += 1
-                        celery_logger.info(f"Подписка {alert.id} деактивирована после уведомления")
-                    else:
-                        celery_logger.info(
-                            f"Книга {parsed_book.title} не соответствует условиям подписки: "
-                            f"цена={parsed_book.current_price}₽ (нужно<={alert.target_price}), "
-                            f"скидка={parsed_book.discount_percent}% (нужно>={alert.min_discount}%)"
-                        )
-                    
-                    # Задержка между запросами
-                    await asyncio.sleep(2)
-                    
-                except Exception as e:
-                    celery_logger.error(f"Ошибка обработки подписки {alert.id}: {e}")
-                    errors.append(f"Подписка {alert.id}: {str(e)}")
-                    continue
+            
+            celery_logger.info(
+                f"Начинаем проверку цен для {len(alerts)} подписок "
+                f"({len(books)} различных книг)"
+            )
+            
+            # Одна актуальная цена на книгу
+            fresh_books = await engine.fetch_prices(list(books.values()))
+            errors.extend(engine.fetch_errors)
+            
+            # Обновляем цены в БД одним коммитом (один раз на книгу)
+            price_entries = []
+            for book_id, parsed_book in fresh_books.items():
+                entry = engine.apply_price(books[book_id], parsed_book)
+                if entry:
+                    price_entries.append(entry)
+            await price_history.record_prices(db, price_entries)
+            await db.commit()
+            
+            for parsed_book in fresh_books.values():
+                celery_logger.info(
+                    f"Актуальная цена для {parsed_book.title}: {parsed_book.current_price}₽ "
+                    f"(скидка {parsed_book.discount_percent}%)"
+                )
+            
+            # Подписки проверяются тем же кодом, что и события изменения цен
+            notifications_sent = await _notify_alert_matches(db, list(fresh_books.keys()), errors)
+            matched_count = notifications_sent
             
             # Вычисляем время выполнения
             duration = time.time() - start_time
@@ -1896,9 +1772,9 @@ async def _check_subscriptions_prices_async():
             celery_logger.error(f"Критическая ошибка при проверке цен подписок: {e}")
             raise
 
-async def _send_subscription_notification_from_parser(db: AsyncSession, alert: Alert, parsed_book: ParserBook, db_book: DBBook):
+def _subscription_message(alert: Alert, book) -> str:
     """
-    Отправка уведомления о книге по подписке (с данными из парсера).
+    Текст уведомления о книге по подписке (книга из парсера или из БД).
     Формат сообщения:
     🔔 Книга поступила в продажу!
     
@@ -1909,75 +1785,142 @@ async def _send_subscription_notification_from_parser(db: AsyncSession, alert: A
     
     👉 Купить: [ссылка]
     """
+    message = "🔔 <b>Книга поступила в продажу!</b>\n\n"
+    message += f"📖 <b>{book.title}</b>\n"
     
+    if book.author:
+        message += f"✍️ Автор: {book.author}\n"
+    
+    # Цена и скидка
+    if book.original_price and book.original_price > book.current_price:
+        discount = int((1 - book.current_price / book.original_price) * 100)
+        message += f"💰 Цена: <b>{int(book.current_price)} ₽</b> (было {int(book.original_price)} ₽, скидка {discount}%)\n"
+    else:
+        message += f"💰 Цена: <b>{int(book.current_price)} ₽</b>\n"
+    
+    # Условие подписки
+    if alert.target_price:
+        message += f"🎯 Ваше условие: до {int(alert.target_price)} ₽\n"
+    elif alert.min_discount:
+        message += f"🎯 Ваше условие: скидка от {int(alert.min_discount)}%\n"
+    
+    # Ссылка на книгу
+    if book.url:
+        message += f"\n👉 <a href='{book.url}'>Купить</a>"
+    
+    return message
+
+
+# =============================================================================
+# Проверка подписок по событиям изменения цен
+# =============================================================================
+
+@celery_app.task(name='services.celery_tasks.match_price_changes', bind=True, autoretry_for=(Exception,), retry_kwargs={'max_retries': 3})
+def match_price_changes(self, book_ids: List[int]):
+    """
+    Проверка подписок на книги, цены которых только что изменились.
+    Событие публикует пакетный upsert (services.alert_matching.publish_price_changes).
+    """
+    
+    @async_task
+    async def run_async_task():
+        return await _match_price_changes_async(book_ids)
+
     try:
-        # Получаем пользователя
-        result = await db.execute(select(User).where(User.id == alert.user_id))
-        user = result.scalar_one_or_none()
-        
-        if not user:
-            celery_logger.error(f"Пользователь {alert.user_id} не найден")
-            return
-        
-        # Формируем сообщение
-        message = "🔔 <b>Книга поступила в продажу!</b>\n\n"
-        message += f"📖 <b>{parsed_book.title}</b>\n"
-        
-        if parsed_book.author:
-            message += f"✍️ Автор: {parsed_book.author}\n"
-        
-        # Цена и скидка
-        if parsed_book.original_price and parsed_book.original_price > parsed_book.current_price:
-            discount = int((1 - parsed_book.current_price / parsed_book.original_price) * 100)
-            message += f"💰 Цена: <b>{int(parsed_book.current_price)} ₽</b> (было {int(parsed_book.original_price)} ₽, скидка {discount}%)\n"
-        else:
-            message += f"💰 Цена: <b>{int(parsed_book.current_price)} ₽</b>\n"
-        
-        # Условие подписки
-        if alert.target_price:
-            message += f"🎯 Ваше условие: до {int(alert.target_price)} ₽\n"
-        elif alert.min_discount:
-            message += f"🎯 Ваше условие: скидка от {int(alert.min_discount)}%\n"
-        
-        # Ссылка на книгу
-        if parsed_book.url:
-            message += f"\n👉 <a href='{parsed_book.url}'>Купить</a>"
-        
-        # Отправляем через Telegram Bot
-        try:
-            from app.bot.telegram_bot import TelegramBot
-            bot = TelegramBot()
-            await bot.send_message(user.telegram_id, message)
-            celery_logger.info(f"✅ Уведомление отправлено пользователю {user.telegram_id} для книги {parsed_book.title}")
-        except Exception as bot_error:
-            celery_logger.error(f"❌ Ошибка отправки Telegram уведомления: {bot_error}")
-        
-        # Создаем запись в таблице уведомлений с правильными полями
-        try:
-            notification = Notification(
-                user_id=user.id,
-                book_id=db_book.id,
-                alert_id=alert.id,
-                book_title=parsed_book.title,
-                book_author=parsed_book.author or "",
-                book_price=f"{int(parsed_book.current_price)} руб.",
-                book_discount=f"{int(parsed_book.discount_percent)}%" if parsed_book.discount_percent else "",
-                book_url=parsed_book.url,
-                message=message,
-                status="sent",
-                is_sent=True,
-                sent_at=datetime.now()
-            )
-            db.add(notification)
-            await db.commit()
-            celery_logger.info(f"✅ Уведомление создано в БД со статусом sent")
-        except Exception as notify_error:
-            celery_logger.error(f"❌ Ошибка создания записи уведомления: {notify_error}")
-            await db.rollback()
-        
+        result = run_async_task()
+        if result:
+            celery_logger.info(f"✅ Изменения цен {len(book_ids)} книг: отправлено уведомлений {result}")
+        return result
     except Exception as e:
-        celery_logger.error(f"❌ Ошибка отправки уведомления подписки: {e}")
-        await db.rollback()
+        celery_logger.error(f"❌ Ошибка проверки подписок по изменениям цен: {e}")
+        celery_logger.error(traceback.format_exc())
+        raise
+
+async def _match_price_changes_async(book_ids: List[int]) -> int:
+    """Асинхронная проверка подписок по изменившимся книгам"""
+    session_factory = get_session_factory()
+    async with session_factory() as db:
+        return await _notify_alert_matches(db, book_ids)
+
+async def _notify_alert_matches(db: AsyncSession, book_ids: List[int], errors: Optional[List[str]] = None) -> int:
+    """
+    Уведомления по подпискам, условия которых выполнены для книг
+    (services.alert_matching).
+    
+    В одной транзакции подписки деактивируются (условным UPDATE - одновременные
+    события не отправят уведомление дважды) и создаются pending уведомления;
+    затем сообщения отправляются пачкой, статусы пишутся пакетными UPDATE.
+    Если воркер упадёт после commit, уведомления отправит send_pending_notifications.
+    
+    Returns:
+        Количество отправленных уведомлений
+    """
+    from services import notification_delivery as delivery
+    
+    matches = await alert_matching.find_matches(db, book_ids)
+    if not matches:
+        return 0
+    
+    claimed_ids = await alert_matching.claim_alerts(db, [alert for alert, _ in matches])
+    matches = [(alert, db_book) for alert, db_book in matches if alert.id in claimed_ids]
+    if not matches:
+        await db.commit()
+        return 0
+    
+    users_result = await db.execute(
+        select(User.id, User.telegram_id).where(User.id.in_({alert.user_id for alert, _ in matches}))
+    )
+    telegram_ids = dict(users_result.all())
+    
+    notifications = []
+    for alert, db_book in matches:
+        celery_logger.info(
+            f"✅ Найдена книга по подписке {alert.id}: {db_book.title} - "
+            f"{db_book.current_price}₽ (скидка {db_book.discount_percent}%)"
+        )
+        notifications.append(Notification(
+            user_id=alert.user_id,
+            book_id=db_book.id,
+            alert_id=alert.id,
+            book_title=db_book.title,
+            book_author=db_book.author or "",
+            book_price=f"{int(db_book.current_price)} руб.",
+            book_discount=f"{int(db_book.discount_percent)}%" if db_book.discount_percent else "",
+            book_url=db_book.url,
+            message=_subscription_message(alert, db_book),
+            status="pending",
+            is_sent=False
+        ))
+    db.add_all(notifications)
+    await db.commit()
+    
+    # Деактивированные подписки убираются из индексов остальных воркеров
+    await alert_matching.publish_alert_changes(claimed_ids)
+    
+    messages = []
+    results = []
+    for notification in notifications:
+        telegram_id = telegram_ids.get(notification.user_id)
+        message = delivery.OutboundMessage(telegram_id or 0, notification.message, notification.id)
+        if telegram_id:
+            messages.append(message)
+        else:
+            results.append(delivery.DeliveryResult(message, False, error="No telegram_id"))
+    results.extend(await delivery.send_messages(messages))
+    
+    await delivery.record_results(db, results)
+    await db.commit()
+    
+    notifications_sent = 0
+    for result in results:
+        if result.sent:
+            notifications_sent += 1
+            continue
+        celery_logger.error(f"❌ Уведомление {result.message.notification_id} не отправлено: {result.error}")
+        if errors is not None:
+            errors.append(f"Уведомление {result.message.notification_id}: {result.error}")
+    
+    return notifications_sent
 
 
 # =============================================================================
@@ -1991,14 +1934,10 @@ def send_pending_notifications(self):
     Запускается каждые 15 минут для отправки уведомлений, которые не были отправлены.
     """
     
-    def run_async_task():
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-        try:
-            return loop.run_until_complete(_send_pending_notifications_async())
-        finally:
-            loop.close()
-    
+    @async_task
+    async def run_async_task():
+        return await _send_pending_notifications_async()
+
     try:
         result = run_async_task()
         celery_logger.info(f"Отправка pending уведомлений завершена. Отправлено: {result}")
@@ -2006,6 +1945,12 @@ def send_pending_notifications(self):
     except Exception as e:
         celery_logger.error(f"Ошибка при отправке pending уведомлений: {e}")
         raise self.retry(countdown=300, exc=e)
+
+
+async def _send_pending_notifications_async():
+    """Асинхронная отправка pending уведомлений (services.notification_outbox)"""
+    from services.notification_outbox import drain_pending
+    return await drain_pending(get_session_factory())
  
 
 # =============================================================================
@@ -2023,14 +1968,10 @@ def cleanup_books(self):
     Запускается ежедневно в 3:00 ночи
     """
     
-    def run_async_task():
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-        try:
-            return loop.run_until_complete(_cleanup_books_async())
-        finally:
-            loop.close()
-    
+    @async_task
+    async def run_async_task():
+        return await _cleanup_books_async()
+
     try:
         result = run_async_task()
         celery_logger.info(f"Очистка книг завершена. Результат: {result}")
@@ -2238,13 +2179,9 @@ def update_wildberries_cookies(self):
     import requests
     import json
 
-    def run_async_task():
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-        try:
-            return loop.run_until_complete(_update_wildberries_cookies_async())
-        finally:
-            loop.close()
+    @async_task
+    async def run_async_task():
+        return await _update_wildberries_cookies_async()
 
     try:
         celery_logger.info("Начинаем обновление cookies Wildberries через FlareSolverr")
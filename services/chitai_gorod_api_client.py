@@ -14,7 +14,7 @@ import random
 import asyncio
 import json
 import aiohttp
-from typing import List, Dict, Optional
+from typing import List, Dict, Optional, Tuple
 from datetime import datetime
 import logging
 from pydantic import BaseModel
@@ -25,6 +25,33 @@ load_dotenv()
 
 logger = logging.getLogger(__name__)
 
+# Карточка товара: шаблон URL ({api_url}, {product_id})
+PRODUCT_CARD_URL = os.getenv("CHITAI_GOROD_PRODUCT_CARD_URL", "{api_url}/products/{product_id}")
+# Ответы карточки, при которых она считается неподдерживаемой: 404 - только если
+# товар затем нашёлся поиском (иначе это отсутствующий товар, а не эндпоинт)
+PRODUCT_CARD_UNSUPPORTED_STATUSES = (404, 405, 501)
+# Сколько карточка не запрашивается после такого ответа (сек): память процесса и Redis
+PRODUCT_CARD_UNSUPPORTED_TTL = int(os.getenv("CHITAI_GOROD_PRODUCT_CARD_UNSUPPORTED_TTL", "86400"))
+PRODUCT_CARD_UNSUPPORTED_KEY = "cg_product_card_unsupported"
+
+# Кэш товаров по ID: в памяти процесса и в Redis (общий для воркеров)
+PRODUCT_CACHE_TTL = int(os.getenv("CHITAI_GOROD_PRODUCT_CACHE_TTL", "300"))
+PRODUCT_CACHE_MAX_SIZE = 5000
+PRODUCT_CACHE_PREFIX = "cg_product:"
+
+# Локальный кэш: source_id -> (время истечения, книга)
+_product_cache: Dict[str, Tuple[float, "ChitaiGorodBook"]] = {}
+# До какого времени карточка товара не запрашивается в этом процессе
+_product_card_unsupported_until = 0.0
+
+
+class EndpointUnsupported(Exception):
+    """Эндпоинт ответил статусом, означающим, что он не поддерживается"""
+
+    def __init__(self, status: int):
+        super().__init__(f"HTTP {status}")
+        self.status = status
+
 
 class ChitaiGorodBook(BaseModel):
     """Модель книги из API Читай-города"""
@@ -95,6 +122,15 @@ class ChitaiGorodAPIClient:
         self.delay_min = delay_min
         self.delay_max = delay_max
 
+        # Общий лимитер на хост API: запросы всех клиентов и воркеров
+        # укладываются в один бюджет (в среднем как прежняя задержка)
+        from services.rate_limiter import get_host_limiter
+        self.rate_limiter = get_host_limiter(
+            self.api_url,
+            rate=2.0 / max(delay_min + delay_max, 0.1),
+            capacity=3
+        )
+
         # Настройки retry
         self.max_retries = max_retries
         self.timeout = timeout
@@ -152,11 +188,18 @@ class ChitaiGorodAPIClient:
         logger.debug(f"[ChitaiGorodAPI] Задержка: {delay:.2f} сек")
         await asyncio.sleep(delay)
     
+    async def _throttle(self):
+        """Ожидание разрешения от лимитера хоста"""
+        waited = await self.rate_limiter.acquire()
+        if waited > 0:
+            logger.debug(f"[ChitaiGorodAPI] Ожидание лимитера: {waited:.2f} сек")
+
     async def _make_request(
         self,
         url: str,
         params: Dict = None,
-        method: str = "GET"
+        method: str = "GET",
+        unsupported_statuses: Tuple[int, ...] = ()
     ) -> Optional[Dict]:
         """
         Выполнение HTTP запроса с retry mechanism
@@ -165,21 +208,28 @@ class ChitaiGorodAPIClient:
             url: URL для запроса
             params: Параметры запроса
             method: HTTP метод (GET/POST)
+            unsupported_statuses: Статусы, при которых запрос не повторяется
+                и вызывается EndpointUnsupported (без логирования ошибки)
             
         Returns:
             JSON ответ или None при ошибке
+
+        Raises:
+            EndpointUnsupported: Ответ со статусом из unsupported_statuses
         """
         # Возвращаем aiohttp для обычных запросов (FlareSolverr не нужен для API)
         import aiohttp
+        from services.http_pool import get_http_session
 
         # Импортируем token_manager
         from services.token_manager import get_token_manager
         token_manager = get_token_manager()
 
-        # Получаем cookies из Redis
+        # Получаем cookies из Redis (синхронный клиент - в потоке, не блокируя
+        # общий event loop воркера)
         cookies_dict = None
         try:
-            cookies_dict = token_manager.get_chitai_gorod_cookies()
+            cookies_dict = await asyncio.to_thread(token_manager.get_chitai_gorod_cookies)
             if cookies_dict:
                 logger.info(f"[ChitaiGorodAPI] Используем {len(cookies_dict)} cookies из Redis")
             else:
@@ -205,10 +255,11 @@ class ChitaiGorodAPIClient:
         else:
             logger.warning("[ChitaiGorodAPI] access-token не найден в cookies!")
 
+        unsupported_status = None
         for attempt in range(self.max_retries):
             try:
                 # Rate limiting
-                await self._random_delay()
+                await self._throttle()
 
                 # Логируем запрос
                 self.request_count += 1
@@ -219,94 +270,102 @@ class ChitaiGorodAPIClient:
                 # Замеряем время выполнения запроса
                 request_start = time.time()
 
-                # Выполняем запрос
-                async with aiohttp.ClientSession(
+                # Выполняем запрос через общий пул соединений (keep-alive между запросами)
+                session = get_http_session()
+                async with session.request(
+                    method,
+                    url,
+                    params={k: v for k, v in (params or {}).items() if v is not None},
+                    headers=headers,
+                    cookies=cookies_dict,  # Добавляем cookies
                     timeout=aiohttp.ClientTimeout(total=self.timeout)
-                ) as session:
-                    async with session.request(
-                        method,
-                        url,
-                        params={k: v for k, v in (params or {}).items() if v is not None},
-                        headers=headers,
-                        cookies=cookies_dict  # Добавляем cookies
-                    ) as response:
-                        self.last_request_time = datetime.now()
-
-                        # Логируем время выполнения
-                        request_time = time.time() - request_start
-                        logger.info(f"[ChitaiGorodAPI] Время запроса: {request_time:.2f} сек")
-
-                        # Обрабатываем ответ
-                        if response.status == 200:
-                            self.success_count += 1
-                            data = await response.json()
-                            logger.info(f"[ChitaiGorodAPI] Успех: {response.status}")
-                            return data
-
-                        elif response.status == 401:
-                            self.error_count += 1
-                            logger.error(f"[ChitaiGorodAPI] Ошибка авторизации (401)! Токен недействителен.")
-
-                            # Триггерим обновление токена (только один раз)
-                            if not self._token_update_triggered:
-                                logger.info("[ChitaiGorodAPI] Триггер обновления токена...")
-                                await self._handle_token_expired()
-                                self._token_update_triggered = True
-
-                                # Ждем обновления токена (до 60 секунд)
-                                await self._wait_for_token_update()
-
-                                # Обновляем токен и cookies в текущем экземпляре
-                                await self._refresh_token()
-                                await self._refresh_cookies()
-
-                                # СНАЧАЛА получаем новые cookies из Redis
-                                try:
-                                    cookies_dict = token_manager.get_chitai_gorod_cookies()
-                                    if cookies_dict:
-                                        logger.info(f"[ChitaiGorodAPI] Обновили cookies: {len(cookies_dict)} cookies")
-                                    else:
-                                        logger.warning("[ChitaiGorodAPI] Cookies не получены после обновления!")
-                                except Exception as e:
-                                    logger.warning(f"[ChitaiGorodAPI] Не удалось обновить cookies: {e}")
-
-                                # Потом создаем headers с новыми cookies
-                                headers = self._get_headers(include_auth=False)
-
-                                # Обновляем Authorization из новых cookies
-                                if cookies_dict and 'access-token' in cookies_dict:
-                                    access_token = cookies_dict['access-token']
-                                    if access_token.startswith('Bearer%20'):
-                                        jwt_token = access_token.replace('Bearer%20', '')
-                                    elif access_token.startswith('Bearer '):
-                                        jwt_token = access_token.replace('Bearer ', '')
-                                    else:
-                                        jwt_token = access_token
-                                    headers["authorization"] = f"Bearer {jwt_token}"
-                                    logger.info(f"[ChitaiGorodAPI] Новый Authorization: {jwt_token[:30]}...")
-
-                                logger.info("[ChitaiGorodAPI] Повторяем запрос с обновленным токеном...")
-                                continue  # Повторяем попытку
-
-                            return None
-
-                        elif response.status == 429:
-                            self.error_count += 1
-                            retry_after = int(response.headers.get('Retry-After', 10))
-                            logger.warning(
-                                f"[ChitaiGorodAPI] Rate limit (429). "
-                                f"Ждем {retry_after} сек перед попыткой {attempt + 1}/{self.max_retries}"
-                            )
-                            await asyncio.sleep(retry_after)
-                            continue
-
-                        else:
-                            self.error_count += 1
-                            error_text = await response.text()
-                            logger.error(
-                                f"[ChitaiGorodAPI] HTTP {response.status}: {error_text[:200]}"
-                            )
-                            return None
+                ) as response:
+                    self.last_request_time = datetime.now()
+
+                    # Логируем время выполнения
+                    request_time = time.time() - request_start
+                    logger.info(f"[ChitaiGorodAPI] Время запроса: {request_time:.2f} сек")
+
+                    # Обрабатываем ответ
+                    if response.status == 200:
+                        self.success_count += 1
+                        data = await response.json()
+                        logger.info(f"[ChitaiGorodAPI] Успех: {response.status}")
+                        return data
+
+                    elif response.status in unsupported_statuses:
+                        unsupported_status = response.status
+                        break
+
+                    elif response.status == 401:
+                        self.error_count += 1
+                        logger.error(f"[ChitaiGorodAPI] Ошибка авторизации (401)! Токен недействителен.")
+
+                        # Триггерим обновление токена (только один раз)
+                        if not self._token_update_triggered:
+                            logger.info("[ChitaiGorodAPI] Триггер обновления токена...")
+                            await self._handle_token_expired()
+                            self._token_update_triggered = True
+
+                            # Ждем обновления токена (до 60 секунд)
+                            await self._wait_for_token_update()
+
+                            # Обновляем токен и cookies в текущем экземпляре
+                            await self._refresh_token()
+                            await self._refresh_cookies()
+
+                            # СНАЧАЛА получаем новые cookies из Redis
+                            try:
+                                cookies_dict = await asyncio.to_thread(token_manager.get_chitai_gorod_cookies)
+                                if cookies_dict:
+                                    logger.info(f"[ChitaiGorodAPI] Обновили cookies: {len(cookies_dict)} cookies")
+                                else:
+                                    logger.warning("[ChitaiGorodAPI] Cookies не получены после обновления!")
+                            except Exception as e:
+                                logger.warning(f"[ChitaiGorodAPI] Не удалось обновить cookies: {e}")
+
+                            # Потом создаем headers с новыми cookies
+                            headers = self._get_headers(include_auth=False)
+
+                            # Обновляем Authorization из новых cookies
+                            if cookies_dict and 'access-token' in cookies_dict:
+                                access_token = cookies_dict['access-token']
+                                if access_token.startswith('Bearer%20'):
+                                    jwt_token = access_token.replace('Bearer%20', '')
+                                elif access_token.startswith('Bearer '):
+                                    jwt_token = access_token.replace('Bearer ', '')
+                                else:
+                                    jwt_token = access_token
+                                headers["authorization"] = f"Bearer {jwt_token}"
+                                logger.info(f"[ChitaiGorodAPI] Новый Authorization: {jwt_token[:30]}...")
+
+                            logger.info("[ChitaiGorodAPI] Повторяем запрос с обновленным токеном...")
+                            continue  # Повторяем попытку
+
+                        return None
+
+                    elif response.status == 429:
+                        self.error_count += 1
+                        try:
+                            retry_after = float(response.headers.get('Retry-After', 10))
+                        except ValueError:
+                            retry_after = 10
+                        # Общий backoff: следующая попытка (и запросы других воркеров)
+                        # дождутся его в лимитере
+                        backoff = await self.rate_limiter.report_throttled(retry_after)
+                        logger.warning(
+                            f"[ChitaiGorodAPI] Rate limit (429). "
+                            f"Пауза {backoff:.0f} сек перед попыткой {attempt + 1}/{self.max_retries}"
+                        )
+                        continue
+
+                    else:
+                        self.error_count += 1
+                        error_text = await response.text()
+                        logger.error(
+                            f"[ChitaiGorodAPI] HTTP {response.status}: {error_text[:200]}"
+                        )
+                        return None
 
             except asyncio.TimeoutError:
                 self.error_count += 1
@@ -335,6 +394,9 @@ class ChitaiGorodAPIClient:
                 if attempt < self.max_retries - 1:
                     await asyncio.sleep(2 ** attempt)
 
+        if unsupported_status is not None:
+            raise EndpointUnsupported(unsupported_status)
+
         logger.error(f"[ChitaiGorodAPI] Не удалось выполнить запрос после {self.max_retries} попыток")
         return None
     
@@ -343,7 +405,7 @@ class ChitaiGorodAPIClient:
         try:
             from services.token_manager import get_token_manager
             token_manager = get_token_manager()
-            token_manager.trigger_token_update()
+            await asyncio.to_thread(token_manager.trigger_token_update)
         except Exception as e:
             logger.error(f"[ChitaiGorodAPI] Ошибка триггера обновления токена: {e}")
 
@@ -355,7 +417,7 @@ class ChitaiGorodAPIClient:
 
             waited = 0
             while waited < max_wait:
-                token = token_manager.get_chitai_gorod_token()
+                token = await asyncio.to_thread(token_manager.get_chitai_gorod_token)
                 if token and token != self.bearer_token:
                     logger.info(f"[ChitaiGorodAPI] Токен обновлен в Redis!")
                     return
@@ -374,7 +436,7 @@ class ChitaiGorodAPIClient:
             from services.token_manager import get_token_manager
             token_manager = get_token_manager()
 
-            new_token = token_manager.get_chitai_gorod_token_fallback()
+            new_token = await asyncio.to_thread(token_manager.get_chitai_gorod_token_fallback)
             if new_token:
                 self.bearer_token = new_token
                 logger.info(f"[ChitaiGorodAPI] Токен обновлен: {new_token[:20]}...")
@@ -390,7 +452,7 @@ class ChitaiGorodAPIClient:
             from services.token_manager import get_token_manager
             token_manager = get_token_manager()
 
-            cookies = token_manager.get_chitai_gorod_cookies()
+            cookies = await asyncio.to_thread(token_manager.get_chitai_gorod_cookies)
             if cookies:
                 logger.info(f"[ChitaiGorodAPI] Cookies обновлены: {len(cookies)} cookies")
             else:
@@ -416,6 +478,26 @@ class ChitaiGorodAPIClient:
         Returns:
             Список найденных книг
         """
+        products, _ = await self.search_products_page(phrase, page, per_page)
+        return products
+
+    async def search_products_page(
+        self,
+        phrase: str,
+        page: int = 1,
+        per_page: int = 60
+    ) -> Tuple[List[ChitaiGorodBook], Optional[int]]:
+        """
+        Поиск товаров (книг) с информацией о пагинации
+        
+        Args:
+            phrase: Поисковый запрос
+            page: Номер страницы
+            per_page: Количество товаров на странице
+            
+        Returns:
+            Кортеж (список книг, количество страниц или None если API его не вернул)
+        """
         url = f"{self.api_url}/search/product"
         params = {
             "customerCityId": self.city_id,
@@ -428,13 +510,51 @@ class ChitaiGorodAPIClient:
         
         if not data:
             logger.warning(f"[ChitaiGorodAPI] Не удалось получить результаты поиска для: {phrase}")
-            return []
+            return [], None
         
         # Парсим ответ в формате JSON API
         products = self._parse_search_response(data)
+        total_pages = self._extract_total_pages(data, per_page)
         
-        logger.info(f"[ChitaiGorodAPI] Найдено {len(products)} товаров по запросу: {phrase}")
-        return products
+        logger.info(
+            f"[ChitaiGorodAPI] Найдено {len(products)} товаров по запросу: {phrase} "
+            f"(страница {page}/{total_pages or '?'})"
+        )
+        return products, total_pages
+
+    def _extract_total_pages(self, response: Dict, per_page: int) -> Optional[int]:
+        """
+        Извлекает количество страниц из meta ответа JSON API
+        
+        Ищет пагинацию в meta документа и в meta связи products.
+        
+        Returns:
+            Количество страниц или None, если пагинация не найдена
+        """
+        candidates = [response.get('meta')]
+        data = response.get('data')
+        if isinstance(data, dict):
+            candidates.append(data.get('meta'))
+            candidates.append(data.get('attributes'))
+            products_rel = (data.get('relationships') or {}).get('products') or {}
+            candidates.append(products_rel.get('meta'))
+
+        for meta in candidates:
+            if not isinstance(meta, dict):
+                continue
+            pagination = meta.get('pagination') if isinstance(meta.get('pagination'), dict) else meta
+
+            for key in ('total-pages', 'totalPages', 'pages', 'last'):
+                value = pagination.get(key)
+                if isinstance(value, int) and value > 0:
+                    return value
+
+            for key in ('total', 'totalCount', 'total-count'):
+                value = pagination.get(key)
+                if isinstance(value, int) and value >= 0:
+                    return max(1, -(-value // per_page))
+
+        return None
     
     def _parse_search_response(self, response: Dict) -> List[ChitaiGorodBook]:
         """
@@ -570,13 +690,180 @@ class ChitaiGorodAPIClient:
         
         return data or {}
     
+    async def _get_cached_product(self, product_id: str) -> Optional[ChitaiGorodBook]:
+        """Товар из кэша: сначала память процесса, затем Redis"""
+        cached = _product_cache.get(product_id)
+        if cached:
+            expires_at, book = cached
+            if expires_at > time.time():
+                logger.debug(f"[ChitaiGorodAPI] Товар {product_id} из локального кэша")
+                return book
+            _product_cache.pop(product_id, None)
+
+        try:
+            from services.redis_client import get_async_redis
+            raw = await get_async_redis().get(f"{PRODUCT_CACHE_PREFIX}{product_id}")
+        except Exception as e:
+            logger.debug(f"[ChitaiGorodAPI] Кэш товаров в Redis недоступен: {e}")
+            return None
+
+        if not raw:
+            return None
+
+        try:
+            book = ChitaiGorodBook.model_validate_json(raw)
+        except Exception as e:
+            logger.warning(f"[ChitaiGorodAPI] Некорректная запись кэша для {product_id}: {e}")
+            return None
+
+        self._store_local(product_id, book)
+        logger.debug(f"[ChitaiGorodAPI] Товар {product_id} из кэша Redis")
+        return book
+
+    def _store_local(self, product_id: str, book: ChitaiGorodBook):
+        """Запись в локальный кэш с ограничением размера"""
+        if len(_product_cache) >= PRODUCT_CACHE_MAX_SIZE:
+            # Удаляем самую старую запись (словарь хранит порядок вставки)
+            _product_cache.pop(next(iter(_product_cache)), None)
+        _product_cache[product_id] = (time.time() + PRODUCT_CACHE_TTL, book)
+
+    async def _cache_product(self, product_id: str, book: ChitaiGorodBook):
+        """Запись товара в локальный кэш и в Redis"""
+        self._store_local(product_id, book)
+
+        try:
+            from services.redis_client import get_async_redis
+            await get_async_redis().setex(
+                f"{PRODUCT_CACHE_PREFIX}{product_id}",
+                PRODUCT_CACHE_TTL,
+                book.model_dump_json()
+            )
+        except Exception as e:
+            logger.debug(f"[ChitaiGorodAPI] Не удалось записать товар в Redis: {e}")
+
+    async def _product_card_unsupported(self) -> bool:
+        """Карточка товара недавно ответила "не поддерживается" (в этом процессе или другом)"""
+        global _product_card_unsupported_until
+        if _product_card_unsupported_until > time.time():
+            return True
+
+        try:
+            from services.redis_client import get_async_redis
+            ttl = await get_async_redis().ttl(PRODUCT_CARD_UNSUPPORTED_KEY)
+        except Exception as e:
+            logger.debug(f"[ChitaiGorodAPI] Не удалось проверить карточку товара в Redis: {e}")
+            return False
+
+        if ttl and ttl > 0:
+            _product_card_unsupported_until = time.time() + ttl
+            return True
+        return False
+
+    async def _mark_product_card_unsupported(self, status: int):
+        """Запоминаем, что карточка товара не работает: следующие запросы идут сразу в поиск"""
+        global _product_card_unsupported_until
+        _product_card_unsupported_until = time.time() + PRODUCT_CARD_UNSUPPORTED_TTL
+        logger.warning(
+            f"[ChitaiGorodAPI] Карточка товара ({PRODUCT_CARD_URL}) ответила HTTP {status}, "
+            f"используем поиск {PRODUCT_CARD_UNSUPPORTED_TTL} сек"
+        )
+
+        try:
+            from services.redis_client import get_async_redis
+            await get_async_redis().set(
+                PRODUCT_CARD_UNSUPPORTED_KEY, status, ex=PRODUCT_CARD_UNSUPPORTED_TTL
+            )
+        except Exception as e:
+            logger.debug(f"[ChitaiGorodAPI] Не удалось записать статус карточки товара в Redis: {e}")
+
+    async def get_product_card(self, product_id: str) -> Optional[ChitaiGorodBook]:
+        """
+        Получение товара через карточку товара (один лёгкий запрос без поиска)
+        
+        Args:
+            product_id: ID товара в магазине
+            
+        Returns:
+            Объект книги или None, если карточка недоступна
+
+        Raises:
+            EndpointUnsupported: Карточка ответила статусом из PRODUCT_CARD_UNSUPPORTED_STATUSES
+        """
+        url = PRODUCT_CARD_URL.format(api_url=self.api_url, product_id=product_id)
+        data = await self._make_request(
+            url,
+            params={"customerCityId": self.city_id},
+            unsupported_statuses=PRODUCT_CARD_UNSUPPORTED_STATUSES,
+        )
+
+        if not data:
+            return None
+
+        # JSON API: товар в data, иногда дополнительно в included
+        items = []
+        if isinstance(data.get('data'), dict):
+            items.append(data['data'])
+        items.extend(item for item in data.get('included', []) if item.get('type') == 'product')
+
+        for item in items:
+            if str(item.get('id', '')) != str(product_id) or not item.get('attributes'):
+                continue
+            book = self._parse_product_item(item)
+            if book:
+                logger.info(f"[ChitaiGorodAPI] Получена карточка товара {product_id}: {book.title}")
+                return book
+
+        logger.warning(f"[ChitaiGorodAPI] Карточка товара {product_id} не содержит данных товара")
+        return None
+
     async def get_product_by_id(self, product_id: str) -> Optional[ChitaiGorodBook]:
         """
         Получение товара по ID (точное совпадение)
         
+        Порядок: кэш (память/Redis) -> карточка товара -> поиск по ID.
+        Найденный товар кэшируется на PRODUCT_CACHE_TTL секунд. Если карточка
+        не поддерживается (404 при найденном поиском товаре, 405, 501), она
+        не запрашивается PRODUCT_CARD_UNSUPPORTED_TTL секунд.
+        
         Args:
             product_id: ID товара в магазине (например, '2558779')
             
+        Returns:
+            Объект книги или None
+        """
+        product_id = str(product_id)
+
+        cached = await self._get_cached_product(product_id)
+        if cached:
+            return cached
+
+        product = None
+        card_status = None
+        if not await self._product_card_unsupported():
+            try:
+                product = await self.get_product_card(product_id)
+            except EndpointUnsupported as e:
+                card_status = e.status
+
+        if not product:
+            # Карточка недоступна - ищем через поиск
+            product = await self._search_product_by_id(product_id)
+            # 404 для существующего товара - эндпоинт карточки не работает
+            if card_status is not None and (product or card_status != 404):
+                await self._mark_product_card_unsupported(card_status)
+
+        if product:
+            await self._cache_product(product_id, product)
+
+        return product
+
+    async def _search_product_by_id(self, product_id: str) -> Optional[ChitaiGorodBook]:
+        """
+        Поиск товара по ID через полнотекстовый поиск (резервный способ)
+        
+        Args:
+            product_id: ID товара в магазине
+            
         Returns:
             Объект книги или None
         """
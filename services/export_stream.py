@@ -0,0 +1,188 @@
+"""
+Потоковый экспорт таблиц из админ-панели
+
+Строки читаются серверным курсором (AsyncSession.stream + yield_per) и сразу
+пишутся в ответ, поэтому память не зависит от размера таблицы:
+- запрос выбирает только нужные колонки, ORM объекты не создаются
+- csv: строка CSV на запись
+- ndjson: JSON объект на строку
+- json: прежний формат {"success": true, "data": [...]}, записываемый по частям
+- gzip: ответ сжимается на лету (файл .gz)
+
+Экспорт открывает собственную сессию: ответ пишется уже после выхода из
+эндпоинта.
+"""
+
+import io
+import os
+import csv
+import json
+import zlib
+from datetime import datetime
+from decimal import Decimal
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional, Sequence
+
+from dotenv import load_dotenv
+from fastapi.responses import StreamingResponse
+
+from database.config import get_session_factory
+from services.logger import logger
+
+# Загружаем переменные окружения из .env
+load_dotenv()
+
+# Строк в одной порции серверного курсора
+EXPORT_YIELD_PER = int(os.getenv("EXPORT_YIELD_PER", "1000"))
+# Строк CSV/NDJSON в одном фрагменте ответа
+EXPORT_CHUNK_ROWS = 200
+
+FORMAT_JSON = "json"
+FORMAT_NDJSON = "ndjson"
+FORMAT_CSV = "csv"
+EXPORT_FORMATS = (FORMAT_JSON, FORMAT_NDJSON, FORMAT_CSV)
+
+_MEDIA_TYPES = {
+    FORMAT_JSON: "application/json",
+    FORMAT_NDJSON: "application/x-ndjson",
+    FORMAT_CSV: "text/csv",
+}
+
+
+def _json_default(value: Any):
+    """Сериализация значений, которые json не умеет сам"""
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return float(value)
+    return str(value)
+
+
+def _dumps(data: Dict) -> str:
+    return json.dumps(data, ensure_ascii=False, default=_json_default)
+
+
+async def stream_rows(stmt) -> AsyncIterator[Any]:
+    """Строки запроса серверным курсором, порциями по EXPORT_YIELD_PER"""
+    session_factory = get_session_factory()
+    async with session_factory() as db:
+        result = await db.stream(stmt.execution_options(yield_per=EXPORT_YIELD_PER))
+        async for partition in result.partitions():
+            for row in partition:
+                yield row
+
+
+async def _encode(
+    rows: AsyncIterator[Any],
+    export_format: str,
+    csv_header: Sequence[str],
+    csv_row: Callable[[Any], List],
+    json_row: Callable[[Any], Dict],
+    json_tail: Optional[Callable[[], Dict]] = None,
+) -> AsyncIterator[str]:
+    """Текст ответа по частям"""
+    if export_format == FORMAT_CSV:
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(csv_header)
+        count = 0
+        async for row in rows:
+            writer.writerow(csv_row(row))
+            count += 1
+            if count % EXPORT_CHUNK_ROWS == 0:
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+        yield buffer.getvalue()
+
+    elif export_format == FORMAT_NDJSON:
+        lines = []
+        async for row in rows:
+            lines.append(_dumps(json_row(row)))
+            if len(lines) >= EXPORT_CHUNK_ROWS:
+                yield "\n".join(lines) + "\n"
+                lines = []
+        if lines:
+            yield "\n".join(lines) + "\n"
+
+    else:
+        yield '{"success": true, "data": ['
+        separator = ""
+        async for row in rows:
+            yield separator + _dumps(json_row(row))
+            separator = ","
+        yield "]"
+        # Поля после data (например, курсор следующей страницы)
+        if json_tail:
+            for key, value in json_tail().items():
+                yield f", {_dumps(key)}: {_dumps(value)}"
+        yield "}"
+
+
+async def _gzip(chunks: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+    """Сжатие потока в формат gzip"""
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    async for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+async def _to_bytes(chunks: AsyncIterator[str], name: str) -> AsyncIterator[bytes]:
+    """Кодирование в UTF-8 и логирование ошибок (статус ответа уже отправлен)"""
+    try:
+        async for chunk in chunks:
+            yield chunk.encode("utf-8")
+    except Exception as e:
+        logger.error(f"Ошибка потокового экспорта {name}: {e}")
+        raise
+
+
+def export_response(
+    rows: AsyncIterator[Any],
+    name: str,
+    export_format: str,
+    csv_header: Sequence[str],
+    csv_row: Callable[[Any], List],
+    json_row: Callable[[Any], Dict],
+    gzip: bool = False,
+    json_tail: Optional[Callable[[], Dict]] = None,
+    headers: Optional[Dict[str, str]] = None,
+) -> StreamingResponse:
+    """
+    Потоковый ответ с экспортом
+
+    Args:
+        rows: Строки (обычно stream_rows(select(...колонки...)))
+        name: Имя файла без расширения
+        export_format: FORMAT_JSON, FORMAT_NDJSON или FORMAT_CSV
+        csv_header: Заголовок CSV
+        csv_row: Строка CSV для записи
+        json_row: Объект JSON/NDJSON для записи
+        gzip: Сжимать ли ответ (файл .gz)
+        json_tail: Поля JSON после data, вычисляются после выгрузки всех строк
+        headers: Дополнительные заголовки ответа (известные до выгрузки строк)
+
+    Raises:
+        ValueError: Неизвестный формат
+    """
+    if export_format not in EXPORT_FORMATS:
+        raise ValueError(f"Неизвестный формат экспорта: {export_format}")
+
+    body = _to_bytes(
+        _encode(rows, export_format, csv_header, csv_row, json_row, json_tail),
+        name
+    )
+    filename = f"{name}.{export_format}"
+    media_type = _MEDIA_TYPES[export_format]
+
+    if gzip:
+        body = _gzip(body)
+        filename += ".gz"
+        media_type = "application/gzip"
+
+    return StreamingResponse(
+        body,
+        media_type=media_type,
+        headers={**(headers or {}), "Content-Disposition": f"attachment; filename={filename}"}
+    )
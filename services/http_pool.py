@@ -0,0 +1,110 @@
+"""
+Общий пул HTTP-соединений для парсеров и API клиентов
+
+Содержит:
+- Одну aiohttp.ClientSession на event loop (соединения aiohttp привязаны к циклу)
+- TCPConnector с keep-alive, кэшем DNS и лимитом соединений на хост
+- Хуки закрытия для lifespan FastAPI и воркеров Celery
+"""
+
+import os
+import asyncio
+import weakref
+from typing import Optional
+
+import aiohttp
+from dotenv import load_dotenv
+
+from services.logger import logger
+
+# Загружаем переменные окружения из .env
+load_dotenv()
+
+# Настройки пула
+HTTP_POOL_LIMIT = int(os.getenv("HTTP_POOL_LIMIT", "100"))                  # Всего соединений
+HTTP_POOL_LIMIT_PER_HOST = int(os.getenv("HTTP_POOL_LIMIT_PER_HOST", "10"))  # Соединений на один хост
+HTTP_POOL_DNS_TTL = int(os.getenv("HTTP_POOL_DNS_TTL", "300"))              # Кэш DNS (сек)
+HTTP_POOL_KEEPALIVE = float(os.getenv("HTTP_POOL_KEEPALIVE", "30"))         # Keep-alive (сек)
+HTTP_POOL_TIMEOUT = float(os.getenv("HTTP_POOL_TIMEOUT", "30"))             # Таймаут по умолчанию (сек)
+
+# Сессии по event loop. Слабые ссылки на цикл: закрытый и удалённый цикл
+# не держит сессию в памяти
+_sessions: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, aiohttp.ClientSession]" = weakref.WeakKeyDictionary()
+
+
+def _create_session() -> aiohttp.ClientSession:
+    """Создание сессии с настроенным коннектором"""
+    connector = aiohttp.TCPConnector(
+        limit=HTTP_POOL_LIMIT,
+        limit_per_host=HTTP_POOL_LIMIT_PER_HOST,
+        ttl_dns_cache=HTTP_POOL_DNS_TTL,
+        keepalive_timeout=HTTP_POOL_KEEPALIVE,
+        enable_cleanup_closed=True,
+    )
+
+    return aiohttp.ClientSession(
+        connector=connector,
+        timeout=aiohttp.ClientTimeout(total=HTTP_POOL_TIMEOUT),
+        # Cookies передаются явно в каждом запросе, общий cookie jar
+        # между разными клиентами не нужен
+        cookie_jar=aiohttp.DummyCookieJar(),
+    )
+
+
+def get_http_session() -> aiohttp.ClientSession:
+    """
+    Получение общей HTTP-сессии для текущего event loop
+
+    Должна вызываться из корутины. Таймаут, заголовки, cookies и прокси
+    передаются в каждом запросе отдельно.
+    """
+    loop = asyncio.get_running_loop()
+
+    session: Optional[aiohttp.ClientSession] = _sessions.get(loop)
+    if session is None or session.closed:
+        session = _create_session()
+        _sessions[loop] = session
+        logger.debug(
+            f"[HTTPPool] Создана сессия: limit={HTTP_POOL_LIMIT}, "
+            f"limit_per_host={HTTP_POOL_LIMIT_PER_HOST}"
+        )
+
+    return session
+
+
+async def close_http_session():
+    """Закрытие сессии текущего event loop (вызывать перед loop.close())"""
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        return
+
+    session = _sessions.pop(loop, None)
+    if session is not None and not session.closed:
+        try:
+            await session.close()
+            logger.debug("[HTTPPool] Сессия закрыта")
+        except Exception as e:
+            logger.warning(f"[HTTPPool] Ошибка закрытия сессии: {e}")
+
+
+def close_http_sessions_sync():
+    """
+    Закрытие всех сессий из синхронного кода (сигналы Celery)
+
+    Сессии живых циклов закрываются в своём цикле; если цикл уже закрыт,
+    сессия просто отбрасывается - её сокеты уже недействительны.
+    """
+    for loop, session in list(_sessions.items()):
+        _sessions.pop(loop, None)
+        if session.closed:
+            continue
+        try:
+            if loop.is_closed():
+                continue
+            if loop.is_running():
+                asyncio.run_coroutine_threadsafe(session.close(), loop)
+            else:
+                loop.run_until_complete(session.close())
+        except Exception as e:
+            logger.warning(f"[HTTPPool] Ошибка закрытия сессии: {e}")
@@ -0,0 +1,282 @@
+"""
+Доставка сообщений в Telegram
+
+Содержит:
+- один telegram.Bot на event loop (HTTP клиент бота привязан к циклу, как
+  сессии services/http_pool.py) с пулом соединений под параллельную отправку
+- send_messages - отправка очереди сообщений пулом корутин:
+  - общий для всех воркеров лимит Bot API (HostRateLimiter для api.telegram.org,
+    по умолчанию 25 сообщений/сек при ограничении Telegram ~30/сек)
+  - не чаще одного сообщения в TELEGRAM_CHAT_INTERVAL в один чат
+  - RetryAfter: общий backoff для всех воркеров и повтор сообщения
+  - сетевые ошибки повторяются, Forbidden/BadRequest (бот заблокирован,
+    чат не найден) - нет
+- book_message - текст уведомления о книге
+- record_results - статусы уведомлений пачкой (UPDATE ... WHERE id = ANY)
+"""
+
+import os
+import time
+import asyncio
+import weakref
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from dotenv import load_dotenv
+from sqlalchemy import text, bindparam, Integer, String
+from sqlalchemy.dialects.postgresql import ARRAY
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from services.logger import celery_logger
+from services.rate_limiter import get_host_limiter
+
+# Загружаем переменные окружения из .env
+load_dotenv()
+
+TELEGRAM_API_HOST = "api.telegram.org"
+# Сообщений в секунду на бота (все воркеры) и допустимый всплеск
+TELEGRAM_RATE_LIMIT = float(os.getenv("TELEGRAM_RATE_LIMIT", "25"))
+TELEGRAM_RATE_BURST = int(os.getenv("TELEGRAM_RATE_BURST", "25"))
+# Минимальный интервал между сообщениями в один чат (сек)
+TELEGRAM_CHAT_INTERVAL = float(os.getenv("TELEGRAM_CHAT_INTERVAL", "1.0"))
+# Одновременных запросов к Bot API из процесса и повторов сообщения
+TELEGRAM_SEND_CONCURRENCY = int(os.getenv("TELEGRAM_SEND_CONCURRENCY", "20"))
+TELEGRAM_SEND_RETRIES = int(os.getenv("TELEGRAM_SEND_RETRIES", "3"))
+
+# Пауза перед повтором после сетевой ошибки (сек)
+_NETWORK_RETRY_DELAY = 2.0
+
+_bots: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, object]" = weakref.WeakKeyDictionary()
+
+
+@dataclass
+class OutboundMessage:
+    """Сообщение для отправки (notification_id - запись notifications, если есть)"""
+
+    chat_id: int
+    text: str
+    notification_id: Optional[int] = None
+    parse_mode: str = "HTML"
+
+
+@dataclass
+class DeliveryResult:
+    """Результат отправки сообщения"""
+
+    message: OutboundMessage
+    sent: bool
+    error: Optional[str] = None
+    telegram_message_id: Optional[int] = None
+
+
+async def get_telegram_bot():
+    """Бот для текущего event loop (создаётся один раз)"""
+    loop = asyncio.get_running_loop()
+
+    bot = _bots.get(loop)
+    if bot is None:
+        from telegram import Bot
+        from telegram.request import HTTPXRequest
+
+        token = os.getenv("TELEGRAM_BOT_TOKEN")
+        if not token:
+            raise ValueError("TELEGRAM_BOT_TOKEN не найден в переменных окружения")
+
+        bot = Bot(
+            token=token,
+            request=HTTPXRequest(connection_pool_size=TELEGRAM_SEND_CONCURRENCY),
+        )
+        await bot.initialize()
+        _bots[loop] = bot
+
+    return bot
+
+
+async def close_telegram_bot():
+    """Закрытие бота текущего event loop (вызывать перед loop.close())"""
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        return
+
+    bot = _bots.pop(loop, None)
+    if bot is not None:
+        try:
+            await bot.shutdown()
+        except Exception as e:
+            celery_logger.warning(f"Ошибка закрытия Telegram бота: {e}")
+
+
+def _retry_after_seconds(error) -> float:
+    """Retry-After из RetryAfter (секунды или timedelta в зависимости от версии)"""
+    retry_after = error.retry_after
+    if hasattr(retry_after, "total_seconds"):
+        return retry_after.total_seconds()
+    return float(retry_after)
+
+
+async def send_messages(
+    messages: List[OutboundMessage],
+    concurrency: int = TELEGRAM_SEND_CONCURRENCY,
+) -> List[DeliveryResult]:
+    """
+    Отправка сообщений с соблюдением лимитов Telegram
+
+    Returns:
+        Результаты в порядке messages
+    """
+    if not messages:
+        return []
+
+    from telegram.error import BadRequest, Forbidden, NetworkError, RetryAfter
+
+    bot = await get_telegram_bot()
+    limiter = get_host_limiter(TELEGRAM_API_HOST, rate=TELEGRAM_RATE_LIMIT, capacity=TELEGRAM_RATE_BURST)
+
+    results: List[Optional[DeliveryResult]] = [None] * len(messages)
+    # Время, раньше которого в чат нельзя отправить следующее сообщение
+    chat_ready_at: Dict[int, float] = {}
+
+    queue: asyncio.Queue = asyncio.Queue()
+    for index, message in enumerate(messages):
+        queue.put_nowait((index, message, 0))
+
+    async def send(index: int, message: OutboundMessage, attempt: int):
+        # Слот в чате резервируется до ожидания: сообщения в один чат идут по очереди
+        now = time.monotonic()
+        ready_at = max(chat_ready_at.get(message.chat_id, now), now)
+        chat_ready_at[message.chat_id] = ready_at + TELEGRAM_CHAT_INTERVAL
+        if ready_at > now:
+            await asyncio.sleep(ready_at - now)
+
+        await limiter.acquire()
+
+        retry_delay = None
+        try:
+            sent = await bot.send_message(
+                chat_id=message.chat_id,
+                text=message.text,
+                parse_mode=message.parse_mode,
+            )
+            results[index] = DeliveryResult(message, True, telegram_message_id=sent.message_id)
+            return
+        except RetryAfter as e:
+            # Пауза для всех воркеров, сообщение уходит в конец очереди
+            await limiter.report_throttled(_retry_after_seconds(e))
+            error = f"RetryAfter: {e}"
+        except (Forbidden, BadRequest) as e:
+            results[index] = DeliveryResult(message, False, error=str(e))
+            return
+        except NetworkError as e:
+            error = f"NetworkError: {e}"
+            retry_delay = _NETWORK_RETRY_DELAY * (attempt + 1)
+
+        if attempt >= TELEGRAM_SEND_RETRIES:
+            results[index] = DeliveryResult(message, False, error=error)
+            return
+        if retry_delay:
+            await asyncio.sleep(retry_delay)
+        queue.put_nowait((index, message, attempt + 1))
+
+    async def worker():
+        while True:
+            index, message, attempt = await queue.get()
+            try:
+                await send(index, message, attempt)
+            except Exception as e:
+                results[index] = DeliveryResult(message, False, error=str(e))
+            finally:
+                queue.task_done()
+
+    workers = [asyncio.create_task(worker()) for _ in range(max(min(concurrency, len(messages)), 1))]
+    try:
+        await queue.join()
+    finally:
+        for task in workers:
+            task.cancel()
+        await asyncio.gather(*workers, return_exceptions=True)
+
+    sent_count = sum(1 for result in results if result.sent)
+    if len(messages) > 1 or sent_count < len(messages):
+        celery_logger.info(f"📨 Telegram: отправлено {sent_count} из {len(messages)} сообщений")
+    return results
+
+
+async def send_message(chat_id: int, text: str, parse_mode: str = "HTML") -> DeliveryResult:
+    """Отправка одного сообщения через общий бот и лимиты"""
+    return (await send_messages([OutboundMessage(chat_id, text, parse_mode=parse_mode)]))[0]
+
+
+def book_message(
+    title: str,
+    author: Optional[str],
+    current_price,
+    url: Optional[str],
+    original_price=None,
+    discount_percent=None,
+    target_price=None,
+) -> str:
+    """Текст уведомления о найденной по подписке книге (HTML)"""
+    message = f"📚 <b>Найдена книга по вашей подписке!</b>\n\n"
+    message += f"📖 <b>{title}</b>\n"
+    if author:
+        message += f"👤 Автор: {author}\n"
+    message += f"💰 Цена: <b>{current_price} руб.</b>\n"
+    if original_price and original_price > current_price:
+        message += f"💸 Старая цена: <s>{original_price} руб.</s>\n"
+    if discount_percent:
+        message += f"🔥 Скидка: <b>{discount_percent}%</b>\n"
+    message += f"\n🔗 <a href='{url}'>Ссылка на книгу</a>"
+
+    if target_price:
+        message += f"\n\n✅ Цена соответствует вашему лимиту ({target_price} руб.)"
+    return message
+
+
+# Одно время отправки на пачку, ID сообщений Telegram - попарно с ID уведомлений
+_MARK_SENT = text("""
+    UPDATE notifications AS n
+    SET status = 'sent',
+        is_sent = true,
+        sent_at = :sent_at,
+        telegram_message_id = v.message_id
+    FROM unnest(:ids, :message_ids) AS v(id, message_id)
+    WHERE n.id = v.id
+""").bindparams(
+    bindparam("ids", type_=ARRAY(Integer)),
+    bindparam("message_ids", type_=ARRAY(String)),
+)
+
+# Один UPDATE на каждый текст ошибки
+_MARK_FAILED = text("""
+    UPDATE notifications
+    SET status = 'failed',
+        error_message = :error_message,
+        retry_count = COALESCE(retry_count, 0) + 1
+    WHERE id = ANY(:ids)
+""").bindparams(bindparam("ids", type_=ARRAY(Integer)))
+
+
+async def record_results(db: AsyncSession, results: List[DeliveryResult]):
+    """Статусы уведомлений по результатам отправки: пакетные UPDATE (без commit)"""
+    sent = [
+        result for result in results
+        if result.sent and result.message.notification_id
+    ]
+    failed: Dict[Optional[str], List[int]] = {}
+    for result in results:
+        if not result.sent and result.message.notification_id:
+            failed.setdefault(result.error, []).append(result.message.notification_id)
+
+    if sent:
+        await db.execute(_MARK_SENT, {
+            "sent_at": datetime.now(),
+            "ids": [result.message.notification_id for result in sent],
+            "message_ids": [
+                str(result.telegram_message_id) if result.telegram_message_id else None
+                for result in sent
+            ],
+        })
+    for error, notification_ids in failed.items():
+        await db.execute(_MARK_FAILED, {"error_message": error, "ids": notification_ids})
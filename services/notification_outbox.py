@@ -0,0 +1,170 @@
+"""
+Отправка уведомлений из очереди notifications (status = 'pending')
+
+Уведомление сначала сохраняется со статусом pending, затем отправляется.
+Если отправка не состоялась (воркер упал, ошибка до отправки), уведомление
+отправляет drain_pending (задача send_pending_notifications):
+- пачка pending уведомлений блокируется SELECT ... FOR UPDATE SKIP LOCKED -
+  несколько воркеров разбирают очередь параллельно, не пересекаясь;
+  уведомления моложе NOTIFICATION_OUTBOX_GRACE секунд не берутся - их
+  сейчас отправляет создавшая задача
+- пользователи и подписки пачки загружаются selectinload (по запросу на
+  связь вместо двух запросов на уведомление)
+- сообщения отправляются services.notification_delivery.send_messages,
+  статусы пишутся пакетными UPDATE ... WHERE id = ANY в той же транзакции;
+  если транзакция не удалась после отправки, статусы отправленных
+  сообщений сохраняются отдельно (иначе они уйдут повторно)
+- подписки отправленных уведомлений деактивируются одним UPDATE
+"""
+
+import os
+from datetime import datetime, timedelta
+from typing import List, Optional
+
+from sqlalchemy import select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import selectinload
+
+from models import Alert, Notification
+from services.logger import celery_logger
+from services import notification_delivery as delivery
+from services.alert_index import publish_alert_changes
+
+# Уведомлений в одной пачке (одна транзакция с блокировкой строк)
+NOTIFICATION_OUTBOX_BATCH = int(os.getenv("NOTIFICATION_OUTBOX_BATCH", "200"))
+# Возраст pending уведомления (сек), после которого его отправляет outbox
+NOTIFICATION_OUTBOX_GRACE = int(os.getenv("NOTIFICATION_OUTBOX_GRACE", "120"))
+
+
+def _parse_number(value: Optional[str], suffix: str) -> float:
+    """Число из строкового поля уведомления ("350 руб.", "25%")"""
+    try:
+        return float((value or "").replace(suffix, "").strip() or 0)
+    except ValueError:
+        return 0
+
+
+def _notification_message(notification: Notification) -> str:
+    """Текст сообщения по сохранённым в уведомлении данным книги"""
+    price = _parse_number(notification.book_price, "руб.")
+    discount = _parse_number(notification.book_discount, "%")
+    alert = notification.alert
+    return delivery.book_message(
+        title=notification.book_title,
+        author=notification.book_author,
+        current_price=int(price) if price.is_integer() else price,
+        url=notification.book_url or "",
+        discount_percent=int(discount),
+        target_price=alert.target_price if alert else None,
+    )
+
+
+async def claim_pending(db: AsyncSession, limit: int = NOTIFICATION_OUTBOX_BATCH) -> List[Notification]:
+    """
+    Пачка pending уведомлений, заблокированная до конца транзакции
+
+    Строки, заблокированные другим воркером, пропускаются (SKIP LOCKED).
+    Свежие уведомления (NOTIFICATION_OUTBOX_GRACE) не берутся: создавшая их
+    задача может отправлять их прямо сейчас, уже закоммитив pending.
+    """
+    # created_at заполняется datetime.utcnow (models/notification.py)
+    created_before = datetime.utcnow() - timedelta(seconds=NOTIFICATION_OUTBOX_GRACE)
+    result = await db.execute(
+        select(Notification)
+        .where(Notification.status == "pending", Notification.created_at < created_before)
+        .order_by(Notification.id)
+        .limit(limit)
+        .with_for_update(skip_locked=True, of=Notification)
+        .options(selectinload(Notification.user), selectinload(Notification.alert))
+    )
+    return list(result.scalars().all())
+
+
+async def _commit_sent(db: AsyncSession, results: List[delivery.DeliveryResult]):
+    """Статусы только отправленных сообщений отдельной транзакцией (после отката пачки)"""
+    sent = [result for result in results if result.sent]
+    if not sent:
+        return
+    try:
+        await delivery.record_results(db, sent)
+        await db.commit()
+    except Exception as e:
+        await db.rollback()
+        celery_logger.error(f"❌ Не удалось сохранить статусы {len(sent)} отправленных уведомлений: {e}")
+
+
+async def _send_batch(db: AsyncSession, notifications: List[Notification]) -> int:
+    """Отправка пачки и запись статусов (commit снимает блокировки)"""
+    messages = []
+    results = []
+    for notification in notifications:
+        telegram_id = notification.user.telegram_id if notification.user else None
+        message = delivery.OutboundMessage(
+            telegram_id or 0, _notification_message(notification), notification.id
+        )
+        if telegram_id:
+            messages.append(message)
+        else:
+            results.append(delivery.DeliveryResult(message, False, error="No telegram_id"))
+    results.extend(await delivery.send_messages(messages))
+
+    # Подписка деактивируется после первого отправленного уведомления
+    sent_ids = {result.message.notification_id for result in results if result.sent}
+    alert_ids = {
+        notification.alert_id for notification in notifications
+        if notification.id in sent_ids and notification.alert and notification.alert.is_active
+    }
+    deactivated = []
+    try:
+        await delivery.record_results(db, results)
+        if alert_ids:
+            deactivated = (await db.execute(
+                update(Alert)
+                .where(Alert.id.in_(alert_ids), Alert.is_active == True)
+                .values(is_active=False, updated_at=datetime.now())
+                .returning(Alert.id)
+                .execution_options(synchronize_session=False)
+            )).scalars().all()
+        await db.commit()
+    except Exception:
+        await db.rollback()
+        await _commit_sent(db, results)
+        raise
+
+    if deactivated:
+        await publish_alert_changes(deactivated)
+
+    for result in results:
+        if not result.sent:
+            celery_logger.error(f"❌ Уведомление {result.message.notification_id} не отправлено: {result.error}")
+    return len(sent_ids)
+
+
+async def drain_pending(session_factory, batch_size: int = NOTIFICATION_OUTBOX_BATCH) -> int:
+    """
+    Отправка всех pending уведомлений пачками
+
+    Returns:
+        Количество отправленных уведомлений
+    """
+    sent_count = 0
+    processed = 0
+    while True:
+        async with session_factory() as db:
+            notifications = await claim_pending(db, batch_size)
+            if not notifications:
+                break
+            try:
+                sent_count += await _send_batch(db, notifications)
+            except Exception:
+                await db.rollback()
+                raise
+        processed += len(notifications)
+        if len(notifications) < batch_size:
+            break
+
+    if processed:
+        celery_logger.info(f"Pending уведомления: отправлено {sent_count} из {processed}")
+    else:
+        celery_logger.info("Нет pending уведомлений для отправки")
+    return sent_count
@@ -0,0 +1,98 @@
+"""
+Объединение одинаковых задач парсинга (single-flight)
+
+Первый запрос на парсинг (источник, нормализованный запрос, страницы,
+fetch_details) становится лидером: запускает задачу parse_books и сохраняет
+её task_id в Redis. Все одновременные такие же запросы получают тот же
+task_id и подписываются на его результат - поток книг (services.parse_stream)
+и итог в result backend Celery. Задача снимает ключ по завершении.
+"""
+
+import os
+import uuid
+import hashlib
+from typing import Tuple
+
+from services.logger import celery_logger, logger
+from services.redis_client import get_async_redis
+from services.search_utils import normalize_text
+
+# Максимальное время жизни ключа лидера (сек): если воркер упал,
+# не снявший ключ, следующий запрос через это время запустит новую задачу
+PARSE_FLIGHT_TTL = int(os.getenv("PARSE_FLIGHT_TTL", "300"))
+
+# Снятие ключа только своей задачей (ключ мог истечь и перейти другому лидеру)
+RELEASE_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+
+def get_flight_key(query: str, source: str, fetch_details: bool, max_pages: int, force: bool = False) -> str:
+    """Ключ лидера для набора параметров парсинга"""
+    query_hash = hashlib.md5(normalize_text(query).encode()).hexdigest()
+    return f"parse_flight:{source}:{max_pages}:{int(bool(fetch_details))}:{int(bool(force))}:{query_hash}"
+
+
+async def start_parse(
+    query: str,
+    source: str = "chitai-gorod",
+    fetch_details: bool = False,
+    max_pages: int = 1,
+    force: bool = False
+) -> Tuple[str, bool]:
+    """
+    Запуск парсинга или подключение к уже запущенной такой же задаче
+
+    Args:
+        force: Парсить, даже если похожие книги уже есть в базе (подробный
+            поиск, обновление устаревшего кэша выдачи)
+
+    Returns:
+        Кортеж (task_id, запущена ли новая задача)
+    """
+    from services.celery_tasks import parse_books
+
+    key = get_flight_key(query, source, fetch_details, max_pages, force)
+    # task_id генерируется заранее, чтобы записать его в Redis до запуска задачи
+    task_id = str(uuid.uuid4())
+
+    try:
+        redis_client = get_async_redis()
+        for _ in range(2):
+            if await redis_client.set(key, task_id, nx=True, ex=PARSE_FLIGHT_TTL):
+                break
+            leader_id = await redis_client.get(key)
+            if leader_id:
+                logger.info(f"Парсинг '{query}' из '{source}' уже выполняется, подключаемся к {leader_id}")
+                return leader_id, False
+            # Ключ истёк между SET и GET - пробуем стать лидером ещё раз
+    except Exception as e:
+        # Без Redis задачи не объединяются, но парсинг работает
+        logger.warning(f"Ошибка single-flight для '{query}' из '{source}': {e}")
+
+    parse_books.apply_async(
+        kwargs={
+            "query": query,
+            "source": source,
+            "fetch_details": fetch_details,
+            "max_pages": max_pages,
+            "force": force,
+        },
+        task_id=task_id
+    )
+    logger.info(f"Запущен парсинг для '{query}' из '{source}' (task_id: {task_id})")
+    return task_id, True
+
+
+async def release_flight(query: str, source: str, fetch_details: bool, max_pages: int, task_id: str,
+                         force: bool = False):
+    """Снятие ключа лидера по завершении задачи"""
+    try:
+        await get_async_redis().eval(
+            RELEASE_SCRIPT, 1, get_flight_key(query, source, fetch_details, max_pages, force), task_id
+        )
+    except Exception as e:
+        celery_logger.warning(f"Не удалось снять ключ single-flight задачи {task_id}: {e}")
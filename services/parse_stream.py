@@ -0,0 +1,115 @@
+"""
+Потоковая выдача результатов парсинга
+
+Задача parse_books публикует события в Redis Stream с ключом по task_id:
+- books  - очередная порция книг (после каждой загруженной страницы)
+- done   - задача завершена (итог parse_books)
+
+API читает эти события и отдаёт их клиенту через Server-Sent Events.
+Redis Stream используется вместо pub/sub, чтобы клиент, подключившийся
+после первой страницы, получил все события с начала.
+"""
+
+import json
+import asyncio
+from typing import AsyncIterator, Dict, List, Optional
+
+from services.logger import celery_logger, logger
+from services.redis_client import async_pipeline, get_async_blocking_redis, get_async_redis
+
+# Время жизни потока после последнего события (сек)
+PARSE_STREAM_TTL = 600
+# Максимальная длина потока (событий)
+PARSE_STREAM_MAXLEN = 1000
+
+
+def get_stream_key(task_id: str) -> str:
+    """Ключ Redis Stream для задачи"""
+    return f"parse_stream:{task_id}"
+
+
+class ParseStreamPublisher:
+    """Публикация событий задачи парсинга (используется внутри Celery задачи)"""
+
+    def __init__(self, task_id: str, source: str):
+        self.task_id = task_id
+        self.source = source
+        self.key = get_stream_key(task_id)
+        self.books_published = 0
+
+    async def _publish(self, event: Dict):
+        """Добавление события в поток (ошибки Redis не прерывают парсинг)"""
+        event.setdefault("task_id", self.task_id)
+        event.setdefault("source", self.source)
+
+        try:
+            # XADD и EXPIRE одним запросом
+            async with async_pipeline() as pipe:
+                pipe.xadd(
+                    self.key,
+                    {"data": json.dumps(event, ensure_ascii=False, default=str)},
+                    maxlen=PARSE_STREAM_MAXLEN,
+                    approximate=True
+                )
+                pipe.expire(self.key, PARSE_STREAM_TTL)
+        except Exception as e:
+            celery_logger.warning(f"Не удалось опубликовать событие парсинга {self.task_id}: {e}")
+
+    async def publish_books(self, books: List[Dict]):
+        """Публикация порции книг (словари в формате Book.to_dict())"""
+        if not books:
+            return
+        self.books_published += len(books)
+        await self._publish({"type": "books", "books": books})
+
+    async def publish_done(self, result: Dict):
+        """Публикация итога задачи"""
+        await self._publish({"type": "done", "result": result})
+
+
+async def iter_parse_events(
+    task_ids: List[str],
+    timeout: float = 90,
+    block_ms: int = 15000
+) -> AsyncIterator[Optional[Dict]]:
+    """
+    Чтение событий задач парсинга
+
+    Возвращает события по мере поступления. None означает, что за block_ms
+    событий не было (используется для heartbeat и проверки статуса задач).
+    Завершается, когда по всем задачам получено событие done или истёк timeout.
+    XREAD BLOCK занимает соединение на время ожидания, поэтому читает через
+    отдельный пул блокирующих команд, а не через общий.
+    """
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    last_ids = {get_stream_key(task_id): "0" for task_id in task_ids}
+    done = set()
+
+    client = get_async_blocking_redis()
+    try:
+        while len(done) < len(task_ids) and loop.time() < deadline:
+            response = await client.xread(last_ids, block=block_ms, count=100)
+
+            if not response:
+                yield None
+                continue
+
+            for key, entries in response:
+                for entry_id, fields in entries:
+                    last_ids[key] = entry_id
+                    try:
+                        event = json.loads(fields.get("data", "{}"))
+                    except ValueError:
+                        continue
+
+                    if event.get("type") == "done":
+                        done.add(event.get("task_id"))
+                    yield event
+    except Exception as e:
+        logger.error(f"Ошибка чтения событий парсинга: {e}")
+
+
+async def stream_exists(task_id: str) -> bool:
+    """Есть ли поток событий для задачи"""
+    return bool(await get_async_redis().exists(get_stream_key(task_id)))
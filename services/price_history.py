@@ -0,0 +1,201 @@
+"""
+История цен книг
+
+Таблица book_prices (models.book_price) только дополняется:
+- запись добавляется при появлении книги и при изменении цены, скидки или
+  цены без скидки; неизменные цены не пишутся
+- цена действует с ts до следующей записи книги
+- таблица секционирована по месяцам, секция создаётся перед первой записью
+  в месяц (book_prices_YYYY_MM)
+
+Запросы:
+- get_price_stats: минимум, максимум и среднее за последние N дней (с учётом
+  цены, действовавшей на начало окна)
+- get_lowest_in_days: книги, текущая цена которых - минимальная за N дней
+- get_price_history: точки истории книги
+"""
+
+from datetime import datetime, timedelta
+from decimal import Decimal
+from typing import Dict, Iterable, List, Optional, Set
+
+from sqlalchemy import select, text, bindparam, Integer
+from sqlalchemy.dialects.postgresql import ARRAY, insert as pg_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from models import Book, BookPrice
+
+# Секции, уже созданные в этом процессе (имя секции)
+_known_partitions: Set[str] = set()
+
+_CENTS = Decimal("0.01")
+
+
+def money(value) -> Optional[Decimal]:
+    """Цена в виде Decimal с копейками (для сравнения float из парсера и Numeric из БД)"""
+    if value is None:
+        return None
+    return Decimal(str(value)).quantize(_CENTS)
+
+
+def price_entry(book_id: int, ts: datetime, price, original_price=None, discount=None) -> Dict:
+    """Строка book_prices"""
+    return {
+        "book_id": book_id,
+        "ts": ts or datetime.now(),
+        "price": money(price),
+        "original_price": money(original_price),
+        "discount": discount,
+    }
+
+
+def price_changed(old_price, old_original_price, old_discount, entry: Dict) -> bool:
+    """Отличается ли новая цена (entry) от сохранённой"""
+    return (
+        money(old_price) != entry["price"]
+        or money(old_original_price) != entry["original_price"]
+        or (old_discount or None) != (entry["discount"] or None)
+    )
+
+
+def _partition_name(ts: datetime) -> str:
+    return f"book_prices_{ts.year:04d}_{ts.month:02d}"
+
+
+async def _ensure_partitions(db: AsyncSession, timestamps: Iterable[datetime]):
+    """Создание месячных секций для timestamps (один раз на процесс)"""
+    months = {}
+    for ts in timestamps:
+        months[_partition_name(ts)] = datetime(ts.year, ts.month, 1)
+
+    missing = {name: start for name, start in months.items() if name not in _known_partitions}
+    if not missing:
+        return
+
+    # Воркеры могут создавать одну и ту же секцию одновременно
+    await db.execute(text("SELECT pg_advisory_xact_lock(hashtext('book_prices_partitions'))"))
+    for name, start in missing.items():
+        end = datetime(start.year + start.month // 12, start.month % 12 + 1, 1)
+        await db.execute(text(
+            f"CREATE TABLE IF NOT EXISTS {name} PARTITION OF book_prices "
+            f"FOR VALUES FROM ('{start:%Y-%m-%d}') TO ('{end:%Y-%m-%d}')"
+        ))
+        _known_partitions.add(name)
+
+
+def reset_partition_cache():
+    """Забыть созданные секции (после отката транзакции, в которой они создавались)"""
+    _known_partitions.clear()
+
+
+async def record_prices(db: AsyncSession, entries: List[Dict]) -> int:
+    """
+    Запись точек истории цен в текущей транзакции (без commit)
+
+    Args:
+        db: Сессия базы данных
+        entries: Строки из price_entry() - только новые книги и изменённые цены
+
+    Returns:
+        Количество записанных точек
+    """
+    if not entries:
+        return 0
+
+    await _ensure_partitions(db, (entry["ts"] for entry in entries))
+
+    # Повтор той же точки (ретрай задачи) не является ошибкой
+    stmt = pg_insert(BookPrice).values(entries).on_conflict_do_nothing(
+        index_elements=[BookPrice.book_id, BookPrice.ts]
+    )
+    await db.execute(stmt)
+    return len(entries)
+
+
+_STATS_SQL = text("""
+    SELECT book_id, MIN(price) AS min_price, MAX(price) AS max_price,
+           AVG(price) AS avg_price, COUNT(*) AS points
+    FROM (
+        SELECT book_id, price
+        FROM book_prices
+        WHERE book_id = ANY(:book_ids) AND ts >= :since
+        UNION ALL
+        -- Цена, действовавшая на начало окна
+        SELECT ids.book_id, before.price
+        FROM unnest(:book_ids) AS ids(book_id)
+        CROSS JOIN LATERAL (
+            SELECT price FROM book_prices
+            WHERE book_id = ids.book_id AND ts < :since
+            ORDER BY ts DESC
+            LIMIT 1
+        ) AS before
+    ) AS window_prices
+    GROUP BY book_id
+""").bindparams(bindparam("book_ids", type_=ARRAY(Integer)))
+
+
+async def get_price_stats(db: AsyncSession, book_ids: List[int], days: int = 30) -> Dict[int, Dict]:
+    """
+    Минимальная, максимальная и средняя цена книг за последние days дней
+
+    Returns:
+        Словарь {book_id: {"min", "max", "avg", "points"}}; книги без истории
+        в словарь не попадают. avg - среднее по точкам изменения цены
+    """
+    if not book_ids:
+        return {}
+
+    since = datetime.now() - timedelta(days=days)
+    result = await db.execute(_STATS_SQL, {"book_ids": list(book_ids), "since": since})
+
+    return {
+        row.book_id: {
+            "min": float(row.min_price),
+            "max": float(row.max_price),
+            "avg": round(float(row.avg_price), 2),
+            "points": row.points,
+        }
+        for row in result
+    }
+
+
+async def get_lowest_in_days(db: AsyncSession, book_ids: List[int], days: int = 30) -> Dict[int, bool]:
+    """
+    Флаги "самая низкая цена за days дней"
+
+    Флаг ставится, если текущая цена не выше минимума окна и за окно цена
+    была выше (постоянная цена флага не даёт).
+
+    Returns:
+        Словарь {book_id: флаг} для всех book_ids
+    """
+    if not book_ids:
+        return {}
+
+    stats = await get_price_stats(db, book_ids, days)
+    result = await db.execute(select(Book.id, Book.current_price).where(Book.id.in_(book_ids)))
+
+    flags = {book_id: False for book_id in book_ids}
+    for book_id, current_price in result:
+        window = stats.get(book_id)
+        if window and current_price is not None:
+            flags[book_id] = float(current_price) <= window["min"] and window["max"] > window["min"]
+    return flags
+
+
+async def get_price_history(db: AsyncSession, book_id: int, days: Optional[int] = None) -> List[Dict]:
+    """Точки истории цены книги (по возрастанию времени), за days дней или за всё время"""
+    query = select(BookPrice).where(BookPrice.book_id == book_id)
+    if days:
+        query = query.where(BookPrice.ts >= datetime.now() - timedelta(days=days))
+    result = await db.execute(query.order_by(BookPrice.ts.asc()))
+
+    return [
+        {
+            "ts": point.ts.isoformat(),
+            "price": float(point.price),
+            "original_price": float(point.original_price) if point.original_price is not None else None,
+            "discount": point.discount,
+        }
+        for point in result.scalars().all()
+    ]
@@ -0,0 +1,133 @@
+"""
+Пакетное обновление цен книг для проверки подписок
+
+Стоимость прохода пропорциональна числу различных книг, а не подписок:
+- подписки группируются по book_id (одну книгу часто отслеживают многие)
+- все книги загружаются одним запросом
+- каждая книга запрашивается в магазине один раз, с ограничением параллельности
+  (темп запросов дополнительно ограничивает лимитер хоста)
+- все подписки на книгу проверяются по одной актуальной цене, сохранённой в БД
+  (services/alert_matching.py)
+"""
+
+import os
+import asyncio
+from typing import Dict, List, Optional
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from models import Alert, Book as DBBook
+from parsers.base import Book as ParserBook
+from services.logger import celery_logger
+from services import price_history
+
+# Сколько книг запрашивается в магазинах одновременно
+PRICE_REFRESH_CONCURRENCY = int(os.getenv("PRICE_REFRESH_CONCURRENCY", "5"))
+
+
+class PriceRefreshEngine:
+    """Пакетное получение актуальных цен для подписок"""
+
+    def __init__(self, concurrency: int = PRICE_REFRESH_CONCURRENCY):
+        self.concurrency = max(concurrency, 1)
+        # Один парсер на источник на весь проход (общий API клиент и статистика)
+        self._parsers: Dict[str, object] = {}
+
+        # Статистика прохода
+        self.books_requested = 0
+        self.books_fetched = 0
+        self.fetch_errors: List[str] = []
+
+    def _get_parser(self, source: str):
+        """Парсер для источника (создаётся один раз)"""
+        if source not in self._parsers:
+            from parsers.factory import parser_factory
+            self._parsers[source] = parser_factory.get_parser(source)
+        return self._parsers[source]
+
+    @staticmethod
+    def group_alerts_by_book(alerts: List[Alert]) -> Dict[int, List[Alert]]:
+        """Группировка подписок по book_id"""
+        groups: Dict[int, List[Alert]] = {}
+        for alert in alerts:
+            if alert.book_id:
+                groups.setdefault(alert.book_id, []).append(alert)
+        return groups
+
+    @staticmethod
+    async def load_books(db: AsyncSession, book_ids: List[int]) -> Dict[int, DBBook]:
+        """Загрузка всех книг одним запросом"""
+        if not book_ids:
+            return {}
+        result = await db.execute(select(DBBook).where(DBBook.id.in_(book_ids)))
+        return {book.id: book for book in result.scalars().all()}
+
+    async def _fetch_book(self, db_book: DBBook) -> Optional[ParserBook]:
+        """Получение актуальных данных одной книги из магазина"""
+        parser = self._get_parser(db_book.source)
+
+        # Читай-город: прямой запрос по ID товара, иначе по URL
+        if db_book.source_id and hasattr(parser, "get_book_by_id"):
+            return await parser.get_book_by_id(db_book.source_id)
+        if hasattr(parser, "get_book_by_url"):
+            return await parser.get_book_by_url(db_book.url)
+        return await parser.get_book_details(db_book.url)
+
+    async def fetch_prices(self, books: List[DBBook]) -> Dict[int, ParserBook]:
+        """
+        Параллельное получение актуальных цен
+
+        Returns:
+            Словарь {book_id: книга из парсера} для успешно полученных книг
+        """
+        semaphore = asyncio.Semaphore(self.concurrency)
+        fresh: Dict[int, ParserBook] = {}
+
+        async def fetch(db_book: DBBook):
+            async with semaphore:
+                try:
+                    parsed_book = await self._fetch_book(db_book)
+                except Exception as e:
+                    celery_logger.error(f"Ошибка получения цены для {db_book.url}: {e}")
+                    self.fetch_errors.append(f"Книга {db_book.id}: {str(e)}")
+                    return
+                if parsed_book:
+                    fresh[db_book.id] = parsed_book
+                else:
+                    celery_logger.info(f"❌ Не удалось получить актуальные данные для книги: {db_book.title}")
+
+        self.books_requested += len(books)
+        await asyncio.gather(*(fetch(db_book) for db_book in books))
+        self.books_fetched += len(fresh)
+
+        return fresh
+
+    @staticmethod
+    def apply_price(db_book: DBBook, parsed_book: ParserBook) -> Optional[Dict]:
+        """
+        Обновление цены книги в БД по данным парсера
+
+        Returns:
+            Точка истории цен (price_history.price_entry), если цена изменилась
+        """
+        entry = price_history.price_entry(
+            db_book.id,
+            parsed_book.parsed_at,
+            parsed_book.current_price,
+            parsed_book.original_price,
+            parsed_book.discount_percent,
+        )
+        changed = price_history.price_changed(
+            db_book.current_price, db_book.original_price, db_book.discount_percent, entry
+        )
+
+        db_book.current_price = parsed_book.current_price
+        db_book.original_price = parsed_book.original_price
+        db_book.discount_percent = parsed_book.discount_percent
+        db_book.parsed_at = parsed_book.parsed_at
+        db_book.last_seen_at = parsed_book.parsed_at
+        # Строка изменена не через upsert: отпечаток данных больше не актуален
+        db_book.content_hash = None
+
+        return entry if changed else None
@@ -0,0 +1,456 @@
+"""
+Ограничение частоты запросов к внешним магазинам
+
+Содержит:
+- TokenBucket - локальный token bucket с допустимым всплеском (burst)
+- HostRateLimiter - распределённый лимитер на хост (GCRA в Redis), общий для
+  всех воркеров, с общим backoff после 429 и метриками ожидания
+- get_host_limiter - лимитер хоста для всех клиентов процесса
+- get_rate_limit_stats - метрики лимитеров всех воркеров (из Redis)
+"""
+
+import os
+import time
+import asyncio
+import threading
+from typing import Dict, List, Optional
+from urllib.parse import urlparse
+
+from dotenv import load_dotenv
+
+from services.logger import logger
+
+# Загружаем переменные окружения из .env
+load_dotenv()
+
+# Лимиты по умолчанию (запросов в секунду и размер всплеска)
+RATE_LIMIT_DEFAULT_RPS = float(os.getenv("RATE_LIMIT_DEFAULT_RPS", "1.0"))
+RATE_LIMIT_DEFAULT_BURST = int(os.getenv("RATE_LIMIT_DEFAULT_BURST", "3"))
+
+# Переопределение лимитов по хостам: "host=rps:burst,host2=rps:burst"
+RATE_LIMITS = os.getenv("RATE_LIMITS", "")
+
+# Backoff после 429: базовая пауза, потолок и окно подсчёта повторных 429 (сек)
+RATE_LIMIT_BACKOFF_BASE = float(os.getenv("RATE_LIMIT_BACKOFF_BASE", "5"))
+RATE_LIMIT_BACKOFF_MAX = float(os.getenv("RATE_LIMIT_BACKOFF_MAX", "300"))
+RATE_LIMIT_BACKOFF_WINDOW = 600
+
+# Пауза перед повторной попыткой подключения к Redis после ошибки (сек)
+REDIS_RETRY_INTERVAL = 30
+
+# GCRA с резервированием: возвращает, сколько миллисекунд ждать до запроса.
+# Время берётся из Redis (TIME), поэтому часы воркеров не должны совпадать.
+# KEYS: tat, backoff_until, stats. ARGV: интервал между запросами (мс), burst
+GCRA_ACQUIRE_SCRIPT = """
+local interval = tonumber(ARGV[1])
+local burst = tonumber(ARGV[2])
+local t = redis.call('TIME')
+local now = tonumber(t[1]) * 1000 + math.floor(tonumber(t[2]) / 1000)
+
+local tat = tonumber(redis.call('GET', KEYS[1]) or '0')
+if tat < now then tat = now end
+
+local tolerance = (burst - 1) * interval
+local wait = tat - tolerance - now
+if wait < 0 then wait = 0 end
+
+local backoff_until = tonumber(redis.call('GET', KEYS[2]) or '0')
+if backoff_until - now > wait then wait = backoff_until - now end
+
+local new_tat = tat + interval
+if backoff_until + interval > new_tat then new_tat = backoff_until + interval end
+redis.call('SET', KEYS[1], new_tat, 'PX', new_tat - now + tolerance + 1000)
+
+redis.call('HINCRBY', KEYS[3], 'acquired', 1)
+if wait > 0 then
+    redis.call('HINCRBY', KEYS[3], 'waited', 1)
+    redis.call('HINCRBY', KEYS[3], 'wait_ms', wait)
+end
+return wait
+"""
+
+# Общий backoff после 429: растёт экспоненциально при повторных 429 в окне.
+# KEYS: backoff_until, backoff_count, stats. ARGV: Retry-After (мс), база, потолок, окно (мс)
+BACKOFF_SCRIPT = """
+local retry_after = tonumber(ARGV[1])
+local base = tonumber(ARGV[2])
+local max_backoff = tonumber(ARGV[3])
+local window = tonumber(ARGV[4])
+local t = redis.call('TIME')
+local now = tonumber(t[1]) * 1000 + math.floor(tonumber(t[2]) / 1000)
+
+local count = redis.call('INCR', KEYS[2])
+redis.call('PEXPIRE', KEYS[2], window)
+
+local backoff = base * math.pow(2, count - 1)
+if retry_after > backoff then backoff = retry_after end
+if backoff > max_backoff then backoff = max_backoff end
+
+local current = tonumber(redis.call('GET', KEYS[1]) or '0')
+if now + backoff > current then
+    redis.call('SET', KEYS[1], now + backoff, 'PX', backoff)
+end
+
+redis.call('HINCRBY', KEYS[3], 'throttled', 1)
+return backoff
+"""
+
+
+class TokenBucket:
+    """
+    Token bucket с резервированием токенов
+
+    Токен списывается сразу при вызове acquire (баланс может уйти в минус),
+    после чего корутина ждёт ровно столько, сколько нужно для погашения
+    долга. Проверка и списание выполняются без await, поэтому между
+    корутинами одного цикла гонок нет, а threading.Lock защищает от
+    одновременного доступа из потоков.
+    """
+
+    def __init__(self, rate: float, capacity: int):
+        self.rate = max(rate, 0.001)
+        self.capacity = max(capacity, 1)
+        self._tokens = float(self.capacity)
+        self._updated_at = time.monotonic()
+        self._lock = threading.Lock()
+
+        # Статистика
+        self.acquired = 0
+        self.total_wait = 0.0
+
+    def _reserve(self, tokens: int) -> float:
+        """Списание токенов и расчёт времени ожидания"""
+        with self._lock:
+            now = time.monotonic()
+            elapsed = now - self._updated_at
+            self._tokens = min(self.capacity, self._tokens + elapsed * self.rate)
+            self._updated_at = now
+
+            self._tokens -= tokens
+            self.acquired += 1
+
+            if self._tokens >= 0:
+                return 0.0
+
+            wait = -self._tokens / self.rate
+            self.total_wait += wait
+            return wait
+
+    async def acquire(self, tokens: int = 1) -> float:
+        """
+        Получение разрешения на запрос
+
+        Returns:
+            Время ожидания в секундах (0, если бюджет свободен)
+        """
+        wait = self._reserve(tokens)
+        if wait > 0:
+            await asyncio.sleep(wait)
+        return wait
+
+    def get_stats(self) -> Dict:
+        """Статистика лимитера"""
+        return {
+            "rate": self.rate,
+            "capacity": self.capacity,
+            "acquired": self.acquired,
+            "total_wait": round(self.total_wait, 3),
+        }
+
+
+# Лимитер использует общий асинхронный клиент event loop (services/redis_client.py):
+# вызов EVAL не блокирует цикл, а wait_for ограничивает ожидание ответа -
+# медленный Redis переводит лимитер в локальный режим, а не останавливает цикл
+REDIS_LIMITER_TIMEOUT = 1.0
+_redis_failed_at = 0.0
+
+RATE_LIMIT_KEY_PREFIX = "rate_limit:"
+
+
+def _get_redis():
+    """Redis клиент лимитера (None, если Redis недавно был недоступен)"""
+    if time.time() - _redis_failed_at < REDIS_RETRY_INTERVAL:
+        return None
+
+    from services.redis_client import get_async_redis
+    return get_async_redis()
+
+
+def _mark_redis_failed(error: Exception):
+    """Переход на локальный лимитер на REDIS_RETRY_INTERVAL секунд"""
+    global _redis_failed_at
+
+    _redis_failed_at = time.time()
+    logger.warning(f"[RateLimiter] Redis недоступен, используем локальный лимитер: {error!r}")
+
+
+def _stats_key(host: str) -> str:
+    """Ключ общих счётчиков лимитера хоста"""
+    return f"{RATE_LIMIT_KEY_PREFIX}{host}:stats"
+
+
+def _backoff_key(host: str) -> str:
+    """Ключ общего backoff хоста"""
+    return f"{RATE_LIMIT_KEY_PREFIX}{host}:backoff_until"
+
+
+class HostRateLimiter:
+    """
+    Распределённый лимитер запросов к одному хосту
+
+    Бюджет (rate запросов/сек со всплеском до capacity) общий для всех
+    процессов через GCRA в Redis. После 429 ставится общий backoff, который
+    соблюдают все воркеры. Если Redis недоступен, работает локальный
+    TokenBucket с теми же параметрами.
+    """
+
+    def __init__(self, host: str, rate: float, capacity: int):
+        self.host = host
+        self.rate = max(rate, 0.001)
+        self.capacity = max(capacity, 1)
+        self.interval_ms = int(1000 / self.rate)
+
+        self._local = TokenBucket(self.rate, self.capacity)
+        self._acquire_script = None
+        self._backoff_script = None
+
+        # Ключи Redis
+        self._tat_key = f"{RATE_LIMIT_KEY_PREFIX}{host}:tat"
+        self._backoff_key = _backoff_key(host)
+        self._backoff_count_key = f"{RATE_LIMIT_KEY_PREFIX}{host}:backoff_count"
+        self._stats_key = _stats_key(host)
+
+        # Локальные метрики процесса
+        self.acquired = 0
+        self.waited = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self.throttled = 0
+        self._local_backoff_until = 0.0
+
+    async def _reserve(self) -> Optional[float]:
+        """Резервирование запроса в Redis (None - Redis недоступен)"""
+        client = _get_redis()
+        if client is None:
+            return None
+
+        try:
+            if self._acquire_script is None:
+                self._acquire_script = client.register_script(GCRA_ACQUIRE_SCRIPT)
+            wait_ms = await asyncio.wait_for(
+                self._acquire_script(
+                    keys=[self._tat_key, self._backoff_key, self._stats_key],
+                    args=[self.interval_ms, self.capacity],
+                    client=client,
+                ),
+                REDIS_LIMITER_TIMEOUT,
+            )
+            return int(wait_ms) / 1000
+        except Exception as e:
+            self._acquire_script = None
+            _mark_redis_failed(e)
+            return None
+
+    async def acquire(self) -> float:
+        """
+        Получение разрешения на запрос к хосту
+
+        Returns:
+            Время ожидания в секундах (0, если бюджет свободен)
+        """
+        wait = await self._reserve()
+
+        if wait is None:
+            # Локальный режим: свой token bucket + локальный backoff
+            wait = self._local._reserve(1)
+            wait = max(wait, self._local_backoff_until - time.monotonic())
+
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+        self.acquired += 1
+        if wait > 0:
+            self.waited += 1
+            self.total_wait += wait
+            self.max_wait = max(self.max_wait, wait)
+
+        return max(wait, 0.0)
+
+    async def report_throttled(self, retry_after: Optional[float] = None) -> float:
+        """
+        Сообщение о 429 от хоста: все воркеры делают паузу
+
+        Args:
+            retry_after: Значение Retry-After в секундах (если есть)
+
+        Returns:
+            Длительность установленного backoff в секундах
+        """
+        self.throttled += 1
+        retry_after_ms = int((retry_after or 0) * 1000)
+
+        client = _get_redis()
+        if client is not None:
+            try:
+                if self._backoff_script is None:
+                    self._backoff_script = client.register_script(BACKOFF_SCRIPT)
+                backoff_ms = await asyncio.wait_for(
+                    self._backoff_script(
+                        keys=[self._backoff_key, self._backoff_count_key, self._stats_key],
+                        args=[
+                            retry_after_ms,
+                            int(RATE_LIMIT_BACKOFF_BASE * 1000),
+                            int(RATE_LIMIT_BACKOFF_MAX * 1000),
+                            RATE_LIMIT_BACKOFF_WINDOW * 1000,
+                        ],
+                        client=client,
+                    ),
+                    REDIS_LIMITER_TIMEOUT,
+                )
+                backoff = int(backoff_ms) / 1000
+                logger.warning(f"[RateLimiter] 429 от {self.host}, общий backoff {backoff:.1f} сек")
+                return backoff
+            except Exception as e:
+                self._backoff_script = None
+                _mark_redis_failed(e)
+
+        backoff = min(max(retry_after or 0, RATE_LIMIT_BACKOFF_BASE), RATE_LIMIT_BACKOFF_MAX)
+        self._local_backoff_until = max(self._local_backoff_until, time.monotonic() + backoff)
+        logger.warning(f"[RateLimiter] 429 от {self.host}, локальный backoff {backoff:.1f} сек")
+        return backoff
+
+    def get_stats(self) -> Dict:
+        """Метрики лимитера в этом процессе"""
+        return {
+            "host": self.host,
+            "rate": self.rate,
+            "capacity": self.capacity,
+            "process": {
+                "acquired": self.acquired,
+                "waited": self.waited,
+                "throttled": self.throttled,
+                "total_wait": round(self.total_wait, 3),
+                "avg_wait": round(self.total_wait / max(self.waited, 1), 3),
+                "max_wait": round(self.max_wait, 3),
+            },
+        }
+
+
+# Лимитеры по хостам (общие для всех клиентов процесса)
+_host_limiters: Dict[str, HostRateLimiter] = {}
+_host_limiters_lock = threading.Lock()
+
+
+def get_host(url: str) -> str:
+    """Хост из URL (или сама строка, если это уже хост)"""
+    return urlparse(url).hostname or url
+
+
+def _configured_limits() -> Dict[str, tuple]:
+    """Лимиты из RATE_LIMITS: {host: (rps, burst)}"""
+    limits = {}
+    for item in RATE_LIMITS.split(","):
+        if "=" not in item:
+            continue
+        host, value = item.split("=", 1)
+        try:
+            rps, _, burst = value.partition(":")
+            limits[host.strip()] = (float(rps), int(burst) if burst else None)
+        except ValueError:
+            logger.warning(f"[RateLimiter] Некорректный лимит в RATE_LIMITS: {item}")
+    return limits
+
+
+def get_host_limiter(
+    host_or_url: str,
+    rate: Optional[float] = None,
+    capacity: Optional[int] = None
+) -> HostRateLimiter:
+    """
+    Получение общего лимитера для хоста
+
+    Лимит из RATE_LIMITS имеет приоритет над rate/capacity вызывающего кода.
+    Параметры учитываются только при первом создании лимитера в процессе.
+    """
+    host = get_host(host_or_url)
+
+    limiter = _host_limiters.get(host)
+    if limiter is None:
+        with _host_limiters_lock:
+            limiter = _host_limiters.get(host)
+            if limiter is None:
+                configured_rate, configured_capacity = _configured_limits().get(host, (None, None))
+                limiter = HostRateLimiter(
+                    host,
+                    rate=configured_rate or rate or RATE_LIMIT_DEFAULT_RPS,
+                    capacity=configured_capacity or capacity or RATE_LIMIT_DEFAULT_BURST,
+                )
+                _host_limiters[host] = limiter
+                logger.debug(
+                    f"[RateLimiter] Лимитер для {host}: "
+                    f"{limiter.rate:.2f} req/s, burst={limiter.capacity}"
+                )
+
+    return limiter
+
+
+def _global_stats(shared: Dict, backoff_ms: int) -> Dict:
+    """Общие метрики хоста из счётчиков Redis"""
+    waited = int(shared.get("waited", 0))
+    wait_ms = int(shared.get("wait_ms", 0))
+    return {
+        "acquired": int(shared.get("acquired", 0)),
+        "waited": waited,
+        "throttled": int(shared.get("throttled", 0)),
+        "total_wait": round(wait_ms / 1000, 3),
+        "avg_wait": round(wait_ms / 1000 / max(waited, 1), 3),
+        "backoff_ms": max(backoff_ms, 0),
+    }
+
+
+async def get_rate_limit_stats() -> List[Dict]:
+    """
+    Метрики лимитеров всех воркеров
+
+    Хосты и общие счётчики берутся из Redis (ключи rate_limit:<host>:stats
+    пишут все процессы), поэтому статистика есть и в процессе API, где
+    лимитеры не создаются. Метрики процесса - для лимитеров этого процесса.
+    """
+    hosts = set(_host_limiters)
+    shared = {}
+
+    client = _get_redis()
+    if client is not None:
+        try:
+            suffix = ":stats"
+            async for key in client.scan_iter(match=f"{RATE_LIMIT_KEY_PREFIX}*{suffix}", count=100):
+                hosts.add(key[len(RATE_LIMIT_KEY_PREFIX):-len(suffix)])
+
+            ordered = sorted(hosts)
+            async with client.pipeline(transaction=False) as pipe:
+                for host in ordered:
+                    pipe.hgetall(_stats_key(host))
+                    pipe.pttl(_backoff_key(host))
+                replies = await pipe.execute()
+            for index, host in enumerate(ordered):
+                shared[host] = _global_stats(replies[2 * index] or {}, replies[2 * index + 1])
+        except Exception as e:
+            logger.warning(f"[RateLimiter] Не удалось получить метрики из Redis: {e}")
+
+    configured = _configured_limits()
+    stats = []
+    for host in sorted(hosts):
+        limiter = _host_limiters.get(host)
+        if limiter is not None:
+            host_stats = limiter.get_stats()
+        else:
+            rate, capacity = configured.get(host, (None, None))
+            host_stats = {
+                "host": host,
+                "rate": rate or RATE_LIMIT_DEFAULT_RPS,
+                "capacity": capacity or RATE_LIMIT_DEFAULT_BURST,
+            }
+        if host in shared:
+            host_stats["global"] = shared[host]
+        stats.append(host_stats)
+    return stats
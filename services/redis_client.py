@@ -0,0 +1,180 @@
+"""
+Общие пулы соединений Redis для сервисов
+
+Содержит:
+- URL подключения, собранный один раз из REDIS_URL и REDIS_PASSWORD
+- get_async_redis - асинхронный клиент с пулом соединений на event loop
+  (соединения redis.asyncio привязаны к циклу, как и сессия HTTP пула)
+- get_async_blocking_redis - отдельный пул для блокирующих команд (XREAD BLOCK
+  потоков парсинга): долгие ожидания SSE клиентов не занимают общий пул
+- get_sync_redis - синхронный клиент с пулом на процесс (лимитер запросов,
+  менеджер токенов); после fork пул пересоздаётся самим redis-py
+- async_pipeline - несколько команд за один round-trip
+- хуки закрытия для lifespan FastAPI и воркеров Celery
+
+Пулы блокирующие: при занятых REDIS_POOL_SIZE соединениях запрос ждёт
+свободное до REDIS_POOL_TIMEOUT секунд вместо открытия нового соединения.
+"""
+
+import os
+import asyncio
+import threading
+import weakref
+from contextlib import asynccontextmanager
+from typing import Dict, Tuple
+from urllib.parse import urlparse
+
+import redis
+import redis.asyncio as aioredis
+from dotenv import load_dotenv
+
+from services.logger import logger
+
+# Загружаем переменные окружения из .env
+load_dotenv()
+
+# Настройки пулов
+REDIS_POOL_SIZE = int(os.getenv("REDIS_POOL_SIZE", "50"))                  # Соединений в пуле
+REDIS_POOL_TIMEOUT = float(os.getenv("REDIS_POOL_TIMEOUT", "5"))           # Ожидание свободного соединения (сек)
+REDIS_BLOCKING_POOL_SIZE = int(os.getenv("REDIS_BLOCKING_POOL_SIZE", "200"))  # Соединений для XREAD BLOCK
+REDIS_CONNECT_TIMEOUT = float(os.getenv("REDIS_CONNECT_TIMEOUT", "1"))     # Таймаут подключения (сек)
+# Таймаут ответа синхронного клиента (сек): синхронные вызовы блокируют
+# поток, у асинхронного клиента таймаута нет (XREAD BLOCK ждёт дольше)
+REDIS_SOCKET_TIMEOUT = float(os.getenv("REDIS_SOCKET_TIMEOUT", "1"))
+
+
+def _build_redis_url() -> str:
+    """URL Redis с паролем из REDIS_PASSWORD (если его нет в REDIS_URL)"""
+    redis_url = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+    redis_password = os.getenv("REDIS_PASSWORD")
+    parsed = urlparse(redis_url)
+    if redis_password and not parsed.password:
+        redis_url = f"{parsed.scheme or 'redis'}://:{redis_password}@{parsed.hostname}:{parsed.port or 6379}{parsed.path}"
+    return redis_url
+
+
+REDIS_CONNECTION_URL = _build_redis_url()
+
+# Асинхронные клиенты по event loop и (пулу, decode_responses). Слабые ссылки
+# на цикл: закрытый и удалённый цикл не держит пул в памяти
+_async_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Dict[Tuple[str, bool], aioredis.Redis]]" = weakref.WeakKeyDictionary()
+
+# Синхронные клиенты процесса по режиму decode_responses
+_sync_clients: Dict[bool, redis.Redis] = {}
+_sync_lock = threading.Lock()
+
+
+def _get_async_client(kind: str, max_connections: int, decode_responses: bool) -> aioredis.Redis:
+    """Клиент пула kind для текущего event loop (создаётся при первом обращении)"""
+    loop = asyncio.get_running_loop()
+
+    clients = _async_clients.get(loop)
+    if clients is None:
+        clients = _async_clients[loop] = {}
+
+    client = clients.get((kind, decode_responses))
+    if client is None:
+        pool = aioredis.BlockingConnectionPool.from_url(
+            REDIS_CONNECTION_URL,
+            max_connections=max_connections,
+            timeout=REDIS_POOL_TIMEOUT,
+            socket_connect_timeout=REDIS_CONNECT_TIMEOUT,
+            decode_responses=decode_responses,
+        )
+        client = clients[(kind, decode_responses)] = aioredis.Redis(connection_pool=pool)
+        logger.debug(
+            f"[RedisPool] Создан асинхронный пул {kind}: max_connections={max_connections}, "
+            f"decode_responses={decode_responses}"
+        )
+
+    return client
+
+
+def get_async_redis(decode_responses: bool = True) -> aioredis.Redis:
+    """
+    Асинхронный клиент Redis для текущего event loop
+
+    Должна вызываться из корутины. Клиент общий, закрывать его не нужно.
+    Блокирующие команды - через get_async_blocking_redis.
+
+    Args:
+        decode_responses: Декодировать ответы в str (False - для бинарных данных)
+    """
+    return _get_async_client("default", REDIS_POOL_SIZE, decode_responses)
+
+
+def get_async_blocking_redis(decode_responses: bool = True) -> aioredis.Redis:
+    """
+    Асинхронный клиент для блокирующих команд (XREAD BLOCK)
+
+    Соединение занято всё время ожидания, поэтому у таких команд свой пул
+    (REDIS_BLOCKING_POOL_SIZE): открытые SSE потоки не исчерпывают общий пул.
+    """
+    return _get_async_client("blocking", REDIS_BLOCKING_POOL_SIZE, decode_responses)
+
+
+@asynccontextmanager
+async def async_pipeline(transaction: bool = False, decode_responses: bool = True):
+    """
+    Пайплайн общего асинхронного клиента
+
+    Команды, добавленные в блоке, отправляются одним запросом при выходе из
+    него. Если нужны ответы, вызовите await pipe.execute() внутри блока.
+
+    Args:
+        transaction: Выполнить команды в MULTI/EXEC
+        decode_responses: Декодировать ответы в str
+    """
+    async with get_async_redis(decode_responses).pipeline(transaction=transaction) as pipe:
+        yield pipe
+        if len(pipe):
+            await pipe.execute()
+
+
+async def close_async_redis():
+    """Закрытие пулов текущего event loop (вызывать перед loop.close())"""
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        return
+
+    clients = _async_clients.pop(loop, None) or {}
+    for client in clients.values():
+        await client.close(close_connection_pool=True)
+    if clients:
+        logger.debug("[RedisPool] Асинхронные пулы закрыты")
+
+
+def get_sync_redis(decode_responses: bool = True) -> redis.Redis:
+    """
+    Синхронный клиент Redis процесса (потокобезопасный, общий для всех потоков)
+
+    Args:
+        decode_responses: Декодировать ответы в str
+    """
+    client = _sync_clients.get(decode_responses)
+    if client is not None:
+        return client
+
+    with _sync_lock:
+        client = _sync_clients.get(decode_responses)
+        if client is None:
+            pool = redis.BlockingConnectionPool.from_url(
+                REDIS_CONNECTION_URL,
+                max_connections=REDIS_POOL_SIZE,
+                timeout=REDIS_POOL_TIMEOUT,
+                socket_connect_timeout=REDIS_CONNECT_TIMEOUT,
+                socket_timeout=REDIS_SOCKET_TIMEOUT,
+                decode_responses=decode_responses,
+            )
+            client = _sync_clients[decode_responses] = redis.Redis(connection_pool=pool)
+    return client
+
+
+def close_sync_redis():
+    """Закрытие синхронных пулов процесса"""
+    with _sync_lock:
+        clients = list(_sync_clients.values())
+        _sync_clients.clear()
+    for client in clients:
+        client.connection_pool.disconnect()
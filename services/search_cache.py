@@ -0,0 +1,169 @@
+"""
+Кэш результатов поиска в магазинах
+
+Страница выдачи магазина кэшируется в Redis по источнику, номеру страницы и
+нормализованному запросу (normalize_text), поэтому "Python", "python " и
+"python!" - один и тот же ключ.
+
+Политика stale-while-revalidate:
+- свежая запись (моложе TTL источника) отдаётся без запроса в магазин
+- устаревшая запись хранится ещё SEARCH_CACHE_STALE_TTL секунд: её можно
+  отдать сразу, запустив одно фоновое обновление на все запросы,
+  а парсер использует её, если магазин не ответил
+- пустые страницы не кэшируются (их нельзя отличить от ошибки магазина)
+
+Значение - JSON со списком книг, сжатый zlib.
+"""
+
+import os
+import json
+import time
+import zlib
+import hashlib
+from typing import Dict, List, Optional
+
+from dotenv import load_dotenv
+
+from parsers.base import Book
+from services.logger import logger
+from services.redis_client import get_async_redis
+from services.search_utils import normalize_text
+
+# Загружаем переменные окружения из .env
+load_dotenv()
+
+# TTL свежей записи по умолчанию (сек)
+SEARCH_CACHE_TTL = int(os.getenv("SEARCH_CACHE_TTL", "900"))
+# TTL по источникам: source=сек через запятую
+SEARCH_CACHE_TTLS = os.getenv("SEARCH_CACHE_TTLS", "")
+# Сколько устаревшая запись хранится после TTL (сек)
+SEARCH_CACHE_STALE_TTL = int(os.getenv("SEARCH_CACHE_STALE_TTL", "3600"))
+# Блокировка фонового обновления устаревшей записи (сек)
+SEARCH_CACHE_REVALIDATE_LOCK_TTL = 120
+
+
+def _parse_source_ttls() -> Dict[str, int]:
+    """TTL из SEARCH_CACHE_TTLS: {source: сек}"""
+    ttls = {}
+    for item in SEARCH_CACHE_TTLS.split(","):
+        if "=" not in item:
+            continue
+        source, value = item.split("=", 1)
+        try:
+            ttls[source.strip()] = int(value)
+        except ValueError:
+            logger.warning(f"[SearchCache] Некорректный TTL в SEARCH_CACHE_TTLS: {item}")
+    return ttls
+
+
+_source_ttls = _parse_source_ttls()
+
+
+def get_cache_ttl(source: str) -> int:
+    """TTL свежей записи для источника"""
+    return _source_ttls.get(source, SEARCH_CACHE_TTL)
+
+
+def get_query_hash(query: str) -> str:
+    """Хэш нормализованного запроса"""
+    return hashlib.md5(normalize_text(query).encode()).hexdigest()
+
+
+def get_cache_key(source: str, query: str, page: int) -> str:
+    """Ключ страницы выдачи в Redis"""
+    return f"search_cache:{source}:{page}:{get_query_hash(query)}"
+
+
+class CachedPage:
+    """Страница выдачи из кэша"""
+
+    def __init__(self, books: List[Book], cached_at: float, ttl: int, total_pages: Optional[int] = None):
+        self.books = books
+        self.cached_at = cached_at
+        self.ttl = ttl
+        self.total_pages = total_pages
+
+    @property
+    def age(self) -> float:
+        """Возраст записи (сек)"""
+        return max(time.time() - self.cached_at, 0)
+
+    @property
+    def fresh(self) -> bool:
+        """Запись моложе TTL и может отдаваться без обновления"""
+        return self.age < self.ttl
+
+
+async def get_cached_page(source: str, query: str, page: int = 1) -> Optional[CachedPage]:
+    """
+    Получение страницы выдачи из кэша
+
+    Returns:
+        CachedPage (свежая или устаревшая) или None, если записи нет
+        или Redis недоступен
+    """
+    try:
+        client = get_async_redis(decode_responses=False)
+        raw = await client.get(get_cache_key(source, query, page))
+        if not raw:
+            return None
+
+        entry = json.loads(zlib.decompress(raw))
+        return CachedPage(
+            books=[Book(**book) for book in entry.get("books", [])],
+            cached_at=entry.get("cached_at", 0),
+            ttl=get_cache_ttl(source),
+            total_pages=entry.get("total_pages")
+        )
+    except Exception as e:
+        logger.warning(f"[SearchCache] Ошибка чтения кэша {source}/{query}/{page}: {e}")
+        return None
+
+
+async def set_cached_page(
+    source: str,
+    query: str,
+    page: int,
+    books: List[Book],
+    total_pages: Optional[int] = None
+):
+    """Сохранение страницы выдачи в кэш (пустые страницы не сохраняются)"""
+    if not books:
+        return
+
+    ttl = get_cache_ttl(source)
+    entry = {
+        "cached_at": time.time(),
+        "total_pages": total_pages,
+        "books": [book.model_dump(mode="json") for book in books],
+    }
+
+    try:
+        client = get_async_redis(decode_responses=False)
+        await client.setex(
+            get_cache_key(source, query, page),
+            ttl + SEARCH_CACHE_STALE_TTL,
+            zlib.compress(json.dumps(entry, ensure_ascii=False).encode())
+        )
+    except Exception as e:
+        logger.warning(f"[SearchCache] Ошибка записи кэша {source}/{query}/{page}: {e}")
+
+
+async def acquire_revalidation(source: str, query: str) -> bool:
+    """
+    Захват права на фоновое обновление устаревшей записи
+
+    Возвращает True только первому запросу: остальные пользователи получают
+    устаревшие данные, не запуская повторный парсинг.
+    """
+    try:
+        client = get_async_redis()
+        return bool(await client.set(
+            f"search_cache_revalidate:{source}:{get_query_hash(query)}",
+            "1",
+            nx=True,
+            ex=SEARCH_CACHE_REVALIDATE_LOCK_TTL
+        ))
+    except Exception as e:
+        logger.warning(f"[SearchCache] Ошибка блокировки обновления {source}/{query}: {e}")
+        return False
@@ -9,11 +9,10 @@
 
 import re
 import hashlib
-import os
 from typing import List, Optional, Tuple
 from datetime import datetime, timedelta
-import redis.asyncio as redis
 from services.logger import logger
+from services.redis_client import async_pipeline, get_async_redis
 
 # Константы
 MIN_WORDS_FOR_MATCH = 2  # Минимум слов в запросе для fuzzy match
@@ -182,24 +181,6 @@ def should_limit_parsing() -> Tuple[bool, int]:
 
 # ========== REDIS ОЧЕРЕДЬ ДОПАРСИНГА ==========
 
-async def get_redis_client():
-    """Получает асинхронный Redis клиент"""
-    redis_url = os.getenv("REDIS_URL", "redis://localhost:6379/0")
-    # Убираем пароль из URL для подключения
-    redis_url = redis_url.replace(":@", "://")
-    
-    # Парсим URL и добавляем пароль
-    import urllib.parse
-    try:
-        parsed = urllib.parse.urlparse(redis_url)
-        if os.getenv("REDIS_PASSWORD"):
-            redis_url = f"redis://:{os.getenv('REDIS_PASSWORD')}@{parsed.hostname}:{parsed.port or 6379}{parsed.path}"
-    except:
-        pass
-    
-    return redis.from_url(redis_url, decode_responses=True)
-
-
 def generate_pending_key(query: str) -> str:
     """Генерирует ключ для Redis очереди допарсинга"""
     query_hash = hashlib.md5(query.encode()).hexdigest()[:8]
@@ -216,7 +197,6 @@ async def add_to_pending_parse(query: str, author: str = None, already_parsed_co
         already_parsed_count: Количество уже спарсенных книг
     """
     try:
-        redis_client = await get_redis_client()
         key = generate_pending_key(query)
         
         data = {
@@ -226,13 +206,12 @@ async def add_to_pending_parse(query: str, author: str = None, already_parsed_co
             "created_at": datetime.now().isoformat()
         }
         
-        # Сохраняем с TTL 24 часа
-        await redis_client.hset(key, mapping=data)
-        await redis_client.expire(key, PENDING_PARSE_TTL)
+        # Сохраняем с TTL 24 часа (одним запросом)
+        async with async_pipeline() as pipe:
+            pipe.hset(key, mapping=data)
+            pipe.expire(key, PENDING_PARSE_TTL)
         
         logger.info(f"Добавлено в очередь допарсинга: {query} (уже парсено: {already_parsed_count})")
-        
-        await redis_client.close()
     except Exception as e:
         logger.error(f"Ошибка добавления в очередь допарсинга: {e}")
 
@@ -245,11 +224,9 @@ async def get_pending_parse(query: str) -> Optional[dict]:
         Словарь с данными или None если не найдено
     """
     try:
-        redis_client = await get_redis_client()
         key = generate_pending_key(query)
         
-        data = await redis_client.hgetall(key)
-        await redis_client.close()
+        data = await get_async_redis().hgetall(key)
         
         if data:
             return {
@@ -269,14 +246,11 @@ async def remove_from_pending_parse(query: str):
     Удаляет запрос из очереди допарсинга (после завершения)
     """
     try:
-        redis_client = await get_redis_client()
         key = generate_pending_key(query)
         
-        await redis_client.delete(key)
+        await get_async_redis().delete(key)
         
         logger.info(f"Удалено из очереди допарсинга: {query}")
-        
-        await redis_client.close()
     except Exception as e:
         logger.error(f"Ошибка удаления из очереди допарсинга: {e}")
 
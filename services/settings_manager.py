@@ -7,9 +7,9 @@ DEFAULT_SETTINGS = [
     # Настройки подписок
     {
         "key": "subscriptions_check_interval",
-        "value": "14400",
+        "value": "86400",
         "value_type": "int",
-        "description": "Интервал проверки подписок в секундах (по умолчанию 4 часа)",
+        "description": "Интервал страховочной проверки подписок в секундах (по умолчанию сутки)",
         "category": "subscriptions"
     },
     # Настройки парсинга
@@ -0,0 +1,77 @@
+"""
+Контрольные точки частей (chunk) фоновых задач
+
+Часть большой задачи (check_alerts_chunk, scan_discounts_chunk) после
+каждого обработанного элемента сохраняет в Redis обработанные элементы и
+накопленную статистику. Повтор части (тот же task_id) продолжает с места
+ошибки: уже обработанные подписки и запросы пропускаются, статистика не
+теряется. Без Redis часть просто выполняется целиком.
+"""
+
+import json
+from typing import Dict, Hashable, List, Set
+
+from services.logger import celery_logger
+from services.redis_client import get_async_redis
+
+CHECKPOINT_KEY_PREFIX = "task_checkpoint:"
+# Сколько хранится контрольная точка (сек): дольше любого повтора части
+CHECKPOINT_TTL = 86400
+
+
+class ChunkCheckpoint:
+    """Обработанные элементы и счётчики части задачи"""
+
+    def __init__(self, task_id: str):
+        self.key = f"{CHECKPOINT_KEY_PREFIX}{task_id}"
+        self.done: Set[Hashable] = set()
+        self.stats: Dict[str, int] = {}
+        self.errors: List[str] = []
+        # Данные элементов для callback (например, книги с высокими скидками)
+        self.items: List[Dict] = []
+
+    def add(self, counter: str, value: int = 1):
+        """Увеличение счётчика статистики"""
+        self.stats[counter] = self.stats.get(counter, 0) + value
+
+    async def load(self) -> "ChunkCheckpoint":
+        """Состояние предыдущей попытки (если была)"""
+        try:
+            raw = await get_async_redis().get(self.key)
+        except Exception as e:
+            celery_logger.warning(f"Контрольная точка {self.key} недоступна: {e}")
+            return self
+
+        if raw:
+            state = json.loads(raw)
+            self.done = set(state.get("done", []))
+            self.stats = state.get("stats", {})
+            self.errors = state.get("errors", [])
+            self.items = state.get("items", [])
+            celery_logger.info(f"Продолжение с контрольной точки {self.key}: обработано {len(self.done)}")
+        return self
+
+    async def mark_done(self, item: Hashable):
+        """Элемент обработан: сохранение состояния"""
+        self.done.add(item)
+        state = {
+            "done": sorted(self.done),
+            "stats": self.stats,
+            "errors": self.errors,
+            "items": self.items,
+        }
+        try:
+            await get_async_redis().set(self.key, json.dumps(state), ex=CHECKPOINT_TTL)
+        except Exception as e:
+            celery_logger.warning(f"Ошибка сохранения контрольной точки {self.key}: {e}")
+
+    async def clear(self):
+        """Часть завершена: контрольная точка больше не нужна"""
+        try:
+            await get_async_redis().delete(self.key)
+        except Exception as e:
+            celery_logger.warning(f"Ошибка удаления контрольной точки {self.key}: {e}")
+
+    def result(self) -> Dict:
+        """Итог части для callback chord"""
+        return {**self.stats, "errors": list(self.errors)}
@@ -24,36 +24,10 @@ logger = logging.getLogger(__name__)
 class TokenManager:
     """Менеджер токенов с хранением в Redis"""
 
-    def __init__(self, redis_url: str = None, redis_password: str = None):
-        """
-        Инициализация менеджера токенов
-
-        Args:
-            redis_url: URL для подключения к Redis
-            redis_password: Пароль для Redis
-        """
-        self.redis_url = redis_url or os.getenv("REDIS_URL", "redis://localhost:6379/0")
-        self.redis_password = redis_password or os.getenv("REDIS_PASSWORD")
-        self._redis_client = None
-
     def _get_redis_client(self):
-        """Получение клиента Redis (lazy initialization)"""
-        if self._redis_client is None:
-            import redis
-
-            # Формируем правильный URL с паролем
-            if self.redis_password and "://" in self.redis_url:
-                # Проверяем, есть ли уже пароль в URL
-                if not self.redis_url.startswith("redis://:"):
-                    # Добавляем пароль в URL
-                    host = self.redis_url.split("://")[1].split(":")[0]
-                    port = self.redis_url.split(":")[-1].split("/")[0]
-                    db = self.redis_url.split("/")[-1] if "/" in self.redis_url else "0"
-                    self.redis_url = f"redis://:{self.redis_password}@{host}:{port}/{db}"
-
-            self._redis_client = redis.from_url(self.redis_url, decode_responses=True)
-
-        return self._redis_client
+        """Общий синхронный клиент Redis процесса (services/redis_client.py)"""
+        from services.redis_client import get_sync_redis
+        return get_sync_redis()
 
     def get_chitai_gorod_token(self) -> Optional[str]:
         """
@@ -205,10 +179,11 @@ class TokenManager:
             return False
 
     def close(self):
-        """Закрытие соединения с Redis"""
-        if self._redis_client:
-            self._redis_client.close()
-            self._redis_client = None
+        """
+        Ничего не делает: своего соединения у менеджера нет
+
+        Общий пул процесса закрывается services.redis_client.close_sync_redis.
+        """
 
     def send_token_notification(self, status: str, message: str, details: str = None):
         """
@@ -0,0 +1,169 @@
+"""
+Среда выполнения асинхронных задач в процессе воркера Celery
+
+Содержит:
+- один долгоживущий event loop на процесс воркера: пул соединений движка БД
+  (database/config.py), HTTP пул (services/http_pool.py), пул Redis
+  (services/redis_client.py) и Telegram бот (services/notification_delivery.py)
+  привязаны к циклу и переиспользуются всеми задачами процесса
+- run / async_task - выполнение корутины задачи в этом цикле
+- асинхронный режим воркера (-P threads): задачи из потоков пула Celery
+  отправляются в один цикл, работающий в отдельном потоке, - процесс
+  выполняет столько задач, ожидающих I/O, сколько потоков в пуле (--concurrency).
+  Корутины задач не должны блокировать цикл: синхронный I/O (Redis через
+  get_sync_redis, TokenManager, Google Sheets, requests) и тяжёлые вычисления -
+  через asyncio.to_thread, иначе ждут все задачи процесса
+- хуки worker_process_init / worker_process_shutdown / worker_shutdown
+  (services/celery_app.py): сброс соединений, унаследованных от родителя
+  после fork, и закрытие пулов при остановке процесса
+"""
+
+import asyncio
+import functools
+import threading
+from typing import Optional
+
+from services.logger import celery_logger
+
+# Цикл основного потока (prefork, solo)
+_loop: Optional[asyncio.AbstractEventLoop] = None
+# Цикл асинхронного режима и его поток (пул threads)
+_thread_loop: Optional[asyncio.AbstractEventLoop] = None
+_thread: Optional[threading.Thread] = None
+_thread_lock = threading.Lock()
+
+
+def get_worker_loop() -> asyncio.AbstractEventLoop:
+    """Event loop процесса (создаётся при первом обращении)"""
+    global _loop
+    if _loop is None or _loop.is_closed():
+        _loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(_loop)
+    return _loop
+
+
+def get_shared_loop() -> asyncio.AbstractEventLoop:
+    """Цикл асинхронного режима: работает в отдельном потоке, общий для потоков пула"""
+    global _thread_loop, _thread
+    with _thread_lock:
+        if _thread_loop is None or _thread_loop.is_closed():
+            _thread_loop = asyncio.new_event_loop()
+            _thread = threading.Thread(
+                target=_thread_loop.run_forever, name="worker-asyncio", daemon=True
+            )
+            _thread.start()
+            celery_logger.info("Запущен общий event loop асинхронного режима воркера")
+        return _thread_loop
+
+
+def _task_time_limit() -> Optional[float]:
+    """Лимит времени текущей задачи Celery (soft, иначе hard)"""
+    from celery import current_task
+
+    if current_task is None:
+        return None
+    hard, soft = current_task.request.timelimit or (None, None)
+    return soft or hard or current_task.soft_time_limit or current_task.time_limit
+
+
+def run(coro):
+    """
+    Выполнение корутины в цикле процесса
+
+    Вызов из потока пула (-P threads) ждёт результат корутины в общем цикле,
+    пока другие задачи процесса выполняются в нём же. Пул threads не
+    поддерживает лимиты времени Celery - корутина отменяется по лимиту задачи
+    (asyncio.TimeoutError). Вызов из работающего event loop (вложенный) -
+    ошибка: пулы БД, HTTP и Redis привязаны к циклу процесса, и в другом цикле
+    корутина не смогла бы ими пользоваться. Из корутины задачу нужно ждать
+    через await, а не через run.
+
+    Raises:
+        RuntimeError: В текущем потоке уже работает event loop
+    """
+    if threading.current_thread() is not threading.main_thread():
+        timeout = _task_time_limit()
+        if timeout:
+            coro = asyncio.wait_for(coro, timeout)
+        return asyncio.run_coroutine_threadsafe(coro, get_shared_loop()).result()
+
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return get_worker_loop().run_until_complete(coro)
+
+    coro.close()
+    raise RuntimeError(
+        "worker_runtime.run вызван из работающего event loop: ресурсы процесса "
+        "привязаны к его циклу, вызывайте корутину через await"
+    )
+
+
+def async_task(func):
+    """Декоратор: async функция вызывается синхронно и выполняется в цикле процесса"""
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        return run(func(*args, **kwargs))
+
+    return wrapper
+
+
+async def _close_resources():
+    """Закрытие пулов, привязанных к циклу процесса"""
+    from database.config import close_db
+    from services.http_pool import close_http_session
+    from services.notification_delivery import close_telegram_bot
+    from services.redis_client import close_async_redis
+
+    for close in (close_http_session, close_async_redis, close_telegram_bot, close_db):
+        try:
+            await close()
+        except Exception as e:
+            celery_logger.warning(f"Ошибка закрытия ресурсов воркера ({close.__name__}): {e}")
+
+
+def init_worker_process():
+    """Старт процесса воркера: соединения родителя не используются, цикл создаётся заранее"""
+    from database.config import reset_engine_after_fork
+
+    global _loop
+    reset_engine_after_fork()
+    _loop = None
+    get_worker_loop()
+
+
+def _shutdown_shared_loop():
+    """Закрытие пулов в общем цикле и остановка его потока"""
+    global _thread_loop, _thread
+    with _thread_lock:
+        loop, thread = _thread_loop, _thread
+        _thread_loop, _thread = None, None
+    if loop is None or loop.is_closed():
+        return
+    try:
+        asyncio.run_coroutine_threadsafe(_close_resources(), loop).result(timeout=30)
+    except Exception as e:
+        celery_logger.warning(f"Ошибка закрытия ресурсов общего цикла: {e}")
+    loop.call_soon_threadsafe(loop.stop)
+    thread.join(timeout=30)
+    if not loop.is_running():
+        loop.close()
+
+
+def shutdown_worker_process():
+    """Остановка процесса воркера: закрытие пулов и циклов"""
+    from services.redis_client import close_sync_redis
+
+    global _loop
+    _shutdown_shared_loop()
+    close_sync_redis()
+
+    loop, _loop = _loop, None
+    if loop is None or loop.is_closed():
+        return
+    try:
+        loop.run_until_complete(_close_resources())
+        loop.run_until_complete(loop.shutdown_asyncgens())
+    finally:
+        loop.close()
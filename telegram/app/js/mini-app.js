@@ -22,6 +22,9 @@ class BookHunterApp {
         this.recentBooksTotal = 0; // Общее количество недавних книг
         this.catalogBooksPage = 1; // Текущая страница книг в каталоге
         this.catalogBooksTotal = 0; // Общее количество книг в каталоге
+        this.recentBooksCursors = {}; // Курсоры страниц недавних книг: {страница: курсор}
+        this.catalogBooksCursors = {}; // Курсоры страниц каталога: {страница: курсор}
+        this.catalogCursorsKey = ''; // Фильтры, к которым относятся курсоры каталога
         this.savedScrollPosition = 0; // Сохраненная позиция скролла (задача #3)
         this.booksPerPage = 15; // Количество книг на странице
         this.currentAlert = null; // Текущая подписка для редактирования
@@ -629,13 +632,21 @@ class BookHunterApp {
             const limit = 15; // 15 книг на странице
             const offset = (page - 1) * limit;
 
+            // Следующая страница по курсору стоит столько же, сколько первая;
+            // без курсора (первая страница или переход через несколько) - offset
+            if (page === 1) this.recentBooksCursors = {};
+            const cursor = this.recentBooksCursors[page];
+            const pageParam = cursor ? `cursor=${encodeURIComponent(cursor)}` : `offset=${offset}`;
+
             // Загружаем книги с сортировкой по цене по возрастанию
-            const response = await fetch(`${this.apiBaseUrl}/web/books/api/all?limit=${limit}&offset=${offset}`);
+            const response = await fetch(`${this.apiBaseUrl}/web/books/api/all?limit=${limit}&${pageParam}`);
             if (!response.ok) throw new Error('Ошибка загрузки книг');
 
             const data = await response.json();
             const books = data.books || [];
-            const total = data.total || 0;
+            // По курсору общее количество не считается - оставляем известное
+            const total = data.total != null ? data.total : this.recentBooksTotal;
+            if (data.next_cursor) this.recentBooksCursors[page + 1] = data.next_cursor;
 
             // Сортируем книги по цене по возрастанию
             books.sort((a, b) => (a.current_price || 0) - (b.current_price || 0));
@@ -848,8 +859,16 @@ class BookHunterApp {
                     url += `&max_price=${params.price}`;
                 }
             } else {
-                // Если нет запроса, загружаем все книги с сортировкой по цене
-                url = `${this.apiBaseUrl}/web/books/api/all?limit=${limit}&offset=${offset}`;
+                // Если нет запроса, загружаем все книги с сортировкой по цене.
+                // Курсоры страниц действительны только для тех же фильтров
+                const cursorsKey = [params.source, params.discount, params.price].join('|');
+                if (page === 1 || cursorsKey !== this.catalogCursorsKey) {
+                    this.catalogBooksCursors = {};
+                    this.catalogCursorsKey = cursorsKey;
+                }
+                const cursor = this.catalogBooksCursors[page];
+                const pageParam = cursor ? `cursor=${encodeURIComponent(cursor)}` : `offset=${offset}`;
+                url = `${this.apiBaseUrl}/web/books/api/all?limit=${limit}&${pageParam}`;
                 const queryParams = [];
                 if (params.source) {
                     queryParams.push(`source=${params.source}`);
@@ -896,7 +915,10 @@ class BookHunterApp {
             // Веб API: {books: [...]}
             if (data.success && data.books) {
                 this.data.books = data.books;
-                this.catalogBooksTotal = data.total || 0;
+                // По курсору общее количество не считается - оставляем известное
+                if (data.total != null || useSmartSearch) {
+                    this.catalogBooksTotal = data.total || 0;
+                }
             } else if (data.books) {
                 this.data.books = data.books;
                 this.catalogBooksTotal = data.total || 0;
@@ -906,6 +928,9 @@ class BookHunterApp {
             }
 
             this.catalogBooksPage = page;
+            if (!useSmartSearch && data.next_cursor) {
+                this.catalogBooksCursors[page + 1] = data.next_cursor;
+            }
 
             console.log('[loadBooks] Книги для рендеринга:', this.data.books.length);
             console.log('[loadBooks] Всего книг:', this.catalogBooksTotal);
@@ -1551,8 +1576,12 @@ class BookHunterApp {
 
             // Обрабатываем ответ
             if (data.tasks && data.tasks.length > 0) {
-                // Запущен парсинг - показываем статус всех тасков
-                this.showParsingStatus(data.tasks, query);
+                // Запущен парсинг - получаем книги потоком, без поддержки SSE - опрашиваем статус
+                if (data.stream_url && window.EventSource) {
+                    this.streamParsingResults(data.stream_url, data.tasks, query);
+                } else {
+                    this.showParsingStatus(data.tasks, query);
+                }
             } else if (data.books && data.books.length > 0) {
                 // Книги уже есть в базе - загружаем их
                 this.showToast('Найдено в базе: ' + data.books.length + ' книг', 'success');
@@ -1567,6 +1596,67 @@ class BookHunterApp {
         }
     }
 
+    /**
+     * Получение книг потоком (Server-Sent Events) по мере парсинга
+     * @param {string} streamUrl - URL потока задач
+     * @param {Array} tasks - Массив тасков [{task_id, source}] (для перехода на опрос при ошибке)
+     * @param {string} query - Поисковый запрос
+     */
+    streamParsingResults(streamUrl, tasks, query) {
+        console.log('[streamParsingResults] Подключаемся к потоку:', streamUrl);
+
+        const container = document.getElementById('books-container');
+        if (container) {
+            container.innerHTML = `
+                <div class="card" style="text-align: center; padding: 24px;">
+                    <div class="loading__spinner" style="margin: 0 auto 16px;"></div>
+                    <h4 style="margin-bottom: 8px;">Поиск книг...</h4>
+                    <p style="color: var(--text-secondary); font-size: 0.9rem;">
+                        Ищем книги по запросу "${query}"
+                    </p>
+                </div>
+            `;
+        }
+
+        const streamedBooks = new Map();
+        let finished = false;
+        const source = new EventSource(`${this.apiBaseUrl}${streamUrl}`);
+
+        const finish = async (message, type) => {
+            if (finished) return;
+            finished = true;
+            source.close();
+            clearTimeout(timeoutId);
+            if (message) this.showToast(message, type);
+            // Загружаем итоговую выдачу (с учётом фильтров и сортировки)
+            await this.loadBooks({ query });
+        };
+
+        source.addEventListener('books', (event) => {
+            const data = JSON.parse(event.data);
+            (data.books || []).forEach(book => streamedBooks.set(book.id, book));
+            console.log('[streamParsingResults] Получено книг:', streamedBooks.size);
+            this.renderBooks([...streamedBooks.values()], true);
+        });
+
+        source.addEventListener('end', () => {
+            console.log('[streamParsingResults] Все парсеры завершены');
+            finish('Поиск завершён!', 'success');
+        });
+
+        source.onerror = () => {
+            if (finished) return;
+            console.warn('[streamParsingResults] Ошибка потока, переходим на опрос статуса');
+            finished = true;
+            source.close();
+            clearTimeout(timeoutId);
+            this.showParsingStatus(tasks, query);
+        };
+
+        // Таймаут 60 секунд (как при опросе)
+        const timeoutId = setTimeout(() => finish(null), 60000);
+    }
+
     /**
      * Показать статус парсинга и периодически обновлять
      * @param {Array|Object} tasks - Массив тасков [{task_id, source}] или один таск
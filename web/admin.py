@@ -1,11 +1,11 @@
 """Административный интерфейс - отдельная админ-панель с полной системной информацией"""
 from fastapi import APIRouter, Request, Depends, HTTPException, status
-from fastapi.responses import HTMLResponse, JSONResponse, Response
+from fastapi.responses import HTMLResponse, JSONResponse
 from fastapi.templating import Jinja2Templates
 from fastapi.security import HTTPBasic, HTTPBasicCredentials
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select, func, desc, case
-from typing import List
+from typing import List, Optional
 import logging
 from datetime import datetime, timedelta
 import json
@@ -19,6 +19,7 @@ from models.book import Book
 from models.alert import Alert
 from models.notification import Notification
 from models.parsing_log import ParsingLog
+from services import export_stream
 
 logger = logging.getLogger(__name__)
 
@@ -174,9 +175,8 @@ async def admin_health(
         
         # Проверка Redis
         try:
-            import redis.asyncio as redis
-            r = redis.from_url("redis://redis:6379/0")
-            await r.ping()
+            from services.redis_client import get_async_redis
+            await get_async_redis().ping()
             health_data["components"]["redis"] = {
                 "status": "healthy", 
                 "message": "Redis connection OK",
@@ -991,53 +991,47 @@ async def admin_analytics(
 @router.get("/api/export/users")
 async def admin_export_users(
     format: str = "json",
-    db: AsyncSession = Depends(get_db),
+    gzip: bool = False,
     admin_username: str = Depends(verify_admin)
 ):
-    """Экспорт пользователей"""
+    """Экспорт пользователей (потоково: json, ndjson или csv, gzip по желанию)"""
     try:
-        users_query = await db.execute(
-            select(User).order_by(User.created_at.desc())
+        users_query = select(
+            User.id,
+            User.telegram_id,
+            User.username,
+            User.first_name,
+            User.last_name,
+            User.is_active,
+            User.created_at,
+            User.last_activity
+        ).order_by(User.created_at.desc(), User.id.desc())
+
+        return export_stream.export_response(
+            export_stream.stream_rows(users_query),
+            name="users",
+            export_format=format,
+            csv_header=['ID', 'Telegram ID', 'Username', 'Имя', 'Активен', 'Дата регистрации'],
+            csv_row=lambda user: [
+                user.id,
+                user.telegram_id,
+                user.username or 'Не указано',
+                " ".join(filter(None, [user.first_name, user.last_name])) or 'Не указано',
+                'Да' if user.is_active else 'Нет',
+                user.created_at.strftime('%d.%m.%Y %H:%M:%S') if user.created_at else 'Не указано'
+            ],
+            json_row=lambda user: {
+                'id': user.id,
+                'telegram_id': user.telegram_id,
+                'username': user.username,
+                'first_name': user.first_name,
+                'last_name': user.last_name,
+                'is_active': user.is_active,
+                'created_at': user.created_at,
+                'last_activity': user.last_activity
+            },
+            gzip=gzip
         )
-        users = users_query.scalars().all()
-        
-        if format == "csv":
-            # Простая реализация CSV экспорта
-            import csv
-            import io
-            
-            output = io.StringIO()
-            writer = csv.writer(output)
-            writer.writerow(['ID', 'Email', 'Имя', 'Активен', 'Дата регистрации'])
-            
-            for user in users:
-                writer.writerow([
-                    user.id,
-                    user.email,
-                    user.name or 'Не указано',
-                    'Да' if user.is_active else 'Нет',
-                    user.created_at.strftime('%d.%m.%Y %H:%M:%S') if user.created_at else 'Не указано'
-                ])
-            
-            return Response(
-                content=output.getvalue(),
-                media_type='text/csv',
-                headers={'Content-Disposition': 'attachment; filename=users.csv'}
-            )
-        else:
-            # JSON экспорт
-            users_data = []
-            for user in users:
-                users_data.append({
-                    'id': user.id,
-                    'email': user.email,
-                    'name': user.name,
-                    'is_active': user.is_active,
-                    'created_at': user.created_at.isoformat() if user.created_at else None,
-                    'last_login': user.last_login.isoformat() if getattr(user, 'last_login', None) else None
-                })
-            
-            return JSONResponse({"success": True, "data": users_data})
             
     except Exception as e:
         logger.error(f"Ошибка экспорта пользователей: {e}")
@@ -1046,56 +1040,87 @@ async def admin_export_users(
 @router.get("/api/export/books")
 async def admin_export_books(
     format: str = "json",
+    limit: Optional[int] = None,
+    cursor: Optional[str] = None,
+    gzip: bool = False,
     db: AsyncSession = Depends(get_db),
     admin_username: str = Depends(verify_admin)
 ):
-    """Экспорт книг"""
+    """
+    Экспорт книг по id (потоково: json, ndjson или csv, gzip по желанию)
+
+    С limit выгружается одна страница: книги с id больше cursor. Курсор
+    следующей страницы (id последней книги страницы) передаётся в заголовке
+    X-Next-Cursor для всех форматов, в JSON - ещё и в next_cursor после data.
+    Порядок по id не меняется при обновлении книг (parsed_at меняется), поэтому
+    книги не пропускаются между страницами.
+    """
     try:
-        books_query = await db.execute(
-            select(Book).order_by(Book.parsed_at.desc())
+        after_id = 0
+        if cursor:
+            try:
+                after_id = int(cursor)
+            except ValueError:
+                return JSONResponse({"success": False, "error": "Некорректный курсор экспорта"}, status_code=400)
+
+        books_query = select(
+            Book.id,
+            Book.title,
+            Book.author,
+            Book.current_price,
+            Book.original_price,
+            Book.discount_percent,
+            Book.source,
+            Book.url,
+            Book.parsed_at
+        ).where(Book.id > after_id).order_by(Book.id)
+
+        # Граница страницы определяется до выгрузки (по индексу первичного
+        # ключа), чтобы курсор попал в заголовок ответа
+        next_cursor = None
+        if limit and limit > 0:
+            last_id = (await db.execute(
+                select(Book.id).where(Book.id > after_id).order_by(Book.id).offset(limit - 1).limit(1)
+            )).scalar()
+            if last_id is not None:
+                next_cursor = str(last_id)
+                books_query = books_query.where(Book.id <= last_id)
+            books_query = books_query.limit(limit)
+
+        headers = {"X-Next-Cursor": next_cursor} if next_cursor else None
+
+        def json_tail():
+            return {"next_cursor": next_cursor}
+
+        return export_stream.export_response(
+            export_stream.stream_rows(books_query),
+            name="books",
+            export_format=format,
+            csv_header=['ID', 'Название', 'Автор', 'Цена', 'Скидка', 'Магазин', 'Дата парсинга'],
+            csv_row=lambda book: [
+                book.id,
+                book.title or 'Не указано',
+                book.author or 'Не указано',
+                float(book.current_price) if book.current_price else 0,
+                f"{book.discount_percent}%" if book.discount_percent else 'Нет',
+                book.source or 'Не указано',
+                book.parsed_at.strftime('%d.%m.%Y %H:%M:%S') if book.parsed_at else 'Не указано'
+            ],
+            json_row=lambda book: {
+                'id': book.id,
+                'title': book.title,
+                'author': book.author,
+                'current_price': float(book.current_price) if book.current_price else 0,
+                'original_price': float(book.original_price) if book.original_price else 0,
+                'discount_percent': book.discount_percent,
+                'source': book.source,
+                'url': book.url,
+                'parsed_at': book.parsed_at
+            },
+            gzip=gzip,
+            json_tail=json_tail,
+            headers=headers
         )
-        books = books_query.scalars().all()
-        
-        if format == "csv":
-            import csv
-            import io
-            
-            output = io.StringIO()
-            writer = csv.writer(output)
-            writer.writerow(['ID', 'Название', 'Автор', 'Цена', 'Скидка', 'Магазин', 'Дата парсинга'])
-            
-            for book in books:
-                writer.writerow([
-                    book.id,
-                    book.title or 'Не указано',
-                    book.author or 'Не указано',
-                    float(book.current_price) if book.current_price else 0,
-                    f"{book.discount_percent}%" if book.discount_percent else 'Нет',
-                    book.source or 'Не указано',
-                    book.parsed_at.strftime('%d.%m.%Y %H:%M:%S') if book.parsed_at else 'Не указано'
-                ])
-            
-            return Response(
-                content=output.getvalue(),
-                media_type='text/csv',
-                headers={'Content-Disposition': 'attachment; filename=books.csv'}
-            )
-        else:
-            books_data = []
-            for book in books:
-                books_data.append({
-                    'id': book.id,
-                    'title': book.title,
-                    'author': book.author,
-                    'current_price': float(book.current_price) if book.current_price else 0,
-                    'original_price': float(book.original_price) if book.original_price else 0,
-                    'discount_percent': book.discount_percent,
-                    'source': book.source,
-                    'url': book.url,
-                    'parsed_at': book.parsed_at.isoformat() if book.parsed_at else None
-                })
-            
-            return JSONResponse({"success": True, "data": books_data})
             
     except Exception as e:
         logger.error(f"Ошибка экспорта книг: {e}")
@@ -1105,78 +1130,43 @@ async def admin_export_books(
 async def admin_export_logs(
     format: str = "json",
     limit: int = 1000,
-    db: AsyncSession = Depends(get_db),
+    gzip: bool = False,
     admin_username: str = Depends(verify_admin)
 ):
-    """Экспорт логов"""
+    """Экспорт логов (потоково: json, ndjson или csv, gzip по желанию)"""
     try:
-        logs_query = await db.execute(
-            select(
-                ParsingLog.id,
-                ParsingLog.source,
-                ParsingLog.status,
-                ParsingLog.is_success,
-                ParsingLog.pages_parsed,
-                ParsingLog.books_found,
-                ParsingLog.books_updated,
-                ParsingLog.books_added,
-                ParsingLog.books_removed,
-                ParsingLog.created_at,
-                ParsingLog.started_at,
-                ParsingLog.finished_at,
-                ParsingLog.duration_seconds,
-                ParsingLog.error_message,
-                ParsingLog.warning_message,
-                ParsingLog.request_count,
-                ParsingLog.successful_requests,
-                ParsingLog.failed_requests,
-                ParsingLog.search_query,
-                ParsingLog.max_pages,
-                ParsingLog.rate_limit_delay,
-                ParsingLog.user_agent,
-                ParsingLog.proxy_used,
-                ParsingLog.ip_address,
-                ParsingLog.extra_metadata
-            ).order_by(desc(ParsingLog.created_at)).limit(limit)
-        )
-        logs = logs_query.scalars().all()
-        
-        if format == "csv":
-            import csv
-            import io
-            
-            output = io.StringIO()
-            writer = csv.writer(output)
-            writer.writerow(['ID', 'Источник', 'Статус', 'Найдено книг', 'Ошибка', 'Дата'])
-            
-            for log in logs:
-                writer.writerow([
-                    log.id,
-                    log.source or 'Не указано',
-                    log.status,
-                    log.books_found or 0,
-                    log.error_message or '',
-                    log.created_at.strftime('%d.%m.%Y %H:%M:%S') if log.created_at else 'Не указано'
-                ])
-            
-            return Response(
-                content=output.getvalue(),
-                media_type='text/csv',
-                headers={'Content-Disposition': 'attachment; filename=logs.csv'}
-            )
-        else:
-            logs_data = []
-            for log in logs:
-                logs_data.append({
-                    'id': log.id,
-                    'source': log.source,
-                    'status': log.status,
-                    'books_found': log.books_found,
-                    'error_message': log.error_message,
-                    'created_at': log.created_at.isoformat() if log.created_at else None
-                })
-            
-            return JSONResponse({"success": True, "data": logs_data})
+        logs_query = select(
+            ParsingLog.id,
+            ParsingLog.source,
+            ParsingLog.status,
+            ParsingLog.books_found,
+            ParsingLog.error_message,
+            ParsingLog.created_at
+        ).order_by(desc(ParsingLog.created_at)).limit(limit)
+
+        return export_stream.export_response(
+            export_stream.stream_rows(logs_query),
+            name="logs",
+            export_format=format,
+            csv_header=['ID', 'Источник', 'Статус', 'Найдено книг', 'Ошибка', 'Дата'],
+            csv_row=lambda log: [
+                log.id,
+                log.source or 'Не указано',
+                log.status,
+                log.books_found or 0,
+                log.error_message or '',
+                log.created_at.strftime('%d.%m.%Y %H:%M:%S') if log.created_at else 'Не указано'
+            ],
+            json_row=lambda log: {
+                'id': log.id,
+                'source': log.source,
+                'status': log.status,
+                'books_found': log.books_found,
+                'error_message': log.error_message,
+                'created_at': log.created_at
+            },
+            gzip=gzip
+        )
             
     except Exception as e:
         logger.error(f"Ошибка экспорта логов: {e}")
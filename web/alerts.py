@@ -14,6 +14,7 @@ from database.config import get_db
 from models.alert import Alert
 from models.book import Book
 from models.user import User
+from services.alert_index import publish_alert_changes
 
 logger = logging.getLogger(__name__)
 
@@ -215,6 +216,7 @@ async def create_alert_web(
 
         db.add(new_alert)
         await db.commit()
+        await publish_alert_changes([new_alert.id])
         
         return RedirectResponse(url="/web/alerts", status_code=303)
         
@@ -299,6 +301,7 @@ async def update_alert_web(
         alert.updated_at = datetime.utcnow()
         
         await db.commit()
+        await publish_alert_changes([alert_id])
         
         return RedirectResponse(url="/web/alerts", status_code=303)
         
@@ -345,6 +348,7 @@ async def delete_alert_web(
         
         await db.delete(alert)
         await db.commit()
+        await publish_alert_changes([alert_id])
         
         return RedirectResponse(url="/web/alerts", status_code=303)
     except HTTPException:
@@ -415,6 +419,7 @@ async def create_alert_from_book(
         
         db.add(new_alert)
         await db.commit()
+        await publish_alert_changes([new_alert.id])
         
         logger.info(f"Создана подписка на книгу '{book.title}' с целевой ценой {target_price}₽")
         
@@ -3,35 +3,57 @@ from fastapi import APIRouter, Request, Depends, Query, HTTPException
 from fastapi.responses import HTMLResponse, JSONResponse
 from fastapi.templating import Jinja2Templates
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, func, or_, and_
-from typing import List
+from sqlalchemy import select, and_
+from typing import Optional
+from urllib.parse import urlencode
 import json
 import logging
-import string
-import re
 
 from database.config import get_db
 from models.book import Book
+from services import book_search
 
 logger = logging.getLogger(__name__)
 
-def clean_search_words(text: str) -> List[str]:
-    """
-    Очищает текст от знаков пунктуации и разбивает на слова.
-    """
-    # Заменяем запятые, точки и другие разделители на пробелы
-    text = re.sub(r'[,\.\!\?\:\;\-\—\(\)\[\]\{\}<>]', ' ', text)
-    # Разбиваем на слова и очищаем каждый
-    words = text.lower().split()
-    # Удаляем оставшиеся знаки пунктуации из слов
-    cleaned_words = [word.strip(string.punctuation) for word in words]
-    # Убираем пустые строки
-    return [word for word in cleaned_words if word.strip()]
-
 # Создаем роутер
 router = APIRouter()
 templates = Jinja2Templates(directory="web/templates")
 
+# Номеров страниц в навигации режима совместимости (?page=N)
+PAGE_LINKS = 5
+
+
+def _pager(request: Request, page: int, total_pages: Optional[int], cursor: Optional[str], next_cursor: Optional[str]) -> dict:
+    """
+    Ссылки навигации books/_pagination.html
+
+    Следующая страница - по курсору (next_cursor), номера страниц остаются
+    режимом совместимости: по ним и для сортировки по релевантности
+    страница читается через OFFSET.
+    """
+    params = {key: value for key, value in request.query_params.items() if key not in ("page", "cursor")}
+
+    def link(**extra) -> str:
+        return f"{request.url.path}?{urlencode({**params, **extra})}"
+
+    pages = []
+    if total_pages and total_pages > 1 and not cursor:
+        first = max(1, min(page - PAGE_LINKS // 2, total_pages - PAGE_LINKS + 1))
+        pages = [(number, link(page=number)) for number in range(first, min(first + PAGE_LINKS, total_pages + 1))]
+
+    if next_cursor:
+        next_url = link(cursor=next_cursor)
+    elif total_pages and page < total_pages and not cursor:
+        next_url = link(page=page + 1)
+    else:
+        next_url = None
+
+    return {
+        "first_url": link() if cursor else None,
+        "pages": pages,
+        "next_url": next_url,
+    }
+
 @router.get("/", response_class=HTMLResponse)
 async def list_books(
     request: Request,
@@ -41,9 +63,11 @@ async def list_books(
     min_discount: str = Query(None),
     max_price: str = Query(None),
     search: str = Query(None),
+    sort: str = Query(book_search.ORDER_PRICE, description="Сортировка: price, recent, discount"),
+    cursor: str = Query(None, description="Курсор следующей страницы (вместо page)"),
     db: AsyncSession = Depends(get_db)
 ):
-    """Список книг с фильтрацией и пагинацией"""
+    """Список книг с фильтрацией и пагинацией (курсорной или по номеру страницы)"""
     try:
         # Преобразуем строковые параметры в числа, если они не пустые
         min_discount_int = None
@@ -65,61 +89,27 @@ async def list_books(
             except ValueError:
                 max_price_float = None
         
-        # Базовый запрос
-        query = select(Book)
-        
-        # Применяем фильтры
-        if source:
-            query = query.where(Book.source == source)
-        
-        if min_discount_int is not None:
-            query = query.where(Book.discount_percent >= min_discount_int)
-        
-        if max_price_float is not None:
-            query = query.where(Book.current_price <= max_price_float)
-        
-        if search:
-            # Улучшенный поиск: разбиваем запрос на слова и очищаем от пунктуации
-            search_words = clean_search_words(search)
-            
-            # Фильтруем предлоги и союзы
-            stop_words = {"и", "в", "на", "с", "от", "до", "по", "о", "об", "а", "но", "или"}
-            search_words = [word for word in search_words if word.strip() and word not in stop_words]
-            
-            if search_words:
-                # Создаем условия для каждого слова
-                word_conditions = []
-                for word in search_words:
-                    word_conditions.append(
-                        or_(
-                            func.lower(Book.title).like(f"%{word}%"),
-                            func.lower(Book.author).like(f"%{word}%")
-                        )
-                    )
-                
-                # Применяем логику ИЛИ - слово найдено в любом поле
-                if word_conditions:
-                    query = query.where(or_(*word_conditions))
-        
-        # Подсчет общего количества
-        count_result = await db.execute(select(func.count()).select_from(query.subquery()))
-        total = count_result.scalar() or 0
-        
-        # Пагинация
-        offset = (page - 1) * per_page
-        # Сортировка по возрастанию цены (самая дешёвая - первая)
-        query = query.offset(offset).limit(per_page).order_by(Book.current_price.asc())
-        
-        # Выполняем запрос
-        result = await db.execute(query)
-        books = result.scalars().all()
+        # Страница и общее количество одним запросом,
+        # по умолчанию сортировка по возрастанию цены (самая дешёвая - первая)
+        books, total = await book_search.search_books(
+            db,
+            query=search,
+            sources=[source] if source else None,
+            min_discount=min_discount_int,
+            max_price=max_price_float,
+            order=sort,
+            limit=per_page,
+            offset=(page - 1) * per_page,
+            cursor=cursor,
+        )
+        next_cursor = book_search.next_cursor(books, per_page, sort, search)
         
         # Получаем статистику для фильтров
         sources = await db.execute(select(Book.source).distinct())
         available_sources = [row[0] for row in sources.fetchall()]
         
-        # Вычисляем общее количество страниц
-        total_pages = (total + per_page - 1) // per_page
+        # Вычисляем общее количество страниц (по курсору общее количество не считается)
+        total_pages = (total + per_page - 1) // per_page if total is not None else None
         
         return templates.TemplateResponse(
             "books/list.html", 
@@ -131,9 +121,24 @@ async def list_books(
                 "per_page": per_page,
                 "total": total,
                 "total_pages": total_pages,
+                "next_cursor": next_cursor,
+                "pager": _pager(request, page, total_pages, cursor, next_cursor),
+                # Окно каталога для /web/books/api/all - та же страница, что на сервере
+                "catalog_params": {
+                    key: value for key, value in {
+                        "limit": per_page,
+                        "sort": sort,
+                        "cursor": cursor,
+                        "offset": None if cursor else (page - 1) * per_page,
+                        "source": source,
+                        "min_discount": min_discount_int,
+                        "max_price": max_price_float,
+                    }.items() if value is not None
+                },
                 "sources": available_sources,
                 "filters": {
                     "source": source,
+                    "sort": sort,
                     "min_discount": min_discount_int if min_discount_int is not None else "",
                     "max_price": max_price_float if max_price_float is not None else "",
                     "search": search
@@ -158,6 +163,8 @@ async def search_books(
     source: str = Query(None),
     page: int = Query(1, ge=1),
     per_page: int = Query(20, ge=1, le=100),
+    sort: str = Query(book_search.ORDER_RELEVANCE, description="Сортировка: relevance, price, recent, discount"),
+    cursor: str = Query(None, description="Курсор следующей страницы (кроме сортировки по релевантности)"),
     db: AsyncSession = Depends(get_db)
 ):
     """Поиск книг с автоматическим запуском парсинга если книги не найдены"""
@@ -165,54 +172,24 @@ async def search_books(
         # Используем параметр q для поиска
         query_param = q
         
-        # Базовый запрос
-        search_query = select(Book)
-        
-        # Применяем фильтр по поисковому запросу - ищем в названии И авторе
-        if query_param:
-            # Улучшенный поиск: разбиваем запрос на слова и очищаем от пунктуации
-            search_words = clean_search_words(query_param)
-            
-            # Фильтруем предлоги и союзы
-            stop_words = {"и", "в", "на", "с", "от", "до", "по", "о", "об", "а", "но", "или"}
-            search_words = [word for word in search_words if word.strip() and word not in stop_words]
-            
-            if search_words:
-                # Создаем условия для каждого слова
-                word_conditions = []
-                for word in search_words:
-                    word_conditions.append(
-                        or_(
-                            func.lower(Book.title).like(f"%{word}%"),
-                            func.lower(Book.author).like(f"%{word}%")
-                        )
-                    )
-                
-                # Применяем логику ИЛИ - слово найдено в любом поле
-                if word_conditions:
-                    search_query = search_query.where(or_(*word_conditions))
-        
-        if source:
-            search_query = search_query.where(Book.source == source)
-        
-        # Подсчет общего количества
-        count_result = await db.execute(select(func.count()).select_from(search_query.subquery()))
-        total = count_result.scalar() or 0
-        
-        # Пагинация
-        offset = (page - 1) * per_page
-        search_query = search_query.offset(offset).limit(per_page).order_by(Book.parsed_at.desc())
-        
-        # Выполняем запрос
-        result = await db.execute(search_query)
-        books = result.scalars().all()
+        # Ищем в названии, авторе и издательстве: по умолчанию сначала самые релевантные
+        books, total = await book_search.search_books(
+            db,
+            query=query_param,
+            sources=[source] if source else None,
+            order=sort,
+            limit=per_page,
+            offset=(page - 1) * per_page,
+            cursor=cursor,
+        )
+        next_cursor = book_search.next_cursor(books, per_page, sort, query_param)
         
         # Получаем статистику для фильтров
         sources = await db.execute(select(Book.source).distinct())
         available_sources = [row[0] for row in sources.fetchall()]
         
-        # Вычисляем общее количество страниц
-        total_pages = (total + per_page - 1) // per_page
+        # Вычисляем общее количество страниц (по курсору общее количество не считается)
+        total_pages = (total + per_page - 1) // per_page if total is not None else None
         
         # Детальное логирование для отладки
         logger.info(f"🔍 Поиск по запросу '{query_param}': найдено {total} книг")
@@ -230,10 +207,13 @@ async def search_books(
                 "per_page": per_page,
                 "total": total,
                 "total_pages": total_pages,
+                "next_cursor": next_cursor,
+                "pager": _pager(request, page, total_pages, cursor, next_cursor),
                 "sources": available_sources,
                 "auto_parse": True,  # Всегда автоматический режим
                 "filters": {
-                    "source": source
+                    "source": source,
+                    "sort": sort
                 }
             }
         )
@@ -299,9 +279,16 @@ async def get_all_books(
     max_price: str = Query(None),
     limit: int = Query(None),
     offset: int = Query(None),
+    sort: str = Query(book_search.ORDER_PRICE, description="Сортировка: price, recent, discount"),
+    cursor: str = Query(None, description="Курсор следующей страницы (next_cursor из ответа)"),
     db: AsyncSession = Depends(get_db)
 ):
-    """Получить все книги из базы данных для JavaScript фильтрации"""
+    """
+    Получить все книги из базы данных для JavaScript фильтрации
+
+    Пагинация: offset (режим совместимости) или cursor - следующая страница
+    читается с позиции курсора и не дорожает с глубиной. С курсором total = null.
+    """
     try:
         # Преобразуем строковые параметры в числа, если они не пустые
         min_discount_int = None
@@ -323,45 +310,30 @@ async def get_all_books(
             except ValueError:
                 max_price_float = None
 
-        # Базовый запрос
-        query = select(Book)
-
-        # Применяем фильтры
-        if source:
-            query = query.where(Book.source == source)
-
-        if min_discount_int is not None:
-            query = query.where(Book.discount_percent >= min_discount_int)
-
-        if max_price_float is not None:
-            query = query.where(Book.current_price <= max_price_float)
-
-        # Подсчет общего количества
-        count_result = await db.execute(select(func.count()).select_from(query.subquery()))
-        total = count_result.scalar() or 0
-
-        # Пагинация
-        if offset is not None:
-            query = query.offset(offset)
-        if limit is not None:
-            query = query.limit(limit)
-
-        # Сортировка по возрастанию цены (самая дешёвая - первая)
-        query = query.order_by(Book.current_price.asc())
-        result = await db.execute(query)
-        books = result.scalars().all()
+        # По умолчанию сортировка по возрастанию цены (самая дешёвая - первая)
+        books, total = await book_search.search_books(
+            db,
+            sources=[source] if source else None,
+            min_discount=min_discount_int,
+            max_price=max_price_float,
+            order=sort,
+            limit=limit,
+            offset=offset,
+            cursor=cursor,
+        )
         
         # Преобразуем в словари используя метод to_dict()
         books_list = []
         for book in books:
             books_list.append(book.to_dict())
         
-        logger.info(f"Загружено {len(books_list)} книг для каталога (всего: {total}), сортировка по цене")
+        logger.info(f"Загружено {len(books_list)} книг для каталога (всего: {total}), сортировка: {sort}")
 
         return JSONResponse({
             "success": True,
             "books": books_list,
-            "total": total
+            "total": total,
+            "next_cursor": book_search.next_cursor(books, limit, sort)
         })
         
     except Exception as e:
@@ -380,9 +352,11 @@ async def search_books_api(
     max_price: str = Query(None, description="Максимальная цена"),
     limit: int = Query(None, description="Лимит результатов"),
     offset: int = Query(None, description="Смещение для пагинации"),
+    sort: str = Query(book_search.ORDER_PRICE, description="Сортировка: price, recent, discount, relevance"),
+    cursor: str = Query(None, description="Курсор следующей страницы (next_cursor из ответа)"),
     db: AsyncSession = Depends(get_db)
 ):
-    """Поиск книг по названию или автору с фильтрацией"""
+    """Поиск книг по названию или автору с фильтрацией (с курсором total = null)"""
     try:
         # Преобразуем строковые параметры в числа, если они не пустые
         min_discount_int = None
@@ -404,54 +378,18 @@ async def search_books_api(
             except ValueError:
                 max_price_float = None
 
-        # Ищем в базе данных по названию ИЛИ автору
-        # Улучшенный поиск: разбиваем запрос на слова и очищаем от пунктуации
-        search_words = clean_search_words(q)
-        
-        # Фильтруем предлоги и союзы
-        stop_words = {"и", "в", "на", "с", "от", "до", "по", "о", "об", "а", "но", "или"}
-        search_words = [word for word in search_words if word.strip() and word not in stop_words]
-        
-        if search_words:
-            # Создаем условия для каждого слова
-            word_conditions = []
-            for word in search_words:
-                word_conditions.append(
-                    or_(
-                        func.lower(Book.title).like(f"%{word}%"),
-                        func.lower(Book.author).like(f"%{word}%")
-                    )
-                )
-            
-            # Применяем логику ИЛИ - слово найдено в любом поле
-            query = select(Book).where(or_(*word_conditions))
-        else:
-            query = select(Book)
-            
-        # Применяем фильтры
-        if source:
-            query = query.where(Book.source == source)
-
-        if min_discount_int is not None:
-            query = query.where(Book.discount_percent >= min_discount_int)
-
-        if max_price_float is not None:
-            query = query.where(Book.current_price <= max_price_float)
-
-        # Подсчет общего количества
-        count_result = await db.execute(select(func.count()).select_from(query.subquery()))
-        total = count_result.scalar() or 0
-
-        # Пагинация
-        if offset is not None:
-            query = query.offset(offset)
-        if limit is not None:
-            query = query.limit(limit)
-
-        query = query.order_by(Book.current_price.asc())
-        
-        result = await db.execute(query)
-        books = result.scalars().all()
+        # Ищем в базе данных по названию, автору и издательству
+        books, total = await book_search.search_books(
+            db,
+            query=q,
+            sources=[source] if source else None,
+            min_discount=min_discount_int,
+            max_price=max_price_float,
+            order=sort,
+            limit=limit,
+            offset=offset,
+            cursor=cursor,
+        )
         
         # Преобразуем в словари используя метод to_dict()
         books_list = []
@@ -465,7 +403,8 @@ async def search_books_api(
             "query": q,
             "books": books_list,
             "total": total,
-            "found_count": len(books_list)
+            "found_count": len(books_list),
+            "next_cursor": book_search.next_cursor(books, limit, sort, q)
         })
         
     except Exception as e:
@@ -499,42 +438,17 @@ async def smart_search_books(
         # Импортируем логику умного поиска
         from services.search_utils import is_book_similar, is_exact_match
         
-        # Сначала ищем в базе данных (широкий поиск)
-        search_words = clean_search_words(q)
-        
-        # Фильтруем предлоги и союзы
-        stop_words = {"и", "в", "на", "с", "от", "до", "по", "о", "об", "а", "но", "или"}
-        search_words = [word for word in search_words if word.strip() and word not in stop_words]
-        
-        if search_words:
-            # Создаем условия для каждого слова
-            word_conditions = []
-            for word in search_words:
-                word_conditions.append(
-                    or_(
-                        func.lower(Book.title).like(f"%{word}%"),
-                        func.lower(Book.author).like(f"%{word}%")
-                    )
-                )
-            
-            # Применяем логику ИЛИ - слово найдено в любом поле
-            search_query = select(Book).where(or_(*word_conditions))
-        else:
-            search_query = select(Book)
-            
-        # Фильтр по источникам
-        search_query = search_query.where(Book.source.in_(sources_list))
-
-        # Фильтры по скидке и цене
-        if min_discount is not None:
-            search_query = search_query.where(Book.discount_percent >= min_discount)
-        if max_price is not None:
-            search_query = search_query.where(Book.current_price <= max_price)
-
-        search_query = search_query.order_by(Book.parsed_at.desc()).limit(50)
-        
-        result = await db.execute(search_query)
-        db_books = result.scalars().all()
+        # Сначала ищем в базе данных (широкий поиск), самые релевантные первыми
+        db_books, _ = await book_search.search_books(
+            db,
+            query=q,
+            sources=sources_list,
+            min_discount=min_discount,
+            max_price=max_price,
+            order=book_search.ORDER_RELEVANCE,
+            limit=50,
+            with_total=False,
+        )
         
         # Проверяем релевантность каждой книги и сортируем
         exact_matches = []  # Точные совпадения
@@ -562,12 +476,12 @@ async def smart_search_books(
         if force_parse:
             logger.info(f"[smart-search] force_parse=True, запускаем парсинг для '{q}'")
             
-            # Запускаем парсинг для каждого источника
-            from services.celery_tasks import parse_books
+            # Запускаем парсинг для каждого источника (или подключаемся к такому же запущенному)
+            from services.parse_flight import start_parse
             task_ids = []
             for src in sources_list:
-                task = parse_books.delay(q, src)
-                task_ids.append({"source": src, "task_id": task.id})
+                task_id, _ = await start_parse(q, src)
+                task_ids.append({"source": src, "task_id": task_id})
             
             # Возвращаем книги из базы + tasks для отслеживания
             return JSONResponse({
@@ -600,12 +514,12 @@ async def smart_search_books(
         # Только если совсем ничего нет - запускаем парсинг
         logger.info(f"Книги не найдены в базе для '{q}', запускаем парсинг")
         
-        # Запускаем парсинг для каждого источника
-        from services.celery_tasks import parse_books
+        # Запускаем парсинг для каждого источника (или подключаемся к такому же запущенному)
+        from services.parse_flight import start_parse
         task_ids = []
         for src in sources_list:
-            task = parse_books.delay(q, src)
-            task_ids.append({"source": src, "task_id": task.id})
+            task_id, _ = await start_parse(q, src)
+            task_ids.append({"source": src, "task_id": task_id})
         
         return JSONResponse({
             "success": True,
@@ -635,33 +549,14 @@ async def check_database_for_books(
 ):
     """Проверка наличия книг в базе данных"""
     try:
-        # Улучшенный поиск: разбиваем запрос на слова и очищаем от пунктуации
-        search_words = clean_search_words(q)
-        
-        # Фильтруем предлоги и союзы
-        stop_words = {"и", "в", "на", "с", "от", "до", "по", "о", "об", "а", "но", "или"}
-        search_words = [word for word in search_words if word.strip() and word not in stop_words]
-        
-        if search_words:
-            # Создаем условия для каждого слова
-            word_conditions = []
-            for word in search_words:
-                word_conditions.append(
-                    or_(
-                        func.lower(Book.title).like(f"%{word}%"),
-                        func.lower(Book.author).like(f"%{word}%")
-                    )
-                )
-            
-            # Применяем логику ИЛИ - слово найдено в любом поле
-            search_query = select(Book).where(or_(*word_conditions))
-        else:
-            search_query = select(Book)
-            
-        search_query = search_query.order_by(Book.parsed_at.desc()).limit(50)
-        
-        result = await db.execute(search_query)
-        books = result.scalars().all()
+        # Самые релевантные, среди равных - свежие
+        books, _ = await book_search.search_books(
+            db,
+            query=q,
+            order=book_search.ORDER_RELEVANCE,
+            limit=50,
+            with_total=False,
+        )
         
         books_list = []
         for book in books:
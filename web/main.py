@@ -4,34 +4,19 @@ from fastapi.responses import HTMLResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, func, and_, or_
+from sqlalchemy import select, func, and_
 from database.config import get_db
 from models.book import Book
 from models.alert import Alert
+from services import book_search
 import os
 import logging
-import string
-import re
-from typing import List
 
 # Импорт админ-панели
 from web import admin
 
 logger = logging.getLogger(__name__)
 
-def clean_search_words(text: str) -> List[str]:
-    """
-    Очищает текст от знаков пунктуации и разбивает на слова.
-    """
-    # Заменяем запятые, точки и другие разделители на пробелы
-    text = re.sub(r'[,\.\!\?\:\;\-\—\(\)\[\]\{\}<>]', ' ', text)
-    # Разбиваем на слова и очищаем каждый
-    words = text.lower().split()
-    # Удаляем оставшиеся знаки пунктуации из слов
-    cleaned_words = [word.strip(string.punctuation) for word in words]
-    # Убираем пустые строки
-    return [word for word in cleaned_words if word.strip()]
-
 # Создаем роутер
 router = APIRouter()
 
@@ -122,33 +107,14 @@ async def search_books(
 ):
     """Поиск книг по названию"""
     try:
-        # Улучшенный поиск: разбиваем запрос на слова и очищаем от пунктуации
-        search_words = clean_search_words(q)
-        
-        # Фильтруем предлоги и союзы
-        stop_words = {"и", "в", "на", "с", "от", "до", "по", "о", "об", "а", "но", "или"}
-        search_words = [word for word in search_words if word.strip() and word not in stop_words]
-        
-        if search_words:
-            # Создаем условия для каждого слова
-            word_conditions = []
-            for word in search_words:
-                word_conditions.append(
-                    or_(
-                        func.lower(Book.title).like(f"%{word}%"),
-                        func.lower(Book.author).like(f"%{word}%")
-                    )
-                )
-            
-            # Применяем логику ИЛИ - слово найдено в любом поле
-            query = select(Book).where(or_(*word_conditions))
-        else:
-            query = select(Book)
-            
-        query = query.order_by(Book.parsed_at.desc()).limit(50)
-        
-        result = await db.execute(query)
-        books = result.scalars().all()
+        # Самые релевантные книги (services/book_search.py)
+        books, _ = await book_search.search_books(
+            db,
+            query=q,
+            order=book_search.ORDER_RELEVANCE,
+            limit=50,
+            with_total=False,
+        )
         
         return templates.TemplateResponse(
             "books/search.html", 